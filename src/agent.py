@@ -1,24 +1,69 @@
 import asyncio
 import logging
+import math
+import os
+import time
 import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
 from datetime import datetime
+import httpx
 from dotenv import load_dotenv
-from livekit.agents import metrics, cli, Agent, AgentSession, JobContext, JobProcess, RoomInputOptions, RoomOutputOptions, WorkerOptions, ConversationItemAddedEvent, function_tool, RunContext
+from openai import AsyncClient as OpenAIClient
+from livekit.agents import metrics, cli, llm, tts, Plugin, Agent, ModelSettings, AgentSession, JobContext, JobProcess, RoomInputOptions, RoomOutputOptions, WorkerOptions, ConversationItemAddedEvent, function_tool, RunContext
 from livekit.agents.voice import MetricsCollectedEvent
 from livekit.agents.llm import ImageContent, AudioContent
 from livekit.plugins import elevenlabs, openai, google, silero, noise_cancellation
 from livekit.plugins.turn_detector.multilingual import MultilingualModel
-from decrypt import decrypt_system_prompt
-from transcription_manager import TranscriptionManager
-from report_generator import ReportGenerator
+from decrypt import get_system_prompt
+from transcription_manager import TranscriptionManager, conversation_from_entries
+from report_generator import REPORT_MODEL, ReportGenerator, build_report_llm
+from provider_router import HedgedLLM, HedgedSTT
 from s3_handler import S3Handler
+from audio_recorder import AUDIO_RECORDING, AudioRecorder
+from loop_watchdog import InterviewProfile
+from prompt_store import get_prompt_store
+from completion_pipeline import CompletionPipeline, PipelineResult, Stage
+from completion_outbox import CompletionOutbox, OutboxDrainer, OutboxJob
+from transcript_journal import TranscriptJournal, start_recovery_thread
+from transcript_compactor import compact_transcript, download_encoding, tokenizer_name
+from incremental_report import IncrementalReportBuilder
+from conversation_queue import ConversationItemQueue
+from context_compactor import ContextCompactor
+from phrase_audio import get_phrase_audio_cache
+from voice_metrics import METRICS_DIR, METRICS_PORT, SessionLatencyRecorder, get_voice_metrics, set_completion_backlog
+from worker_load import IDLE_PROCESSES_INITIAL, LOAD_THRESHOLD, EventLoopLagProbe, ServerEnvOption, WorkerLoadMonitor
 logger = logging.getLogger("agent")
 load_dotenv(".env.local")
 
+INCREMENTAL_REPORT = os.getenv("INCREMENTAL_REPORT", "1") == "1"
+SHARDED_REPORT = os.getenv("SHARDED_REPORT", "1") == "1"
+CONTEXT_COMPACTION = os.getenv("CONTEXT_COMPACTION", "1") == "1"
+COMPLETION_OUTBOX = os.getenv("COMPLETION_OUTBOX", "1") == "1"
+COMPLETION_JOB = "interview_completion"
+REPORT_STAGE_TIMEOUT = 180.0
+UPLOAD_STAGE_TIMEOUT = 60.0
+COMPLETION_HANDOFF_S = UPLOAD_STAGE_TIMEOUT + 30.0 # a job process that died handing off leaves its completion to the drainer after this
+INTERVIEW_COMPLETE = object() # conversation queue marker enqueued by the end_interview tool
+LLM_MODEL = "gemini-2.0-flash"
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "gpt-4o-mini")  # another provider, hedged against Gemini
+STT_MODEL = "whisper-1"
+STT_FALLBACK_MODEL = os.getenv("STT_FALLBACK_MODEL", "gpt-4o-mini-transcribe")
+TTS_MODEL = "eleven_multilingual_v2"
+TTS_FALLBACK_MODEL = "gpt-4o-mini-tts"
+TTS_FALLBACK_VOICE = "coral"
+TTS_VOICE_ID = "ODq5zmih8GrVes37Dizd"
+CLOSING_LINE = "Com isso vou encerrar a entrevista. Muito obrigado pela sua participação! Você já pode encerrar a chamada."
+FIXED_PHRASES = (CLOSING_LINE,) # played from the phrase audio cache instead of live TTS
+OPENAI_KEEPALIVE_S = 120.0
+WARMUP_TIMEOUT = 10.0
+
 class Assistant(Agent):
-    def __init__(self, transcription_manager: TranscriptionManager) -> None:
-        super().__init__(instructions=decrypt_system_prompt())
+    def __init__(self, transcription_manager: TranscriptionManager, context_compactor: Optional[ContextCompactor] = None,
+                 instructions: Optional[str] = None) -> None:
+        super().__init__(instructions=instructions if instructions is not None else get_system_prompt())
         self.transcription_manager = transcription_manager
+        self.context_compactor = context_compactor
+        self.conversation_queue: Optional[ConversationItemQueue] = None
         self.interview_completed = False
     
     async def add_message(self, role, message):
@@ -28,6 +73,13 @@ class Assistant(Agent):
         else:
             await self.transcription_manager.add_user_message(message)
 
+    async def llm_node(self, chat_ctx: llm.ChatContext, tools: list, model_settings: ModelSettings):
+        """Send the compacted context to the LLM; the session keeps the full history"""
+        if self.context_compactor is not None:
+            chat_ctx = self.context_compactor.compact(chat_ctx)
+        async for chunk in Agent.default.llm_node(self, chat_ctx, tools, model_settings):
+            yield chunk
+
     async def mark_interview_complete(self):
         """Mark the interview as completed"""
         self.interview_completed = True
@@ -40,29 +92,259 @@ class Assistant(Agent):
         Use this function when all required information has been obtained, or when the user requests to end the interview.
         This function will stop the recording, generate the report, and upload it to S3.
         """
-        await self.mark_interview_complete()
+        if self.conversation_queue is not None:
+            await self.conversation_queue.put(INTERVIEW_COMPLETE) # completes after every earlier item is transcribed
+        else:
+            await self.mark_interview_complete()
+
+async def run_interview_completion(payload: Dict[str, Any], done: Dict[str, Any],
+                                   checkpoint: Callable[[Dict[str, Any]], Awaitable[None]],
+                                   report_generator: Optional[ReportGenerator] = None, s3_handler: Optional[S3Handler] = None) -> PipelineResult:
+    """Generate and upload everything for a finished interview. Stages already recorded in `done` are skipped,
+    so a retried outbox job resumes where the last attempt stopped. Raises if any stage failed"""
+    interview_id, timestamp = payload["interview_id"], payload["timestamp"]
+    release = await get_prompt_store().pinned(payload.get("prompt_release")) # the schema the session started with
+    report_generator = (report_generator or ReportGenerator()).for_assets(release.assets)
+    s3_handler = s3_handler or S3Handler()
+    profile = InterviewProfile(interview_id, kind="completion")
+
+    def resumable(name: str, run: Callable[[Dict[str, Any]], Awaitable[Any]]):
+        async def stage(inputs: Dict[str, Any]):
+            if name in done:
+                return done[name]
+            value = await profile.wrap(name, run)(inputs)
+            await checkpoint({name: value})
+            return value
+        return stage
+
+    async def upload_transcription(_):
+        if payload.get("transcript_manifest"): # the sealed journal is the transcript; its chunks are already in S3
+            return payload["transcript_manifest"]
+        if payload.get("transcript_spool") and not payload.get("full_transcription"):
+            sealed = await TranscriptJournal.seal_spool(s3_handler, payload["transcript_spool"], timestamp=timestamp)
+            if sealed is None:
+                raise RuntimeError(f"Transcript journal {payload['transcript_spool']} is still held by its writer")
+            return sealed[0]
+        transcription_key = await s3_handler.upload_transcription(interview_id, payload["full_transcription"], timestamp=timestamp)
+        if not transcription_key:
+            raise RuntimeError("Failed to upload transcription to S3")
+        logger.info(f"Transcription uploaded to S3: {transcription_key}")
+        return transcription_key
+
+    async def generate_report(_):
+        conversation = payload.get("conversation_only")
+        if conversation is None: # recovered from a journal the job process never sealed: read it back
+            journal = await TranscriptJournal.read(s3_handler, payload["transcript_manifest"])
+            if journal is None:
+                raise RuntimeError("Failed to read the transcript journal back from S3")
+            conversation = conversation_from_entries(journal[1]) or "No conversation available."
+        compacted = await asyncio.to_thread(compact_transcript, conversation)
+        logger.info(f"Report transcript for {interview_id}: {compacted.tokens_before} -> {compacted.tokens_after} tokens "
+                    f"({compacted.tokens_saved} saved, {compacted.tokenizer})")
+        transcript_tokens = get_voice_metrics().report_transcript_tokens
+        transcript_tokens.labels(stage="raw").inc(compacted.tokens_before)
+        transcript_tokens.labels(stage="compacted").inc(compacted.tokens_after)
+        conversation = compacted.text
+        report_data = None
+        if payload.get("incremental"):
+            logger.info("Merging incremental area extractions...")
+            builder = IncrementalReportBuilder.from_snapshot(report_generator, interview_id, payload["incremental"])
+            report_data = await builder.finalize()
+            if report_data and not await report_generator.repair_report(report_data, conversation):
+                report_data = None
+        if not report_data:
+            report_data = await report_generator.generate_transcript_report(conversation, interview_id, sharded=SHARDED_REPORT)
+        if not report_data:
+            raise RuntimeError("Failed to generate report")
+        report_data.setdefault("metadata", {}).update(prompt_release=release.version, schema_version=release.assets.version,
+                                                      transcript_tokens=compacted.summary())
+        return report_data
+
+    async def upload_report(inputs):
+        report_key = await s3_handler.upload_report(interview_id, inputs["generate_report"], timestamp=timestamp,
+                                                    schema_version=release.assets.version)
+        if not report_key:
+            raise RuntimeError("Failed to upload report to S3")
+        logger.info(f"Report uploaded to S3: {report_key}")
+        return report_key
+
+    async def upload_latency_profile(_):
+        if payload.get("latency_profile") is None: # recovered interviews have none
+            return None
+        profile_key = await s3_handler.upload_latency_profile(interview_id, payload["latency_profile"], timestamp=timestamp)
+        if not profile_key:
+            raise RuntimeError("Failed to upload latency profile to S3")
+        return profile_key
+
+    async def upload_index(inputs):
+        artifacts = {"transcription": inputs["upload_transcription"], "report": inputs["upload_report"],
+                     "latency_profile": inputs["upload_latency_profile"], **payload.get("audio", {})}
+        artifacts = {name: key for name, key in artifacts.items() if key}
+        index_key = await s3_handler.upload_index(interview_id, timestamp, artifacts)
+        if not index_key:
+            raise RuntimeError("Failed to upload interview index to S3")
+        return index_key
+
+    logger.info(f"Processing interview completion for {interview_id} (already done: {sorted(done)})")
+    pipeline = CompletionPipeline([
+        Stage("upload_transcription", resumable("upload_transcription", upload_transcription), timeout=UPLOAD_STAGE_TIMEOUT),
+        Stage("generate_report", resumable("generate_report", generate_report), timeout=REPORT_STAGE_TIMEOUT),
+        Stage("upload_report", resumable("upload_report", upload_report), depends_on=("generate_report",), timeout=UPLOAD_STAGE_TIMEOUT),
+        Stage("upload_latency_profile", resumable("upload_latency_profile", upload_latency_profile), timeout=UPLOAD_STAGE_TIMEOUT),
+        Stage("upload_index", resumable("upload_index", upload_index),
+              depends_on=("upload_transcription", "upload_report", "upload_latency_profile"), timeout=UPLOAD_STAGE_TIMEOUT),
+    ])
+    try:
+        result = await pipeline.run()
+    finally:
+        await asyncio.to_thread(profile.write)
+    logger.info(f"Completion stage timings (s): {result.timings()}")
+    failed = {name: stage.error or stage.status for name, stage in result.stages.items() if not stage.ok}
+    if failed:
+        raise RuntimeError(f"Completion stages failed for {interview_id}: {failed}")
+    return result
+
+async def handle_completion_job(job: OutboxJob, checkpoint: Callable[[Dict[str, Any]], Awaitable[None]]):
+    await run_interview_completion(job.payload, job.checkpoint, checkpoint)
+
+_completion_drainer: Optional[OutboxDrainer] = None
+
+def get_completion_drainer() -> OutboxDrainer:
+    """This process's drainer of the worker-wide completion outbox"""
+    global _completion_drainer
+    if _completion_drainer is None:
+        _completion_drainer = OutboxDrainer(CompletionOutbox(), {COMPLETION_JOB: handle_completion_job},
+                                            on_backlog=lambda count: set_completion_backlog(count, REPORT_MODEL))
+    return _completion_drainer
+
+def enqueue_recovered_completion(manifest_key: str, manifest: Dict[str, Any]):
+    """Queue the completion of an interview whose job process died before handing it off. A no-op if it did hand it off"""
+    get_completion_drainer().outbox.enqueue(manifest["interview_id"], COMPLETION_JOB, {
+        "interview_id": manifest["interview_id"], "timestamp": manifest["timestamp"], "transcript_manifest": manifest_key,
+    })
+
+def start_worker_services():
+    """Background work of the worker process: the completion outbox drainer and the recovery of
+    transcript journals whose job process died before sealing them"""
+    if COMPLETION_OUTBOX:
+        get_completion_drainer().start_in_thread()
+    start_recovery_thread(S3Handler, on_recovered=enqueue_recovered_completion if COMPLETION_OUTBOX else None)
+
+def build_providers() -> Dict[str, Any]:
+    """Provider clients for one interview. Whisper and the gpt-4o report client share one keep-alive pool to OpenAI"""
+    openai_client = OpenAIClient(max_retries=0, http_client=httpx.AsyncClient(
+        timeout=httpx.Timeout(connect=15.0, read=5.0, write=5.0, pool=5.0),
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=50, keepalive_expiry=OPENAI_KEEPALIVE_S),
+    ))
+    # the voice is part of the interview, so TTS fails over to OpenAI on errors but is never hedged
+    primary_tts = elevenlabs.TTS(voice_id=TTS_VOICE_ID, model=TTS_MODEL)
+    return {
+        "openai_client": openai_client,
+        "llm": HedgedLLM([google.LLM(model=LLM_MODEL, temperature=0.3),
+                          openai.LLM(model=LLM_FALLBACK_MODEL, temperature=0.3, client=openai_client)]),
+        "compaction_llm": google.LLM(model=LLM_MODEL, temperature=0.0) if CONTEXT_COMPACTION else None,
+        "stt": HedgedSTT([openai.STT(model=STT_MODEL, language="pt", client=openai_client),
+                          openai.STT(model=STT_FALLBACK_MODEL, language="pt", client=openai_client)]),
+        "tts": tts.FallbackAdapter([primary_tts, openai.TTS(model=TTS_FALLBACK_MODEL, voice=TTS_FALLBACK_VOICE, client=openai_client)]),
+        "phrase_tts": primary_tts, # the phrase cache is keyed by the ElevenLabs voice
+        "noise_cancellation": noise_cancellation.BVC(),
+        "report_generator": ReportGenerator(llm=build_report_llm(openai_client)),
+    }
+
+async def warm_connections(providers: Dict[str, Any]) -> Dict[str, float]:
+    """Open provider connections while the room connects; returns seconds per provider.
+    AgentSession prewarms the conversation LLM and TTS itself"""
+    async def timed(name: str, warm: Awaitable[Any]):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(warm, timeout=WARMUP_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Failed to warm {name} connection: {e}")
+            return name, None
+        return name, time.perf_counter() - started
+    if providers.get("compaction_llm") is not None:
+        providers["compaction_llm"].prewarm()
+    # a token-free request; Whisper and the report client share this pool
+    results = await asyncio.gather(timed("openai", providers["openai_client"].models.list()))
+    return {name: elapsed for name, elapsed in results if elapsed is not None}
 
 def prewarm(proc: JobProcess):
+    started = time.perf_counter()
     proc.userdata["vad"] = silero.VAD.load()
+    try:
+        # MultilingualModel needs the job's inference executor, so it is still built in entrypoint
+        proc.userdata["providers"] = build_providers()
+    except Exception as e:
+        logger.error(f"Failed to build provider clients during prewarm, the job will build them: {e}")
+    try:
+        S3Handler().warm_connection() # boto3 is synchronous, so its pool can be filled before the job loop exists
+    except Exception as e:
+        logger.warning(f"Failed to warm S3 connection: {e}")
+    # Decrypt the prompt, compile the schema and render the static report prompts once per process, before any job is assigned
+    release = get_prompt_store().active()
+    if release.system_prompt is None:
+        logger.error("Failed to decrypt system prompt during prewarm")
+    get_prompt_store().start() # later releases are loaded and validated on the watcher thread
+    logger.info(f"Report transcripts are counted with {tokenizer_name()}") # loads the BPE, or logs why it cannot
+    cached = get_phrase_audio_cache().load(TTS_VOICE_ID, TTS_MODEL, FIXED_PHRASES)
+    logger.info(f"Loaded {cached}/{len(FIXED_PHRASES)} pre-synthesized phrase(s)")
+    elapsed = time.perf_counter() - started
+    get_voice_metrics().prewarm_duration.observe(elapsed) # sizes the idle process pool, see worker_load
+    logger.info(f"Prewarm took {elapsed:.2f}s")
+
+class ReportTokenizerFiles(Plugin):
+    """Lets `download-files` fetch the report tokenizer's BPE into TIKTOKEN_CACHE_DIR along with the models"""
+
+    def __init__(self):
+        super().__init__("report tokenizer", "1", "tiktoken", logger)
+
+    def download_files(self):
+        download_encoding()
 
 async def entrypoint(ctx: JobContext):
     interview_id = f"INT-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{str(uuid.uuid4())[:8]}"
-    transcription_manager = TranscriptionManager(interview_id)
-    report_generator = ReportGenerator()
+    setup_started = time.perf_counter()
+    providers = ctx.proc.userdata.get("providers")
+    start = "warm" if providers else "cold"
+    if not providers:
+        providers = build_providers()
+    store = get_prompt_store()
+    release = store.current or await asyncio.to_thread(store.active) # pinned for the whole session
+    report_generator = providers["report_generator"].for_assets(release.assets)
     s3_handler = S3Handler()
+    journal = TranscriptJournal(interview_id, s3_handler=s3_handler)
+    transcription_manager = TranscriptionManager(interview_id, journal=journal)
+    incremental_report = IncrementalReportBuilder(report_generator, interview_id) if INCREMENTAL_REPORT else None
+    latency = SessionLatencyRecorder(interview_id, llm_model=LLM_MODEL, stt_model=STT_MODEL, tts_model=TTS_MODEL, eou_model="multilingual")
+    profile = InterviewProfile(interview_id)
+    lag_probe = EventLoopLagProbe(profile=profile)
+    recorder = AudioRecorder(interview_id, datetime.now().strftime("%Y%m%d_%H%M%S"), s3_handler) if AUDIO_RECORDING else None
+    if incremental_report:
+        transcription_manager.add_listener(incremental_report.observe)
+    setup_section = profile.begin("entrypoint")
     try:
-        ctx.log_context_fields = { "room": ctx.room.name, "interview_id": interview_id }
+        ctx.log_context_fields = { "room": ctx.room.name, "interview_id": interview_id, "prompt_release": release.version }
+        warmup = asyncio.create_task(warm_connections(providers), name="provider-warmup")
+        warmup.add_done_callback(lambda task: task.cancelled() or latency.record_warmup(task.result()))
         await transcription_manager.start_recording()
+        journal.start()
         session = AgentSession(
-            llm=google.LLM(model="gemini-2.0-flash", temperature=0.3),
-            stt=openai.STT(model="whisper-1", language="pt"),
-            tts=elevenlabs.TTS(voice_id="ODq5zmih8GrVes37Dizd", model="eleven_multilingual_v2"),
+            llm=providers["llm"],
+            stt=providers["stt"],
+            tts=providers["tts"],
             turn_detection=MultilingualModel(),
             vad=ctx.proc.userdata["vad"],
             allow_interruptions=True,
             preemptive_generation=False
         )
-        assistant = Assistant(transcription_manager)
+        context_compactor = ContextCompactor(llm=providers["compaction_llm"]) if CONTEXT_COMPACTION else None
+        assistant = Assistant(transcription_manager, context_compactor=context_compactor, instructions=release.system_prompt)
+        phrase_audio = get_phrase_audio_cache()
+        phrase_warmup = None
+        if phrase_audio.load(TTS_VOICE_ID, TTS_MODEL, FIXED_PHRASES) < len(FIXED_PHRASES):
+            # First interview on this host: synthesize the fixed lines once for every later session
+            phrase_warmup = asyncio.create_task(phrase_audio.warm(providers["phrase_tts"], TTS_VOICE_ID, TTS_MODEL, FIXED_PHRASES), name="phrase-audio-warmup")
         usage_collector = metrics.UsageCollector()
         
         @session.on("metrics_collected")
@@ -70,55 +352,96 @@ async def entrypoint(ctx: JobContext):
             try:
                 metrics.log_metrics(ev.metrics)
                 usage_collector.collect(ev.metrics)
+                latency.collect(ev.metrics)
             except Exception as e:
                 logger.warning(f"Error collecting metrics: {e}")
         
+        closing_started = False
+
+        async def handle_conversation_item(event: ConversationItemAddedEvent):
+            nonlocal closing_started
+            if event is INTERVIEW_COMPLETE:
+                await assistant.mark_interview_complete()
+                return
+            if assistant.interview_completed and not closing_started:
+                closing_started = True
+                await phrase_audio.say(session, CLOSING_LINE, TTS_VOICE_ID, TTS_MODEL)
+                await session.aclose()
+            for content in event.item.content:
+                if isinstance(content, str):
+                    if event.item.interrupted:
+                        content += " [INTERROMPIDO]"
+                    await assistant.add_message(event.item.role, content)
+                elif isinstance(content, ImageContent):
+                    logger.debug(f"Conversation image: {content.image}") # image is either a rtc.VideoFrame or URL to the image
+                elif isinstance(content, AudioContent):
+                    logger.debug(f"Conversation audio: {len(content.frame)} frame(s), transcript: {content.transcript}")
+
+        conversation_queue = ConversationItemQueue(handle_conversation_item)
+        conversation_queue.start()
+        assistant.conversation_queue = conversation_queue
+
         @session.on("conversation_item_added")
         def _on_conversation_item_added(event: ConversationItemAddedEvent):
-            async def handle_conversation_item_added():
-                try:
-                    if assistant.interview_completed:
-                        await session.say("Com isso vou encerrar a entrevista. Muito obrigado pela sua participação! Você já pode encerrar a chamada.")
-                        await session.aclose()
-                    for content in event.item.content:
-                        if isinstance(content, str):
-                            if event.item.interrupted:
-                                content += " [INTERROMPIDO]"
-                            await assistant.add_message(event.item.role, content)
-                        elif isinstance(content, ImageContent):
-                            print(f" - image: {content.image}") # image is either a rtc.VideoFrame or URL to the image
-                        elif isinstance(content, AudioContent):
-                            print(f" - audio: {content.frame}, transcript: {content.transcript}") # frame is a list[rtc.AudioFrame]
-                except Exception as e:
-                    logger.warning(f"Error handling conversation item: {e}")
-            asyncio.create_task(handle_conversation_item_added())
+            conversation_queue.submit(event)
         
         async def process_interview_completion():
-            """Process interview completion: generate report and upload to S3"""
+            """Hand the finished interview to the worker: record it in the outbox first, then let go of the journal
+            spool and finish the audio recording. The worker's drainer seals the journal and generates and uploads
+            the report; the completion only runs here when the outbox is off or cannot be written"""
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            payload = {
+                "interview_id": interview_id,
+                "timestamp": timestamp,
+                "transcript_spool": journal.path,
+                "conversation_only": await transcription_manager.get_conversation_only(),
+                "incremental": incremental_report.snapshot() if incremental_report else None,
+                "latency_profile": latency.profile(),
+                "prompt_release": release.version,
+            }
+            if incremental_report:
+                incremental_report.cancel() # unfinished areas are in the snapshot
+            logger.info(f"Latency profile: {payload['latency_profile']['stages']}")
+            enqueued = False
+            if COMPLETION_OUTBOX:
+                try:
+                    # held back until the hand-off below, so the drainer does not start before the audio is closed
+                    await asyncio.to_thread(get_completion_drainer().outbox.enqueue, interview_id, COMPLETION_JOB, payload,
+                                            COMPLETION_HANDOFF_S)
+                    enqueued = True
+                except Exception as e:
+                    logger.error(f"Failed to enqueue interview completion, running it inline: {e}", exc_info=True)
+            updates: Dict[str, Any] = {}
+            if enqueued:
+                await journal.close()
+                if journal.write_failed: # the spool is incomplete; the text in memory is not
+                    updates["full_transcription"] = await transcription_manager.get_full_transcription()
+            if recorder:
+                try:
+                    updates["audio"] = await asyncio.wait_for(recorder.aclose(), timeout=UPLOAD_STAGE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    logger.error(f"Timed out finishing the audio recording of {interview_id}")
+            if enqueued:
+                try:
+                    if not await asyncio.to_thread(get_completion_drainer().outbox.hand_off, interview_id, updates):
+                        logger.warning(f"Completion of {interview_id} started before the hand-off; its index will lack {sorted(updates)}")
+                except Exception as e:
+                    logger.error(f"Failed to hand off interview completion, the drainer takes it in {COMPLETION_HANDOFF_S:.0f}s: {e}")
+                return
             try:
-                logger.info("Processing interview completion...")
-                full_transcription = await transcription_manager.get_full_transcription()
-                conversation_only = await transcription_manager.get_conversation_only()
-                logger.info("Uploading full transcription to S3...")
-                transcription_key = await s3_handler.upload_transcription(interview_id, full_transcription)
-                if transcription_key:
-                    logger.info(f"Transcription uploaded to S3: {transcription_key}")
-                else:
-                    logger.error("Failed to upload transcription to S3")
-                logger.info("Generating structured report...")
-                report_data = await report_generator.generate_report(conversation_only, interview_id)
-                if report_data:
-                    logger.info("Uploading report to S3...")
-                    report_key = await s3_handler.upload_report(interview_id, report_data)
-                    if report_key:
-                        logger.info(f"Report uploaded to S3: {report_key}")
-                    else:
-                        logger.error("Failed to upload report to S3")
-                else:
-                    logger.error("Failed to generate report")
+                payload["transcript_manifest"] = await asyncio.wait_for(journal.seal(timestamp), timeout=UPLOAD_STAGE_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            if not payload["transcript_manifest"]: # uploaded whole instead; the spool is left for recovery
+                logger.error(f"Failed to seal transcript journal (spool: {journal.path})")
+                payload["full_transcription"] = await transcription_manager.get_full_transcription()
+            async def no_checkpoint(_):
+                pass
+            try:
+                await run_interview_completion({**payload, **updates}, {}, no_checkpoint, report_generator=report_generator, s3_handler=s3_handler)
             except Exception as e:
                 logger.error(f"Error processing interview completion: {e}", exc_info=True)
-        
+
         async def log_usage():
             try:
                 summary = usage_collector.get_summary()
@@ -127,19 +450,41 @@ async def entrypoint(ctx: JobContext):
                 logger.warning(f"Error logging usage: {e}")
         
         async def shutdown_callback():
-            await log_usage()
+            latency.session_ended()
+            await conversation_queue.drain() # every queued message must reach the transcript before it is read
             if not assistant.interview_completed:
                 await assistant.mark_interview_complete()
-            await process_interview_completion()
+            await process_interview_completion() # first: the interview is durable once it is in the outbox
+            if context_compactor:
+                await context_compactor.aclose()
+            for task in (warmup, phrase_warmup):
+                if task and not task.done():
+                    task.cancel()
+            await log_usage()
         
-        ctx.add_shutdown_callback(shutdown_callback)
+        timed_shutdown = profile.wrap("shutdown_callback", shutdown_callback)
+
+        async def shutdown_and_write_profile():
+            # one callback: livekit may run shutdown callbacks concurrently, and the probe must outlive the completion hand-off
+            try:
+                await timed_shutdown()
+            finally:
+                lag_probe.stop()
+                await asyncio.to_thread(profile.write)
+
+        ctx.add_shutdown_callback(shutdown_and_write_profile)
+        latency.session_started() # shutdown_callback is now guaranteed to balance it
+        lag_probe.start()
         await ctx.connect()
         await session.start(
             agent=assistant,
             room=ctx.room,
-            room_input_options=RoomInputOptions(noise_cancellation=noise_cancellation.BVC()),
+            room_input_options=RoomInputOptions(noise_cancellation=providers["noise_cancellation"]),
             room_output_options=RoomOutputOptions(transcription_enabled=True),
         )
+        latency.record_setup(start, time.perf_counter() - setup_started)
+        if recorder:
+            recorder.attach(session)
     except Exception as e:
         logger.error(f"Error in entrypoint: {e}", exc_info=True)
         try:
@@ -148,7 +493,23 @@ async def entrypoint(ctx: JobContext):
         except:
             pass
         raise
+    finally:
+        profile.end(setup_section)
 
 
 if __name__ == "__main__":
-    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint, prewarm_fnc=prewarm))
+    # livekit's health server on 8081 takes no extra routes; /metrics is served beside it and
+    # aggregates the job processes' samples through the multiprocess directory
+    # Admission follows the measured per-session cost instead of raw CPU; the monitor also resizes the idle pool
+    # and starts the worker's background services: the outbox drainer, which retries completions that failed
+    # or whose job process died, and the recovery of transcript journals such a process left unsealed
+    Plugin.register_plugin(ReportTokenizerFiles())
+    cli.run_app(WorkerOptions(
+        entrypoint_fnc=entrypoint,
+        prewarm_fnc=prewarm,
+        load_fnc=WorkerLoadMonitor(outbox=get_completion_drainer().outbox if COMPLETION_OUTBOX else None, on_start=start_worker_services),
+        load_threshold=ServerEnvOption(dev_default=math.inf, prod_default=LOAD_THRESHOLD),
+        num_idle_processes=ServerEnvOption(dev_default=0, prod_default=IDLE_PROCESSES_INITIAL),
+        prometheus_port=METRICS_PORT,
+        prometheus_multiproc_dir=METRICS_DIR,
+    ))
@@ -0,0 +1,264 @@
+import asyncio
+import io
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+import av
+import numpy as np
+from livekit import rtc
+from livekit.agents.voice import io as voice_io
+from s3_handler import MULTIPART_CHUNK_SIZE, S3Handler, StreamingUpload, artifact_key
+
+logger = logging.getLogger("audio_recorder")
+
+AUDIO_RECORDING = os.getenv("AUDIO_RECORDING", "true").lower() == "true"
+AUDIO_CODEC = os.getenv("AUDIO_CODEC", "opus")  # opus (Ogg) or flac
+AUDIO_PART_SIZE = MULTIPART_CHUNK_SIZE
+AUDIO_QUEUE_MAX_FRAMES = 1500  # ~30 s of 20 ms frames; beyond it frames are dropped rather than buffered
+OPUS_BITRATE = 32000
+GAP_TOLERANCE_S = 0.2  # a track whose next frame arrives later than this is padded with silence up to it
+SILENCE_BLOCK_S = 1.0
+PART_UPLOAD_TIMEOUT_S = 120.0
+TRACKS = ("user", "agent")
+
+# container format, encoder, sample rate, key extension, Content-Type
+CODECS = {
+    "opus": ("ogg", "libopus", 48000, "ogg", "audio/ogg; codecs=opus"),
+    "flac": ("flac", "flac", 16000, "flac", "audio/flac"),
+}
+
+class _PartBuffer(io.RawIOBase):
+    """Non-seekable sink for the muxer: hands every full `part_size` block to `on_part` and keeps only the remainder"""
+
+    def __init__(self, part_size: int, on_part: Callable[[bytes], None]):
+        self.part_size = part_size
+        self.on_part = on_part
+        self.buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        while len(self.buffer) >= self.part_size:
+            part = bytes(self.buffer[:self.part_size])
+            del self.buffer[:self.part_size]
+            self.on_part(part)
+        return len(data)
+
+class _TrackEncoder:
+    """Encodes one mono track onto the recording's wall-clock timeline, inserting silence where it was quiet.
+    Input of any rate and layout is resampled into a FIFO that feeds the encoder fixed-size frames"""
+
+    def __init__(self, codec: str, started_at: float, part_size: int, on_part: Callable[[bytes], None]):
+        container_format, encoder, self.rate, _, _ = CODECS[codec]
+        self.started_at = started_at
+        self.samples = 0
+        self.sink = _PartBuffer(part_size, on_part)
+        self.container = av.open(self.sink, mode="w", format=container_format)
+        self.stream = self.container.add_stream(encoder, rate=self.rate, layout="mono")
+        if encoder == "libopus":
+            self.stream.bit_rate = OPUS_BITRATE
+        self.frame_size = self.rate // 50 if encoder == "libopus" else 4096 # libopus only takes 20 ms frames
+        self.fifo = av.AudioFifo()
+        self._resampler: Optional[av.AudioResampler] = None
+        self._input_format: Optional[tuple] = None
+
+    def _push(self, frames: List[av.AudioFrame]):
+        for frame in frames:
+            frame.pts = None
+            self.samples += frame.samples
+            self.fifo.write(frame)
+        while (frame := self.fifo.read(self.frame_size)) is not None:
+            for packet in self.stream.encode(frame):
+                self.container.mux(packet)
+
+    def _flush_resampler(self):
+        if self._resampler is not None:
+            self._push(self._resampler.resample(None))
+            self._resampler, self._input_format = None, None
+
+    def pad_to(self, position_s: float):
+        missing = int((position_s - self.started_at) * self.rate) - self.samples
+        if missing <= 0:
+            return
+        self._flush_resampler()
+        block = int(SILENCE_BLOCK_S * self.rate)
+        while missing > 0:
+            count = min(missing, block)
+            silence = av.AudioFrame.from_ndarray(np.zeros((1, count), dtype=np.int16), format="s16", layout="mono")
+            silence.sample_rate = self.rate
+            self._push([silence])
+            missing -= count
+
+    def write(self, pcm: bytes, sample_rate: int, channels: int, samples_per_channel: int, arrived_at: float):
+        started_at = arrived_at - samples_per_channel / sample_rate
+        if started_at - (self.started_at + self.samples / self.rate) > GAP_TOLERANCE_S:
+            self.pad_to(started_at)
+        if self._input_format != (sample_rate, channels):
+            self._flush_resampler()
+            self._resampler = av.AudioResampler(format="s16", layout="mono", rate=self.rate)
+            self._input_format = (sample_rate, channels)
+        frame = av.AudioFrame.from_ndarray(np.frombuffer(pcm, dtype=np.int16).reshape(1, -1), format="s16",
+                                           layout="mono" if channels == 1 else "stereo")
+        frame.sample_rate = sample_rate
+        self._push(self._resampler.resample(frame))
+
+    def close(self):
+        self._flush_resampler()
+        if self.fifo.samples:
+            for packet in self.stream.encode(self.fifo.read(self.fifo.samples)): # a short last frame is allowed
+                self.container.mux(packet)
+        for packet in self.stream.encode(None):
+            self.container.mux(packet)
+        self.container.close()
+
+class _RecordedInput(voice_io.AudioInput):
+    def __init__(self, source: voice_io.AudioInput, on_frame: Callable[[rtc.AudioFrame], None]):
+        super().__init__(label="AudioRecorder", source=source)
+        self._on_frame = on_frame
+
+    async def __anext__(self) -> rtc.AudioFrame:
+        frame = await self.source.__anext__()
+        self._on_frame(frame)
+        return frame
+
+class _RecordedOutput(voice_io.AudioOutput):
+    """Pass-through sink. Agent audio is captured as the TTS pushes it, so speech cut off by an
+    interruption is recorded up to where synthesis had got, not where playback stopped"""
+
+    def __init__(self, audio_output: voice_io.AudioOutput, on_frame: Callable[[rtc.AudioFrame], None]):
+        super().__init__(label="AudioRecorder", capabilities=voice_io.AudioOutputCapabilities(pause=True),
+                         next_in_chain=audio_output, sample_rate=audio_output.sample_rate)
+        self._on_frame = on_frame
+
+    async def capture_frame(self, frame: rtc.AudioFrame):
+        await self.next_in_chain.capture_frame(frame)
+        await super().capture_frame(frame)
+        self._on_frame(frame)
+
+    def flush(self):
+        super().flush()
+        self.next_in_chain.flush()
+
+    def clear_buffer(self):
+        self.next_in_chain.clear_buffer()
+
+class AudioRecorder:
+    """Records the user and agent tracks of an interview to S3 while it runs.
+
+    The event loop only copies each frame into a bounded queue. A dedicated thread encodes both
+    tracks (Ogg/Opus or FLAC) into part-sized buffers and hands every full part to a streaming
+    multipart upload, waiting for a track's previous part before sending its next one. Memory is
+    therefore bounded by the queue and two parts per track, however long the interview runs.
+    """
+
+    def __init__(self, interview_id: str, timestamp: str, s3_handler: S3Handler, codec: str = AUDIO_CODEC,
+                 part_size: int = AUDIO_PART_SIZE, max_queued_frames: int = AUDIO_QUEUE_MAX_FRAMES):
+        if codec not in CODECS:
+            raise ValueError(f"Unsupported AUDIO_CODEC '{codec}'")
+        self.interview_id = interview_id
+        self.timestamp = timestamp
+        self.s3_handler = s3_handler
+        self.codec = codec
+        self.part_size = part_size
+        self.dropped_frames = 0
+        self.uploads: Dict[str, StreamingUpload] = {}
+        self.failed_tracks: List[str] = []
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queued_frames)
+        self._tails: Dict[str, bytes] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._started_at = 0.0
+
+    def attach(self, session):
+        """Wrap the session's audio input and output and start recording. Call after `session.start`"""
+        tracks = []
+        if session.input.audio is not None:
+            session.input.audio = _RecordedInput(session.input.audio, lambda frame: self.capture("user", frame))
+            tracks.append("user")
+        if session.output.audio is not None:
+            session.output.audio = _RecordedOutput(session.output.audio, lambda frame: self.capture("agent", frame))
+            tracks.append("agent")
+        if tracks:
+            self.start(tracks)
+
+    def start(self, tracks=TRACKS):
+        if self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._started_at = time.time()
+        _, _, _, extension, content_type = CODECS[self.codec]
+        for track in tracks:
+            key = artifact_key("audio", self.interview_id, self.timestamp, f"{track}.{extension}")
+            self.uploads[track] = StreamingUpload(self.s3_handler, key, ContentType=content_type,
+                                                  Metadata={"interview_id": self.interview_id, "upload_timestamp": self.timestamp,
+                                                            "content_type": f"{track}_audio"})
+        self._thread = threading.Thread(target=self._encode, daemon=True, name=f"audio-recorder-{self.interview_id}")
+        self._thread.start()
+
+    def capture(self, track: str, frame: rtc.AudioFrame):
+        """Called on the event loop for every frame; never blocks"""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put_nowait((track, bytes(frame.data), frame.sample_rate, frame.num_channels,
+                                    frame.samples_per_channel, time.time()))
+        except queue.Full:
+            self.dropped_frames += 1
+
+    def _encode(self):
+        pending: Dict[str, Optional["asyncio.Future"]] = {track: None for track in self.uploads}
+        def send_part(track: str, part: bytes):
+            if track in self.failed_tracks:
+                return
+            try:
+                if pending[track] is not None:
+                    pending[track].result(timeout=PART_UPLOAD_TIMEOUT_S) # one part in flight per track
+                pending[track] = asyncio.run_coroutine_threadsafe(self.uploads[track].write_part(part), self._loop)
+            except Exception as e:
+                logger.error(f"Audio part upload failed for {self.interview_id} ({track}), dropping the track: {e}")
+                self.failed_tracks.append(track)
+        encoders = {}
+        try:
+            encoders = {track: _TrackEncoder(self.codec, self._started_at, self.part_size,
+                                             lambda part, track=track: send_part(track, part)) for track in self.uploads}
+            while (item := self._queue.get()) is not None:
+                track, *frame = item
+                encoders[track].write(*frame)
+            for track, encoder in encoders.items():
+                encoder.pad_to(time.time()) # both tracks end together
+                encoder.close()
+                self._tails[track] = bytes(encoder.sink.buffer)
+        except Exception as e:
+            logger.error(f"Audio encoder failed for {self.interview_id}: {e}", exc_info=True)
+            self.failed_tracks.extend(track for track in self.uploads if track not in self._tails)
+        for track, future in pending.items():
+            if future is not None and track not in self.failed_tracks:
+                try:
+                    future.result(timeout=PART_UPLOAD_TIMEOUT_S)
+                except Exception as e:
+                    logger.error(f"Audio part upload failed for {self.interview_id} ({track}): {e}")
+                    self.failed_tracks.append(track)
+
+    async def aclose(self) -> Dict[str, str]:
+        """Stop recording, finish both uploads and return the key of each track that was stored"""
+        if self._thread is None:
+            return {}
+        await asyncio.to_thread(self._queue.put, None) # waits for room while the encoder drains a full queue
+        await asyncio.to_thread(self._thread.join)
+        self._thread = None
+        if self.dropped_frames:
+            logger.warning(f"Audio recorder for {self.interview_id} dropped {self.dropped_frames} frame(s): the encoder fell behind")
+        keys = {}
+        for track, upload in self.uploads.items():
+            if track in self.failed_tracks:
+                await upload.abort()
+                continue
+            key = await upload.complete(self._tails.get(track, b""))
+            if key:
+                keys[f"{track}_audio"] = key
+        return keys
@@ -0,0 +1,288 @@
+import asyncio
+import atexit
+import contextlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger("completion_outbox")
+
+DATA_DIR = os.getenv("AGENT_DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))  # survives restarts: a volume in production
+OUTBOX_PATH = os.getenv("COMPLETION_OUTBOX_PATH", os.path.join(DATA_DIR, "completion_outbox.sqlite3"))
+OUTBOX_JOURNAL_MODE = os.getenv("COMPLETION_OUTBOX_JOURNAL_MODE", "WAL")  # DELETE on network file systems (EFS), where WAL is unsafe
+OUTBOX_CONCURRENCY = int(os.getenv("COMPLETION_OUTBOX_CONCURRENCY", "2"))
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_LEASE_S = 120.0  # a claimed job whose drainer died becomes claimable again after this
+LEASE_RENEW_FRACTION = 0.25  # a running job's lease is renewed every lease_s * this
+OUTBOX_POLL_INTERVAL_S = 1.0
+RETRY_BASE_DELAY_S = 10.0
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    idempotency_key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_until REAL,
+    checkpoint TEXT NOT NULL DEFAULT '{}',
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+@dataclass
+class OutboxJob:
+    """A claimed unit of work. `checkpoint` holds the results of steps finished by earlier attempts"""
+    key: str
+    kind: str
+    payload: Dict[str, Any]
+    attempts: int
+    checkpoint: Dict[str, Any]
+
+class CompletionOutbox:
+    """Durable job queue in a SQLite file shared by every process of the worker.
+
+    Jobs are keyed by an idempotency key (the interview_id), so enqueueing the same interview
+    twice is a no-op. Claims are leases taken inside an IMMEDIATE transaction, which makes
+    concurrent drainers in different processes safe. Each connection is short-lived, so the
+    object can be used from any thread.
+    """
+
+    def __init__(self, path: str = OUTBOX_PATH, max_attempts: int = OUTBOX_MAX_ATTEMPTS, lease_s: float = OUTBOX_LEASE_S):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_s = lease_s
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(f"PRAGMA journal_mode={OUTBOX_JOURNAL_MODE}")
+            conn.execute(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        try:
+            conn.execute("PRAGMA synchronous=FULL")
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, key: str, kind: str, payload: Dict[str, Any], delay_s: float = 0.0) -> bool:
+        """Persist a job, due after `delay_s` (or earlier, see `hand_off`). Returns False if a job with this key already exists"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (idempotency_key, kind, payload, status, available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, json.dumps(payload, ensure_ascii=False), STATUS_PENDING, now + delay_s, now, now),
+            )
+        if cursor.rowcount == 0:
+            logger.info(f"Outbox job {key} already enqueued")
+            return False
+        logger.info(f"Enqueued {kind} job {key}")
+        return True
+
+    def hand_off(self, key: str, updates: Dict[str, Any]) -> bool:
+        """Merge `updates` into the payload of a job nobody has tried yet and make it due now. Returns False
+        if a drainer already claimed it, e.g. because the delay it was enqueued with ran out"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT payload FROM jobs WHERE idempotency_key = ? AND status = ? AND attempts = 0",
+                                   (key, STATUS_PENDING)).fetchone()
+                if row:
+                    conn.execute("UPDATE jobs SET payload = ?, available_at = ?, updated_at = ? WHERE idempotency_key = ?",
+                                 (json.dumps({**json.loads(row[0]), **updates}, ensure_ascii=False), now, now, key))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return row is not None
+
+    def claim(self, limit: int) -> List[OutboxJob]:
+        """Lease up to `limit` due jobs: pending ones, and running ones whose lease expired"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT idempotency_key, kind, payload, attempts, checkpoint FROM jobs "
+                    "WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_until < ?) ORDER BY created_at LIMIT ?",
+                    (STATUS_PENDING, now, STATUS_RUNNING, now, limit),
+                ).fetchall()
+                for key, *_ in rows:
+                    conn.execute("UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, updated_at = ? WHERE idempotency_key = ?",
+                                 (STATUS_RUNNING, now + self.lease_s, now, key))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [OutboxJob(key=key, kind=kind, payload=json.loads(payload), attempts=attempts + 1, checkpoint=json.loads(checkpoint))
+                for key, kind, payload, attempts, checkpoint in rows]
+
+    def renew(self, key: str):
+        """Extend the lease of a job that is still running"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET lease_until = ?, updated_at = ? WHERE idempotency_key = ? AND status = ?",
+                         (now + self.lease_s, now, key, STATUS_RUNNING))
+
+    def release(self, keys: List[str]):
+        """Hand running jobs back without counting the attempt, so another drainer takes them at once"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany("UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), available_at = ?, lease_until = NULL, updated_at = ? "
+                             "WHERE idempotency_key = ? AND status = ?", [(STATUS_PENDING, now, now, key, STATUS_RUNNING) for key in keys])
+        if keys:
+            logger.info(f"Released {len(keys)} outbox job(s) to other drainers: {keys}")
+
+    def save_checkpoint(self, key: str, checkpoint: Dict[str, Any]):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET checkpoint = ?, updated_at = ? WHERE idempotency_key = ?",
+                         (json.dumps(checkpoint, ensure_ascii=False), time.time(), key))
+
+    def complete(self, key: str):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, lease_until = NULL, last_error = NULL, updated_at = ? WHERE idempotency_key = ?",
+                         (STATUS_DONE, time.time(), key))
+
+    def fail(self, key: str, attempts: int, error: str):
+        """Schedule a retry with exponential backoff, or give up after max_attempts"""
+        now = time.time()
+        give_up = attempts >= self.max_attempts
+        delay = RETRY_BASE_DELAY_S * (2 ** (attempts - 1)) * (0.5 + random.random())
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, available_at = ?, lease_until = NULL, last_error = ?, updated_at = ? WHERE idempotency_key = ?",
+                         (STATUS_FAILED if give_up else STATUS_PENDING, now + delay, error, now, key))
+        if give_up:
+            logger.error(f"Outbox job {key} failed permanently after {attempts} attempt(s): {error}")
+        else:
+            logger.warning(f"Outbox job {key} failed (attempt {attempts}/{self.max_attempts}), retrying in {delay:.0f}s: {error}")
+
+    def counts(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def backlog(self) -> int:
+        counts = self.counts()
+        return counts.get(STATUS_PENDING, 0) + counts.get(STATUS_RUNNING, 0)
+
+    def status(self, key: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE idempotency_key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+JobHandler = Callable[[OutboxJob, Callable[[Dict[str, Any]], Awaitable[None]]], Awaitable[None]]
+
+class OutboxDrainer:
+    """Runs outbox jobs with bounded concurrency.
+
+    A handler receives the job and an async `checkpoint(dict)` callback; it should record each
+    finished step there and skip steps already present in `job.checkpoint`, so a retry (or a
+    different process taking over an expired lease) resumes instead of starting over. The lease
+    of a running job is renewed until it finishes, so only a dead drainer's jobs expire.
+    """
+
+    def __init__(self, outbox: CompletionOutbox, handlers: Dict[str, JobHandler], concurrency: int = OUTBOX_CONCURRENCY,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL_S, on_backlog: Optional[Callable[[int], None]] = None):
+        self.outbox = outbox
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.on_backlog = on_backlog
+        self._running: Set[asyncio.Task] = set()
+        self._claimed: Set[str] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    async def _keep_leased(self, key: str):
+        while True:
+            await asyncio.sleep(self.outbox.lease_s * LEASE_RENEW_FRACTION)
+            try:
+                await asyncio.to_thread(self.outbox.renew, key)
+            except Exception as e:
+                logger.warning(f"Failed to renew the lease of outbox job {key}: {e}")
+
+    async def _run_job(self, job: OutboxJob):
+        async def checkpoint(values: Dict[str, Any]):
+            job.checkpoint.update(values)
+            await asyncio.to_thread(self.outbox.save_checkpoint, job.key, job.checkpoint)
+        handler = self.handlers.get(job.kind)
+        self._claimed.add(job.key)
+        lease = asyncio.create_task(self._keep_leased(job.key), name=f"outbox-lease-{job.key}")
+        try:
+            if handler is None:
+                raise RuntimeError(f"No handler for outbox job kind {job.kind!r}")
+            await handler(job, checkpoint)
+        except Exception as e:
+            logger.error(f"Outbox job {job.key} raised: {e}", exc_info=True)
+            await asyncio.to_thread(self.outbox.fail, job.key, job.attempts, str(e))
+        else:
+            await asyncio.to_thread(self.outbox.complete, job.key)
+            logger.info(f"Outbox job {job.key} done (attempt {job.attempts})")
+        finally:
+            lease.cancel()
+            self._claimed.discard(job.key)
+
+    async def poll(self) -> int:
+        """Claim as many due jobs as there are free slots and start them. Returns how many were started"""
+        free = self.concurrency - len(self._running)
+        if self._stop.is_set() or free <= 0:
+            return 0
+        jobs = await asyncio.to_thread(self.outbox.claim, free)
+        for job in jobs:
+            task = asyncio.create_task(self._run_job(job), name=f"outbox-{job.key}")
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+        if self.on_backlog is not None:
+            try:
+                self.on_backlog(await asyncio.to_thread(self.outbox.backlog))
+            except Exception as e:
+                logger.debug(f"Failed to report outbox backlog: {e}")
+        return len(jobs)
+
+    async def run_until_idle(self):
+        """Drain every job that is due now (used by tests and one-off recovery)"""
+        while await self.poll() or self._running:
+            if self._running:
+                await asyncio.wait(list(self._running), return_when=asyncio.FIRST_COMPLETED)
+
+    async def run(self):
+        while not self._stop.is_set():
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"Outbox poll failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+        if self._running:
+            await asyncio.gather(*list(self._running), return_exceptions=True)
+
+    def start_in_thread(self):
+        """Drain on a daemon thread with its own event loop, independent of the process's loop.
+        Jobs still running when the process exits are handed back, see `stop`"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=lambda: asyncio.run(self.run()), name="outbox-drainer", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        """Stop claiming and release the jobs this drainer is running, so a drainer that
+        outlives this process picks them up now instead of after their lease"""
+        self._stop.set()
+        try:
+            self.outbox.release(sorted(self._claimed))
+        except Exception as e:
+            logger.error(f"Failed to release outbox jobs {sorted(self._claimed)}: {e}")
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("completion_pipeline")
+
+STAGE_OK = "ok"
+STAGE_FAILED = "failed"
+STAGE_TIMEOUT = "timeout"
+STAGE_SKIPPED = "skipped"
+
+@dataclass
+class Stage:
+    """A unit of completion work. `run` receives the values of its dependencies keyed by stage name"""
+    name: str
+    run: Callable[[Dict[str, Any]], Awaitable[Any]]
+    depends_on: Tuple[str, ...] = ()
+    timeout: Optional[float] = None
+
+@dataclass
+class StageResult:
+    """Outcome and wall-clock duration of a stage"""
+    name: str
+    status: str
+    value: Any = None
+    duration_s: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == STAGE_OK
+
+@dataclass
+class PipelineResult:
+    """Per-stage results plus the total wall-clock time of the run"""
+    stages: Dict[str, StageResult] = field(default_factory=dict)
+    duration_s: float = 0.0
+
+    def value(self, name: str) -> Any:
+        result = self.stages.get(name)
+        return result.value if result and result.ok else None
+
+    def timings(self) -> Dict[str, float]:
+        return {name: round(result.duration_s, 3) for name, result in self.stages.items()}
+
+class CompletionPipeline:
+    """Runs a DAG of stages, starting each one as soon as all of its dependencies succeed"""
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Duplicate stage names in pipeline")
+        self._order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        visiting, done = set(), set()
+        def visit(name: str):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle detected at stage '{name}'")
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage dependency '{name}'")
+            visiting.add(name)
+            for dependency in self.stages[name].depends_on:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+        for name in self.stages:
+            visit(name)
+        return order
+
+    async def _run_stage(self, stage: Stage, tasks: Dict[str, "asyncio.Task[StageResult]"]) -> StageResult:
+        dependencies = [await tasks[name] for name in stage.depends_on]
+        failed = [result.name for result in dependencies if not result.ok]
+        if failed:
+            return StageResult(stage.name, STAGE_SKIPPED, error=f"dependencies not satisfied: {', '.join(failed)}")
+        inputs = {result.name: result.value for result in dependencies}
+        started = time.perf_counter()
+        try:
+            value = await asyncio.wait_for(stage.run(inputs), timeout=stage.timeout)
+            return StageResult(stage.name, STAGE_OK, value=value, duration_s=time.perf_counter() - started)
+        except asyncio.TimeoutError:
+            logger.error(f"Stage '{stage.name}' timed out after {stage.timeout}s")
+            return StageResult(stage.name, STAGE_TIMEOUT, duration_s=time.perf_counter() - started, error=f"timed out after {stage.timeout}s")
+        except Exception as e:
+            logger.error(f"Stage '{stage.name}' failed: {e}", exc_info=True)
+            return StageResult(stage.name, STAGE_FAILED, duration_s=time.perf_counter() - started, error=str(e))
+
+    async def run(self) -> PipelineResult:
+        """Execute every stage, running independent branches concurrently"""
+        started = time.perf_counter()
+        tasks: Dict[str, "asyncio.Task[StageResult]"] = {}
+        for name in self._order:
+            tasks[name] = asyncio.create_task(self._run_stage(self.stages[name], tasks))
+        results = await asyncio.gather(*tasks.values())
+        pipeline_result = PipelineResult(stages={result.name: result for result in results}, duration_s=time.perf_counter() - started)
+        summary = ", ".join(f"{r.name}={r.status}/{r.duration_s * 1000:.0f}ms" for r in results)
+        logger.info(f"Completion pipeline finished in {pipeline_result.duration_s * 1000:.0f}ms: {summary}")
+        return pipeline_result
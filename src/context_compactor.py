@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Set
+from livekit.agents.llm import ChatContext, ChatMessage
+from incremental_report import detect_area
+
+logger = logging.getLogger("context_compactor")
+
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "8"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+SUMMARY_BATCH_TURNS = 4  # do not call the summarizer for fewer evicted turns than this
+MIN_RECENT_TURNS = 2
+CHARS_PER_TOKEN = 4
+GENERAL_AREA = "Geral"
+
+FACTS_HEADER = "FATOS JÁ COLETADOS NESTA ENTREVISTA (resumo dos turnos anteriores; não repita essas perguntas):"
+
+SUMMARY_SYSTEM_PROMPT = "Você resume entrevistas de diagnóstico de startups em fatos curtos e objetivos, em português."
+
+SUMMARY_PROMPT_TEMPLATE = """Área: {area}
+
+Fatos já registrados:
+{facts}
+
+Novos trechos da entrevista:
+{turns}
+
+Reescreva a lista de fatos da área incorporando os novos trechos. Use no máximo 8 tópicos iniciados por "- ", com números, ferramentas e processos citados, e inclua as perguntas já feitas que ficaram sem resposta. Retorne apenas a lista."""
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def _is_turn(item) -> bool:
+    return item.type == "message" and item.role in ("user", "assistant")
+
+def _item_tokens(item) -> int:
+    return estimate_tokens(item.text_content or "") if item.type == "message" else estimate_tokens(str(getattr(item, "arguments", "") or getattr(item, "output", "")))
+
+class ContextCompactor:
+    """Caps the live LLM prompt for long interviews.
+
+    `compact` is called with the chat context right before each LLM request. The last
+    `keep_turns` user/assistant messages are kept verbatim; older ones are replaced by a
+    per-area "facts so far" block. Summaries are produced in the background, so a turn that
+    was just evicted stays verbatim until its summary lands, unless the token budget says
+    otherwise, in which case the oldest verbatim turns are dropped first.
+    """
+
+    def __init__(self, llm=None, keep_turns: int = CONTEXT_KEEP_TURNS, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 batch_turns: int = SUMMARY_BATCH_TURNS):
+        self.llm = llm
+        self.keep_turns = keep_turns
+        self.token_budget = token_budget
+        self.batch_turns = batch_turns
+        self.facts: Dict[str, str] = {}
+        self._summarized: Set[str] = set()
+        self._in_flight: Set[str] = set()
+        self._area = GENERAL_AREA
+        self._task: Optional[asyncio.Task] = None
+        self.summaries = 0
+
+    def facts_block(self) -> Optional[str]:
+        if not self.facts:
+            return None
+        return FACTS_HEADER + "".join(f"\n\n[{area}]\n{facts}" for area, facts in self.facts.items())
+
+    def compact(self, chat_ctx: ChatContext) -> ChatContext:
+        """Return a copy of chat_ctx that fits the budget; the session's own history is not modified"""
+        items = chat_ctx.items
+        turn_positions = [i for i, item in enumerate(items) if _is_turn(item)]
+        if len(turn_positions) <= self.keep_turns:
+            return chat_ctx
+        cut = turn_positions[-self.keep_turns]
+        # leading instructions stay; old function calls go with the turns that caused them
+        head = [item for item in items[:cut] if item.type == "message" and item.role in ("system", "developer")]
+        evicted = [item for item in items[:cut] if _is_turn(item) and item.id not in self._summarized]
+        recent = items[cut:]
+        self._schedule([item for item in evicted if item.id not in self._in_flight])
+
+        facts = self.facts_block()
+        facts_items = [ChatMessage(role="system", content=[facts])] if facts else []
+        fixed_tokens = sum(_item_tokens(item) for item in head + facts_items)
+        recent_tokens = [_item_tokens(item) for item in recent]
+        evicted_tokens = [_item_tokens(item) for item in evicted]
+        while evicted and fixed_tokens + sum(evicted_tokens) + sum(recent_tokens) > self.token_budget:
+            evicted.pop(0)
+            evicted_tokens.pop(0)
+        while sum(1 for item in recent if _is_turn(item)) > MIN_RECENT_TURNS and fixed_tokens + sum(recent_tokens) > self.token_budget:
+            recent.pop(0)
+            recent_tokens.pop(0)
+        while recent and recent[0].type in ("function_call", "function_call_output"):
+            recent.pop(0)
+            recent_tokens.pop(0)
+
+        compacted = chat_ctx.copy()
+        compacted.items = head + facts_items + evicted + recent
+        logger.debug(f"Compacted context: {len(items)} -> {len(compacted.items)} items (~{fixed_tokens + sum(evicted_tokens) + sum(recent_tokens)} tokens)")
+        return compacted
+
+    def _schedule(self, candidates: List[ChatMessage]):
+        if self.llm is None or not candidates or len(candidates) < self.batch_turns:
+            return
+        if self._task is not None and not self._task.done():
+            return # the next compact call picks these up once the running summary lands
+        self._in_flight.update(item.id for item in candidates)
+        self._task = asyncio.create_task(self._summarize(candidates), name="context-summary")
+
+    def _group_by_area(self, messages: List[ChatMessage]) -> Dict[str, List[str]]:
+        """Split turns by interview area, following the interviewer's questions (answers inherit the area)"""
+        groups: Dict[str, List[str]] = {}
+        for message in messages:
+            text = message.text_content or ""
+            if message.role == "assistant":
+                self._area = detect_area(text) or self._area
+            speaker = "Entrevistador" if message.role == "assistant" else "Entrevistado"
+            groups.setdefault(self._area, []).append(f"{speaker}: {text}")
+        return groups
+
+    async def _summarize(self, messages: List[ChatMessage]):
+        area_before = self._area
+        groups = self._group_by_area(messages)
+        try:
+            results = await asyncio.gather(*(self._summarize_area(area, turns) for area, turns in groups.items()))
+        except Exception as e:
+            self._area = area_before
+            logger.warning(f"Context summary failed; keeping {len(messages)} turn(s) verbatim: {e}")
+        else:
+            for area, facts in zip(groups, results):
+                if facts:
+                    self.facts[area] = facts
+            self._summarized.update(item.id for item in messages)
+            self.summaries += 1
+            logger.info(f"Summarized {len(messages)} older turn(s) into facts for {', '.join(groups)}")
+        finally:
+            self._in_flight.difference_update(item.id for item in messages)
+
+    async def _summarize_area(self, area: str, turns: List[str]) -> str:
+        chat_ctx = ChatContext()
+        chat_ctx.add_message(role="system", content=SUMMARY_SYSTEM_PROMPT)
+        chat_ctx.add_message(role="user", content=SUMMARY_PROMPT_TEMPLATE.format(area=area, facts=self.facts.get(area, "(nenhum)"), turns="\n".join(turns)))
+        parts = []
+        async with self.llm.chat(chat_ctx=chat_ctx) as stream:
+            async for chunk in stream:
+                if chunk.delta and chunk.delta.content:
+                    parts.append(chunk.delta.content)
+        return "".join(parts).strip()
+
+    async def aclose(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
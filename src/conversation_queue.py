@@ -0,0 +1,89 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Optional
+
+logger = logging.getLogger("conversation_queue")
+
+QUEUE_MAXSIZE = 64
+DRAIN_TIMEOUT = 10.0
+
+class ConversationItemQueue:
+    """Ordered, bounded queue with a single consumer task per session.
+
+    Async producers get backpressure from `put`. Synchronous event emitters (LiveKit's
+    `session.on` callbacks) cannot block, so `submit` spills into an ordered overflow
+    buffer when the queue is full; the consumer refills from it before taking new items,
+    which preserves arrival order either way.
+    """
+
+    def __init__(self, handler: Callable[[Any], Awaitable[None]], maxsize: int = QUEUE_MAXSIZE, name: str = "conversation"):
+        self._handler = handler
+        self._queue: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=maxsize)
+        self._overflow: Deque[Any] = deque()
+        self._consumer: Optional[asyncio.Task] = None
+        self._closed = False
+        self.name = name
+        self.processed = 0
+        self.max_overflow = 0
+
+    def start(self):
+        if self._consumer is None:
+            self._consumer = asyncio.create_task(self._consume(), name=f"{self.name}-queue-consumer")
+
+    def __len__(self) -> int:
+        return self._queue.qsize() + len(self._overflow)
+
+    def submit(self, item: Any):
+        """Enqueue from synchronous code without blocking"""
+        if self._closed:
+            logger.debug(f"Dropping item submitted to closed {self.name} queue")
+            return
+        if not self._overflow:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except asyncio.QueueFull:
+                logger.warning(f"{self.name} queue full ({self._queue.maxsize}); consumer is falling behind")
+        self._overflow.append(item)
+        self.max_overflow = max(self.max_overflow, len(self._overflow))
+
+    async def put(self, item: Any):
+        """Enqueue from async code, waiting while the queue is full"""
+        if self._closed or self._overflow:
+            self.submit(item)
+        else:
+            await self._queue.put(item)
+
+    def _refill(self):
+        while self._overflow and not self._queue.full():
+            self._queue.put_nowait(self._overflow.popleft())
+
+    async def _consume(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._handler(item)
+            except Exception as e:
+                logger.warning(f"Error handling {self.name} item: {e}")
+            finally:
+                self.processed += 1
+                self._refill() # before task_done, so join() cannot return while overflow items remain
+                self._queue.task_done()
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT) -> bool:
+        """Stop accepting items, wait until everything queued so far is handled, then stop the consumer"""
+        self._closed = True
+        drained = True
+        if self._consumer is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                drained = False
+                logger.error(f"Timed out draining {self.name} queue with {len(self)} item(s) pending")
+            self._consumer.cancel()
+            try:
+                await self._consumer
+            except asyncio.CancelledError:
+                pass
+        return drained
@@ -1,67 +1,124 @@
 import base64
+import hashlib
+import logging
+import os
+import threading
+from typing import Dict, Optional, Tuple
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.backends import default_backend
 from dotenv import load_dotenv
-import os
 
-def decrypt_system_prompt():
+logger = logging.getLogger("decrypt")
+
+HEADER_MAGIC = "S2SPROMPT"
+HEADER_VERSION = 1
+KDF_PBKDF2_SHA256 = "pbkdf2-sha256"
+KDF_EVP_MD5 = "evp-md5"
+PBKDF2_ITERATIONS = 10000
+DEFAULT_ENCRYPTED_FILE = "system_prompt_encrypted.txt"
+
+_prompt_cache: Dict[str, str] = {}
+_prompt_cache_lock = threading.Lock()
+
+def format_header(kdf: str = KDF_PBKDF2_SHA256, iterations: int = PBKDF2_ITERATIONS) -> str:
+    """Build the versioned header line that names the KDF used for the ciphertext"""
+    return f"{HEADER_MAGIC}/{HEADER_VERSION} kdf={kdf} iter={iterations}"
+
+def parse_encrypted_prompt(encrypted_data: str) -> Tuple[Optional[str], int, str]:
+    """Split encrypted file contents into (kdf, iterations, base64 payload). kdf is None for legacy headerless files"""
+    first_line, _, rest = encrypted_data.partition("\n")
+    if not first_line.startswith(f"{HEADER_MAGIC}/"):
+        return None, PBKDF2_ITERATIONS, encrypted_data.strip()
+    magic, *fields = first_line.split()
+    version = int(magic.split("/", 1)[1])
+    if version != HEADER_VERSION:
+        raise ValueError(f"Unsupported encrypted prompt version: {version}")
+    params = dict(field.split("=", 1) for field in fields)
+    return params["kdf"], int(params.get("iter", PBKDF2_ITERATIONS)), rest.strip()
+
+def _derive_evp_md5(password: bytes, salt: bytes, key_len: int = 32, iv_len: int = 16) -> Tuple[bytes, bytes]:
+    """OpenSSL EVP_BytesToKey with MD5 (legacy `openssl enc` default)"""
+    d = d_i = b''
+    while len(d) < (key_len + iv_len):
+        d_i = hashlib.md5(d_i + password + salt).digest()
+        d += d_i
+    return d[:key_len], d[key_len:key_len+iv_len]
+
+def _derive_pbkdf2(password: bytes, salt: bytes, iterations: int) -> Tuple[bytes, bytes]:
+    key_iv = hashlib.pbkdf2_hmac('sha256', password, salt, iterations, 48)  # 32 + 16
+    return key_iv[:32], key_iv[32:48]
+
+def _decrypt_with_kdf(encrypted_bytes: bytes, password: bytes, kdf: str, iterations: int) -> str:
+    """Decrypt an OpenSSL-style "Salted__" AES-256-CBC payload with the given KDF"""
+    if not encrypted_bytes.startswith(b"Salted__"):
+        raise ValueError("Missing 'Salted__' prefix")
+    salt = encrypted_bytes[8:16]
+    encrypted_content = encrypted_bytes[16:]
+    if kdf == KDF_PBKDF2_SHA256:
+        key, iv = _derive_pbkdf2(password, salt, iterations)
+    elif kdf == KDF_EVP_MD5:
+        key, iv = _derive_evp_md5(password, salt)
+    else:
+        raise ValueError(f"Unknown KDF: {kdf}")
+    cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
+    decryptor = cipher.decryptor()
+    decrypted_padded = decryptor.update(encrypted_content) + decryptor.finalize()
+    padding_length = decrypted_padded[-1]
+    if not 0 < padding_length <= 16:
+        raise ValueError("Invalid padding")
+    return decrypted_padded[:-padding_length].decode('utf-8')
+
+def decrypt_system_prompt(encrypted_file: str = DEFAULT_ENCRYPTED_FILE) -> Optional[str]:
+    """Read and decrypt the system prompt file (uncached). Returns None on failure"""
+    with open(encrypted_file, "r", encoding='utf-8') as f:
+        return decrypt_prompt_text(f.read())
+
+def decrypt_prompt_text(encrypted_data: str) -> Optional[str]:
+    """Decrypt the contents of an encrypted prompt file with ENCRYPTION_KEY. Returns None on failure"""
     load_dotenv(".env.local")
     encryption_key = os.getenv("ENCRYPTION_KEY")
     if not encryption_key:
         raise ValueError("ENCRYPTION_KEY not found in environment variables")
-    with open("system_prompt_encrypted.txt", "r", encoding='utf-8') as f:
-        encrypted_data = f.read().strip()
+    encrypted_data = encrypted_data.strip()
     try:
-        try:
-            key_str = encryption_key.replace("-", "")
-            key_bytes = bytes.fromhex(key_str[:64])
-            if len(key_bytes) < 32:
-                key_bytes = key_bytes.ljust(32, b'\x00')
-            encrypted_bytes = base64.b64decode(encrypted_data)
-            if encrypted_bytes.startswith(b"Salted__"):
-                salt = encrypted_bytes[8:16]
-                encrypted_content = encrypted_bytes[16:]
-                import hashlib
-                def derive_key_iv(password, salt, key_len=32, iv_len=16):
-                    d = d_i = b''
-                    while len(d) < (key_len + iv_len):
-                        d_i = hashlib.md5(d_i + password + salt).digest()
-                        d += d_i
-                    return d[:key_len], d[key_len:key_len+iv_len]
-                key, iv = derive_key_iv(encryption_key.encode('utf-8'), salt)
-                cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-                decryptor = cipher.decryptor()
-                decrypted_padded = decryptor.update(encrypted_content) + decryptor.finalize()
-                padding_length = decrypted_padded[-1]
-                if padding_length <= 16:
-                    decrypted_text = decrypted_padded[:-padding_length].decode('utf-8')
-                    return decrypted_text
-        except Exception as e1:
-            print(f"Approach 1 failed: {e1}")
-        try:
-            password = encryption_key.encode('utf-8')
-            encrypted_bytes = base64.b64decode(encrypted_data)
-            if encrypted_bytes.startswith(b"Salted__"):
-                salt = encrypted_bytes[8:16]
-                encrypted_content = encrypted_bytes[16:]
-                import hashlib
-                key_iv = hashlib.pbkdf2_hmac('sha256', password, salt, 10000, 48)  # 32 + 16
-                key = key_iv[:32]
-                iv = key_iv[32:48]
-                cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-                decryptor = cipher.decryptor()
-                decrypted_padded = decryptor.update(encrypted_content) + decryptor.finalize()
-                padding_length = decrypted_padded[-1]
-                if padding_length <= 16:
-                    decrypted_text = decrypted_padded[:-padding_length].decode('utf-8')
-                    return decrypted_text
-        except Exception as e2:
-            print(f"Approach 2 failed: {e2}")
+        kdf, iterations, payload = parse_encrypted_prompt(encrypted_data)
+        encrypted_bytes = base64.b64decode(payload)
+        password = encryption_key.encode('utf-8')
+        if kdf is not None:
+            return _decrypt_with_kdf(encrypted_bytes, password, kdf, iterations)
+        for legacy_kdf in (KDF_EVP_MD5, KDF_PBKDF2_SHA256): # Headerless files predate the header, so probe both schemes
+            try:
+                decrypted_text = _decrypt_with_kdf(encrypted_bytes, password, legacy_kdf, iterations)
+                logger.info(f"Decrypted legacy headerless prompt with {legacy_kdf}; re-run encrypt.py to add a KDF header")
+                return decrypted_text
+            except Exception as e:
+                logger.debug(f"Legacy decryption with {legacy_kdf} failed: {e}")
         raise ValueError("All decryption approaches failed")
     except Exception as e:
-        print(f"Decryption failed: {e}")
+        logger.error(f"Decryption failed: {e}")
         return None
 
+def load_system_prompt(encrypted_file: str = DEFAULT_ENCRYPTED_FILE) -> Optional[str]:
+    """Decrypt the system prompt once per process and cache it (called from prewarm)"""
+    cache_key = os.path.abspath(encrypted_file)
+    with _prompt_cache_lock:
+        if cache_key not in _prompt_cache:
+            prompt = decrypt_system_prompt(encrypted_file)
+            if prompt is None:
+                return None
+            _prompt_cache[cache_key] = prompt
+        return _prompt_cache[cache_key]
+
+def get_system_prompt(encrypted_file: str = DEFAULT_ENCRYPTED_FILE) -> Optional[str]:
+    """Return the cached system prompt, decrypting it on first use if prewarm did not run"""
+    prompt = _prompt_cache.get(os.path.abspath(encrypted_file))
+    return prompt if prompt is not None else load_system_prompt(encrypted_file)
+
+def clear_system_prompt_cache():
+    """Drop cached prompts, forcing the next lookup to decrypt again"""
+    with _prompt_cache_lock:
+        _prompt_cache.clear()
+
 if __name__ == "__main__":
     decrypted_prompt = decrypt_system_prompt()
     if decrypted_prompt:
@@ -3,12 +3,14 @@ import os
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.backends import default_backend
 from dotenv import load_dotenv
+from decrypt import KDF_PBKDF2_SHA256, PBKDF2_ITERATIONS, format_header
 import hashlib
 
 def encrypt_system_prompt(input_file="system_prompt.txt", output_file="system_prompt_encrypted.txt"):
     """
     Encrypt a system prompt file using AES encryption with OpenSSL-compatible format.
     Uses the same encryption method that can be decrypted by decrypt_system_prompt().
+    The output starts with a versioned header line naming the KDF, so decryption skips probing.
     """
     load_dotenv(".env.local")
     encryption_key = os.getenv("ENCRYPTION_KEY")
@@ -19,9 +21,9 @@ def encrypt_system_prompt(input_file="system_prompt.txt", output_file="system_pr
     with open(input_file, "r", encoding='utf-8') as f:
         plaintext = f.read()
     salt = os.urandom(8)
-    # Use PBKDF2 approach (approach 2 from decrypt function)
+    # Use PBKDF2 approach (named in the header as KDF_PBKDF2_SHA256)
     password = encryption_key.encode('utf-8')
-    key_iv = hashlib.pbkdf2_hmac('sha256', password, salt, 10000, 48)  # 32 + 16
+    key_iv = hashlib.pbkdf2_hmac('sha256', password, salt, PBKDF2_ITERATIONS, 48)  # 32 + 16
     key = key_iv[:32]
     iv = key_iv[32:48]
     # Pad the plaintext using PKCS7 padding
@@ -38,6 +40,7 @@ def encrypt_system_prompt(input_file="system_prompt.txt", output_file="system_pr
     salted_encrypted = b"Salted__" + salt + encrypted_content # Create OpenSSL-compatible format: "Salted__" + salt + encrypted_content
     encrypted_b64 = base64.b64encode(salted_encrypted).decode('utf-8') # Base64 encode the result
     with open(output_file, "w", encoding='utf-8') as f:
+        f.write(format_header(KDF_PBKDF2_SHA256, PBKDF2_ITERATIONS) + "\n")
         f.write(encrypted_b64)
     print(f"Successfully encrypted '{input_file}' to '{output_file}'")
     return encrypted_b64
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import re
+import unicodedata
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger("incremental_report")
+
+MAX_CONCURRENT_EXTRACTIONS = 2
+
+# Keywords that signal the interviewer moved on to an area (matched accent-insensitively)
+AREA_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "Vendas": ("vendas", "venda", "vender", "comercial", "funil", "pipeline", "ticket medio", "prospeccao"),
+    "Marketing": ("marketing", "aquisicao", "cac", "canais", "canal", "marca", "branding", "divulgacao"),
+    "Operações": ("operacoes", "operacao", "operacional", "processos", "logistica", "atendimento", "fornecedores"),
+    "Produto": ("produto", "roadmap", "funcionalidade", "funcionalidades", "mvp", "feedback dos clientes"),
+    "Tecnologia": ("tecnologia", "tecnologica", "stack", "infraestrutura", "desenvolvimento", "plataforma", "software"),
+    "Financeiro": ("financeiro", "financas", "faturamento", "receita", "caixa", "runway", "investimento", "margem"),
+    # not the bare "legal": it is the common interjection ("Legal! E como vocês vendem?")
+    "Legal": ("area legal", "parte legal", "questoes legais", "aspectos legais", "juridico", "juridica", "contrato", "contratos", "societario", "compliance", "lgpd", "propriedade intelectual"),
+    "Time": ("time", "equipe", "contratacao", "contratar", "socios", "cultura", "colaboradores", "funcionarios"),
+}
+
+INTERVIEWER_PREFIX = "Entrevistador: "
+_CONVERSATION_TURN = re.compile(r"\n\n(?=(?:Entrevistador|Entrevistado): )")
+
+def _normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+_AREA_PATTERNS = {
+    area: re.compile(r"\b(" + "|".join(re.escape(k) for k in keywords) + r")\b")
+    for area, keywords in AREA_KEYWORDS.items()
+}
+
+def detect_area(text: str) -> Optional[str]:
+    """Return the area an interviewer message is about, or None if no area keyword is present"""
+    normalized = _normalize(text)
+    hits = {area: len(pattern.findall(normalized)) for area, pattern in _AREA_PATTERNS.items()}
+    area, count = max(hits.items(), key=lambda item: item[1])
+    return area if count > 0 else None
+
+def split_by_area(conversation: str) -> Dict[Optional[str], str]:
+    """Group a conversation-only transcript into one span per area, following the interviewer's questions.
+    Turns before the first area question are keyed by None"""
+    spans: Dict[Optional[str], List[str]] = {}
+    area = None
+    for turn in _CONVERSATION_TURN.split(conversation.strip()):
+        if turn.startswith(INTERVIEWER_PREFIX):
+            area = detect_area(turn[len(INTERVIEWER_PREFIX):]) or area
+        spans.setdefault(area, []).append(turn)
+    return {area: "\n\n".join(turns) for area, turns in spans.items()}
+
+def merge_insights(areas: List[Dict[str, Any]], limit: int = 5) -> Dict[str, List[str]]:
+    """Build report insights from the strongest and weakest areas"""
+    ranked = sorted(areas, key=lambda area: area.get("score", 0), reverse=True)
+    key_strengths = [s for area in ranked for s in area.get("strengths", [])][:limit]
+    critical_gaps = [g for area in reversed(ranked) for g in area.get("gaps", [])][:limit]
+    next_steps = [f"{area['area_name']}: {area['gaps'][0]}" for area in reversed(ranked) if area.get("gaps")][:3]
+    return {"key_strengths": key_strengths, "critical_gaps": critical_gaps, "next_steps": next_steps}
+
+def assemble_report(interview_id: str, startup_info: Dict[str, Any], areas_by_name: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Reduce per-area results into a report; insights are derived, final_classification is left to ReportGenerator.classify"""
+    areas = [areas_by_name[name] for name in AREA_KEYWORDS if name in areas_by_name]
+    return {
+        "metadata": {"interview_id": interview_id, "date": datetime.now().isoformat(), "interviewer": "Atena - Startup Diagnosis S2S Agent"},
+        "startup_info": dict(startup_info),
+        "areas": areas,
+        "insights": merge_insights(areas),
+    }
+
+class IncrementalReportBuilder:
+    """Scores interview areas in the background as the conversation moves through them.
+
+    Transcript lines are grouped into segments by the area the interviewer is asking about.
+    When the interviewer switches area, the closed segment (together with earlier segments of
+    the same area) is sent to `ReportGenerator.extract_segment`. `finalize` then only waits for
+    outstanding extractions and merges them into a report.
+    """
+
+    def __init__(self, report_generator, interview_id: str, max_concurrency: int = MAX_CONCURRENT_EXTRACTIONS):
+        self.report_generator = report_generator
+        self.interview_id = interview_id
+        self.areas: Dict[str, Dict[str, Any]] = {}
+        self.startup_info: Dict[str, Any] = {}
+        self._current_area: Optional[str] = None
+        self._segment: List[str] = []
+        self._segment_has_answer = False
+        self._area_segments: Dict[Optional[str], List[str]] = {}
+        self._versions: Dict[Optional[str], int] = {}
+        self._applied_versions: Dict[Optional[str], int] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+
+    def observe(self, speaker: str, text: str):
+        """TranscriptionManager listener: route a new transcript line into the current segment"""
+        if speaker == "agent":
+            area = detect_area(text)
+            if area and area != self._current_area:
+                self._close_segment()
+                self._current_area = area
+        else:
+            self._segment_has_answer = True
+        speaker_label = "Entrevistador" if speaker == "agent" else "Entrevistado"
+        self._segment.append(f"{speaker_label}: {text}")
+
+    def _close_segment(self):
+        if not self._segment_has_answer:
+            return
+        area = self._current_area
+        self._area_segments.setdefault(area, []).append("\n\n".join(self._segment))
+        self._segment, self._segment_has_answer = [], False
+        self._versions[area] = self._versions.get(area, 0) + 1
+        self._schedule(area, self._versions[area], "\n\n".join(self._area_segments[area]))
+
+    def _schedule(self, area: Optional[str], version: int, text: str):
+        task = asyncio.create_task(self._extract(area, version, text))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _extract(self, area: Optional[str], version: int, text: str):
+        async with self._semaphore:
+            if version < self._versions[area]: # a newer segment for this area was closed while we waited
+                return
+            result = await self.report_generator.extract_segment(text, area)
+        if not result or version < self._applied_versions.get(area, 0):
+            return
+        self._applied_versions[area] = version
+        self.startup_info.update({k: v for k, v in (result.get("startup_info") or {}).items() if v is not None})
+        if area is not None and isinstance(result.get("area"), dict):
+            self.areas[area] = {**result["area"], "area_name": area}
+            logger.info(f"Provisional score for {area}: {self.areas[area].get('score')}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-serializable state for finishing the report in another process: the extractions already
+        applied plus the full text of every area whose latest segment has not been extracted yet"""
+        segments = {area: list(texts) for area, texts in self._area_segments.items()}
+        stale = {area for area, version in self._versions.items() if self._applied_versions.get(area, 0) < version}
+        if self._segment_has_answer:
+            segments.setdefault(self._current_area, []).append("\n\n".join(self._segment))
+            stale.add(self._current_area)
+        return {
+            "startup_info": dict(self.startup_info),
+            "areas": dict(self.areas),
+            "pending": [[area, "\n\n".join(segments[area])] for area in stale],
+        }
+
+    @classmethod
+    def from_snapshot(cls, report_generator, interview_id: str, snapshot: Dict[str, Any], **kwargs) -> "IncrementalReportBuilder":
+        """Rebuild a builder from `snapshot` and start extracting its pending areas (needs a running loop)"""
+        builder = cls(report_generator, interview_id, **kwargs)
+        builder.startup_info.update(snapshot.get("startup_info", {}))
+        builder.areas.update(snapshot.get("areas", {}))
+        for area, text in snapshot.get("pending", []):
+            builder._area_segments[area] = [text]
+            builder._versions[area] = 1
+            builder._schedule(area, 1, text)
+        return builder
+
+    def cancel(self):
+        """Stop outstanding extractions (their areas stay pending in `snapshot`)"""
+        for task in list(self._tasks):
+            task.cancel()
+
+    async def finalize(self) -> Optional[Dict[str, Any]]:
+        """Extract the last open segment, wait for pending work and merge. Returns None if coverage is insufficient"""
+        self._close_segment()
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        required = self.report_generator.schema.get("properties", {}).get("startup_info", {}).get("required", [])
+        missing = [field for field in required if field not in self.startup_info]
+        if not self.areas or missing:
+            logger.info(f"Incremental report incomplete (areas={list(self.areas)}, missing startup_info={missing})")
+            return None
+        return await self.report_generator.reduce_areas(self.interview_id, self.startup_info, self.areas)
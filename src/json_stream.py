@@ -0,0 +1,127 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("json_stream")
+
+FENCE_PREFIXES = ("```json", "```")
+
+class JSONStreamError(ValueError):
+    """Raised as soon as the streamed text can no longer become the expected JSON object"""
+
+class StreamingJSONParser:
+    """Incremental parser for an LLM's JSON object output.
+
+    `feed` consumes text chunks as they arrive and returns every item of the top-level
+    `array_key` array that closed in that chunk. Structural errors (text before the root
+    object, mismatched brackets, trailing content, a malformed item) raise JSONStreamError
+    immediately so the caller can abort the stream and retry. `close` returns the full object.
+    """
+
+    def __init__(self, array_key: Optional[str] = "areas"):
+        self.array_key = array_key
+        self._parts: List[str] = []
+        self._preamble: List[str] = []
+        self._trailer: List[str] = []
+        self._stack: List[str] = []
+        self._started = False
+        self._finished = False
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._key_chars: Optional[List[str]] = None
+        self._current_key: Optional[str] = None
+        self._item_chars: Optional[List[str]] = None
+        self.items: List[Any] = []
+
+    def _in_target_array(self) -> bool:
+        return len(self._stack) == 2 and self._stack[1] == "[" and self._current_key == self.array_key
+
+    def feed(self, chunk: str) -> List[Any]:
+        completed = []
+        for char in chunk:
+            if not self._started:
+                self._consume_preamble(char)
+                continue
+            if self._finished:
+                self._consume_trailer(char)
+                continue
+            self._parts.append(char)
+            if self._item_chars is not None:
+                self._item_chars.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._key_chars is not None:
+                        self._current_key = json.loads('"' + "".join(self._key_chars) + '"')
+                        self._key_chars = None
+                        self._expect_key = False
+                    continue
+                if self._key_chars is not None:
+                    self._key_chars.append(char)
+                continue
+            if char == '"':
+                self._in_string = True
+                if len(self._stack) == 1 and self._expect_key:
+                    self._key_chars = []
+            elif char in "{[":
+                if self._in_target_array() and char == "{":
+                    self._item_chars = ["{"]
+                self._stack.append(char)
+                if len(self._stack) == 1:
+                    self._expect_key = True
+            elif char in "}]":
+                opener = "{" if char == "}" else "["
+                if not self._stack or self._stack[-1] != opener:
+                    raise JSONStreamError(f"Unexpected '{char}' at offset {len(self._parts) - 1}")
+                self._stack.pop()
+                if self._item_chars is not None and self._in_target_array():
+                    completed.append(self._close_item())
+                if not self._stack:
+                    self._finished = True
+            elif char == "," and len(self._stack) == 1:
+                self._expect_key = True
+        return completed
+
+    def _close_item(self) -> Any:
+        text = "".join(self._item_chars)
+        self._item_chars = None
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise JSONStreamError(f"Malformed {self.array_key} item: {e}") from e
+        self.items.append(item)
+        return item
+
+    def _consume_preamble(self, char: str):
+        if char == "{":
+            if "".join(self._preamble).strip() not in ("",) + FENCE_PREFIXES:
+                raise JSONStreamError("Unexpected text before JSON object")
+            self._started = True
+            self._parts.append(char)
+            self._stack.append(char)
+            self._expect_key = True
+            return
+        self._preamble.append(char)
+        preamble = "".join(self._preamble).lstrip()
+        if preamble and not any(fence.startswith(preamble) or preamble.startswith(fence) and not preamble[len(fence):].strip() for fence in FENCE_PREFIXES):
+            raise JSONStreamError(f"Expected a JSON object, got {preamble[:40]!r}")
+
+    def _consume_trailer(self, char: str):
+        self._trailer.append(char)
+        trailer = "".join(self._trailer).strip()
+        if trailer and not "```".startswith(trailer):
+            raise JSONStreamError(f"Unexpected content after JSON object: {trailer[:40]!r}")
+
+    def close(self) -> Dict[str, Any]:
+        """Return the parsed object once the stream has ended"""
+        if not self._finished:
+            raise JSONStreamError("Stream ended before the JSON object was closed")
+        try:
+            return json.loads("".join(self._parts))
+        except json.JSONDecodeError as e:
+            raise JSONStreamError(f"Invalid JSON: {e}") from e
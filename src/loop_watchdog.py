@@ -0,0 +1,218 @@
+import functools
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("loop_watchdog")
+
+STALL_THRESHOLD_S = float(os.getenv("LOOP_STALL_THRESHOLD_S", "0.1"))
+PROFILE_SAMPLING = os.getenv("PROFILE_SAMPLING", "0") == "1"  # opt-in: a sampler thread costs CPU on every interview
+PROFILE_SAMPLE_INTERVAL_S = 0.005
+PROFILE_DIR = os.getenv("INTERVIEW_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "interview_profiles"))
+MAX_STALLS = 50  # per profile; later stalls are counted but their stacks are not kept
+STACK_DEPTH = 30
+TOP_STACKS = 15
+
+def capture_stack(thread_id: int) -> List[str]:
+    """The innermost STACK_DEPTH frames a thread is executing, outermost first, as file:line:function"""
+    frame = sys._current_frames().get(thread_id)
+    stack = []
+    while frame is not None and len(stack) < STACK_DEPTH:
+        stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return stack[::-1]
+
+class InterviewProfile:
+    """Loop stalls, lag and timed sections (with sampled stacks when PROFILE_SAMPLING is on) of one
+    interview session or completion job, written to PROFILE_DIR/{interview_id}.{kind}.json"""
+
+    def __init__(self, interview_id: str, kind: str = "session"):
+        self.interview_id = interview_id
+        self.kind = kind
+        self.stalls: List[Dict[str, Any]] = []
+        self.stall_count = 0
+        self.max_lag_s = 0.0
+        self.sections: Dict[str, Dict[str, Any]] = {}
+        self._stacks: Dict[str, Counter] = {}
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record_lag(self, lag_s: float):
+        self.max_lag_s = max(self.max_lag_s, lag_s)
+
+    def record_stall(self, duration_s: float, stack: List[str]):
+        with self._lock:
+            self.stall_count += 1
+            if len(self.stalls) < MAX_STALLS:
+                self.stalls.append({"at_s": round(time.perf_counter() - self._started - duration_s, 3),
+                                    "duration_ms": round(duration_s * 1000, 1), "stack": stack})
+        logger.warning(f"Event loop blocked for {duration_s * 1000:.0f}ms in {stack[-1] if stack else 'unknown'}",
+                       extra={"interview_id": self.interview_id, "stall_ms": round(duration_s * 1000, 1), "stack": stack})
+
+    def record_section(self, name: str, duration_s: float):
+        with self._lock:
+            section = self.sections.setdefault(name, {"calls": 0, "wall_s": 0.0, "samples": 0})
+            section["calls"] += 1
+            section["wall_s"] = round(section["wall_s"] + duration_s, 3)
+
+    def add_sample(self, name: str, stack: Tuple[str, ...]):
+        with self._lock:
+            self.sections.setdefault(name, {"calls": 0, "wall_s": 0.0, "samples": 0})["samples"] += 1
+            self._stacks.setdefault(name, Counter())[";".join(stack)] += 1
+
+    def begin(self, name: str) -> Tuple[str, float, Optional[int]]:
+        """Open a section; pass the returned token to `end`"""
+        token = get_sampler().enter(self, name) if PROFILE_SAMPLING else None
+        return name, time.perf_counter(), token
+
+    def end(self, opened: Tuple[str, float, Optional[int]]):
+        name, started, token = opened
+        if token is not None:
+            get_sampler().exit(token)
+        self.record_section(name, time.perf_counter() - started)
+
+    def wrap(self, name: str, fn: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        """`fn` with every call recorded as section `name`"""
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            opened = self.begin(name)
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self.end(opened)
+        return wrapper
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            sections = {}
+            for name, section in self.sections.items():
+                sections[name] = dict(section)
+                if name in self._stacks: # folded stacks, ready for flamegraph.pl / speedscope
+                    sections[name]["top_stacks"] = [{"stack": stack, "samples": count} for stack, count in self._stacks[name].most_common(TOP_STACKS)]
+            return {"interview_id": self.interview_id, "kind": self.kind, "duration_s": round(time.perf_counter() - self._started, 1),
+                    "max_lag_ms": round(self.max_lag_s * 1000, 1), "stall_count": self.stall_count, "stalls": list(self.stalls),
+                    "sections": sections, "sampling": PROFILE_SAMPLING}
+
+    def write(self, directory: str = PROFILE_DIR) -> Optional[str]:
+        """Write the profile atomically and log its summary. Blocking: call via asyncio.to_thread"""
+        profile = self.to_dict()
+        logger.info(f"Loop profile for {self.interview_id} ({self.kind}): {profile['stall_count']} stall(s), max lag {profile['max_lag_ms']}ms",
+                    extra={"interview_id": self.interview_id, "loop_profile": {k: v for k, v in profile.items() if k != "stalls"}})
+        try:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{self.interview_id}.{self.kind}.json")
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(profile, f, ensure_ascii=False, indent=2)
+            os.replace(f"{path}.tmp", path)
+            return path
+        except OSError as e:
+            logger.warning(f"Failed to write loop profile for {self.interview_id}: {e}")
+            return None
+
+class LoopWatchdog:
+    """Thread that notices when the event loop misses its heartbeat by more than `threshold_s` and captures
+    the stack the loop thread is running at that moment, i.e. the callback that is blocking it"""
+
+    def __init__(self, profile: InterviewProfile, beat_interval_s: float, threshold_s: float = STALL_THRESHOLD_S):
+        self.profile = profile
+        self.beat_interval_s = beat_interval_s
+        self.threshold_s = threshold_s
+        self._beat = time.perf_counter()
+        self._stall_stack: Optional[List[str]] = None
+        self._thread_id: Optional[int] = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Call on the event loop's thread"""
+        if self._thread is not None:
+            return
+        self._thread_id = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, daemon=True, name=f"loop-watchdog-{self.profile.interview_id}")
+        self._thread.start()
+
+    def beat(self, lag_s: float):
+        """Called by the loop each heartbeat with how late it fired"""
+        self.profile.record_lag(lag_s)
+        with self._lock:
+            stack, self._stall_stack = self._stall_stack, None
+            self._beat = time.perf_counter()
+        if stack is not None:
+            self.profile.record_stall(lag_s, stack)
+
+    def _watch(self):
+        while not self._stopped.wait(self.threshold_s / 2):
+            with self._lock:
+                late = time.perf_counter() - self._beat - self.beat_interval_s
+                if late > self.threshold_s and self._stall_stack is None:
+                    self._stall_stack = capture_stack(self._thread_id)
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopped.set() # not joined: the thread exits on its next check, without blocking the loop
+            self._thread = None
+
+class SamplingProfiler:
+    """Samples the stacks of the threads with an open section every PROFILE_SAMPLE_INTERVAL_S. Each sample
+    is attributed to every section open on its thread, so overlapping sections share samples.
+
+    Per-section stacks are approximate: sections are async, so while one is open the loop thread also
+    runs other tasks and sits in the selector, and every sample of it, idle time included, is credited
+    to each section open on it"""
+
+    def __init__(self, interval_s: float = PROFILE_SAMPLE_INTERVAL_S):
+        self.interval_s = interval_s
+        self._open: Dict[int, Tuple[int, InterviewProfile, str]] = {}
+        self._next_token = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def enter(self, profile: InterviewProfile, name: str) -> int:
+        with self._lock:
+            self._next_token += 1
+            token = self._next_token
+            self._open[token] = (threading.get_ident(), profile, name)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="sampling-profiler")
+                self._thread.start()
+        self._wakeup.set()
+        return token
+
+    def exit(self, token: int):
+        with self._lock:
+            self._open.pop(token, None)
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                self._wakeup.clear() # before the snapshot, so a section entered after it sets it again
+                sections = list(self._open.values())
+            if not sections:
+                self._wakeup.wait()
+                continue
+            stacks = {thread_id: tuple(capture_stack(thread_id)) for thread_id in {s[0] for s in sections} if thread_id != own}
+            for thread_id, profile, name in sections:
+                if stacks.get(thread_id):
+                    profile.add_sample(name, stacks[thread_id])
+            time.sleep(self.interval_s)
+
+_sampler: Optional[SamplingProfiler] = None
+_sampler_lock = threading.Lock()
+
+def get_sampler() -> SamplingProfiler:
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = SamplingProfiler()
+        return _sampler
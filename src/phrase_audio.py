@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import wave
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterable, Optional
+from livekit import rtc
+
+logger = logging.getLogger("phrase_audio")
+
+PHRASE_AUDIO_DIR = os.getenv("PHRASE_AUDIO_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "phrase_audio"))
+FRAME_DURATION_MS = 20
+SAMPLE_WIDTH = 2  # 16-bit PCM
+
+def phrase_key(voice_id: str, model: str, text: str) -> str:
+    return hashlib.sha256(f"{voice_id}\0{model}\0{text}".encode("utf-8")).hexdigest()[:24]
+
+@dataclass(frozen=True)
+class PhraseAudio:
+    """16-bit PCM of one synthesized phrase"""
+    pcm: bytes
+    sample_rate: int
+    num_channels: int
+
+    @property
+    def duration_s(self) -> float:
+        return len(self.pcm) / (SAMPLE_WIDTH * self.num_channels * self.sample_rate)
+
+    async def frames(self) -> AsyncIterator[rtc.AudioFrame]:
+        samples_per_frame = self.sample_rate * FRAME_DURATION_MS // 1000
+        step = samples_per_frame * self.num_channels * SAMPLE_WIDTH
+        for offset in range(0, len(self.pcm), step):
+            chunk = self.pcm[offset:offset + step]
+            yield rtc.AudioFrame(data=chunk, sample_rate=self.sample_rate, num_channels=self.num_channels,
+                                 samples_per_channel=len(chunk) // (self.num_channels * SAMPLE_WIDTH))
+
+class PhraseAudioCache:
+    """Fixed agent utterances synthesized once and replayed from disk.
+
+    Each phrase is stored as a mono/stereo 16-bit WAV named after a hash of
+    (voice_id, model, text), so changing the voice, the TTS model or a single character of
+    the text simply misses the cache. `say` plays cached audio through the session without
+    calling TTS and falls through to live TTS for anything else.
+    """
+
+    def __init__(self, directory: str = PHRASE_AUDIO_DIR):
+        self.directory = directory
+        self._phrases: Dict[str, PhraseAudio] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.wav")
+
+    def get(self, voice_id: str, model: str, text: str) -> Optional[PhraseAudio]:
+        key = phrase_key(voice_id, model, text)
+        audio = self._phrases.get(key)
+        if audio is None:
+            audio = self._read(key)
+        return audio
+
+    def _read(self, key: str) -> Optional[PhraseAudio]:
+        try:
+            with wave.open(self._path(key), "rb") as f:
+                audio = PhraseAudio(pcm=f.readframes(f.getnframes()), sample_rate=f.getframerate(), num_channels=f.getnchannels())
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, wave.Error) as e:
+            logger.warning(f"Ignoring unreadable cached phrase {key}: {e}")
+            return None
+        with self._lock:
+            self._phrases[key] = audio
+        return audio
+
+    def _write(self, key: str, audio: PhraseAudio):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        with wave.open(tmp_path, "wb") as f:
+            f.setnchannels(audio.num_channels)
+            f.setsampwidth(SAMPLE_WIDTH)
+            f.setframerate(audio.sample_rate)
+            f.writeframes(audio.pcm)
+        os.replace(tmp_path, self._path(key)) # other worker processes never see a partial file
+        with self._lock:
+            self._phrases[key] = audio
+
+    def load(self, voice_id: str, model: str, phrases: Iterable[str]) -> int:
+        """Read the stored phrases into memory (prewarm). Returns how many were found"""
+        return sum(1 for text in phrases if self.get(voice_id, model, text) is not None)
+
+    async def synthesize(self, tts, voice_id: str, model: str, text: str) -> PhraseAudio:
+        async with tts.synthesize(text) as stream:
+            frames = [event.frame async for event in stream]
+        combined = rtc.combine_audio_frames(frames)
+        audio = PhraseAudio(pcm=bytes(combined.data), sample_rate=combined.sample_rate, num_channels=combined.num_channels)
+        await asyncio.to_thread(self._write, phrase_key(voice_id, model, text), audio)
+        logger.info(f"Cached {audio.duration_s:.1f}s of audio for phrase {text[:40]!r}")
+        return audio
+
+    async def warm(self, tts, voice_id: str, model: str, phrases: Iterable[str]) -> int:
+        """Synthesize every phrase that is not stored yet. Returns how many were synthesized"""
+        synthesized = 0
+        for text in phrases:
+            if await asyncio.to_thread(self.get, voice_id, model, text) is not None:
+                continue
+            try:
+                await self.synthesize(tts, voice_id, model, text)
+                synthesized += 1
+            except Exception as e:
+                logger.warning(f"Failed to pre-synthesize phrase {text[:40]!r}: {e}")
+        return synthesized
+
+    async def say(self, session, text: str, voice_id: str, model: str, **kwargs):
+        """session.say with cached audio when available, otherwise live TTS"""
+        audio = self._phrases.get(phrase_key(voice_id, model, text))
+        if audio is None:
+            logger.debug(f"Phrase not cached, using live TTS: {text[:40]!r}")
+            return await session.say(text, **kwargs)
+        return await session.say(text, audio=audio.frames(), **kwargs)
+
+_cache: Optional[PhraseAudioCache] = None
+_cache_lock = threading.Lock()
+
+def get_phrase_audio_cache() -> PhraseAudioCache:
+    """Process-wide cache, loaded in prewarm"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PhraseAudioCache()
+        return _cache
+
+if __name__ == "__main__":
+    # Build-time fill: python src/phrase_audio.py (needs ELEVEN_API_KEY)
+    import aiohttp
+    from dotenv import load_dotenv
+    from livekit.plugins import elevenlabs
+    import agent
+    load_dotenv(".env.local")
+    logging.basicConfig(level=logging.INFO)
+
+    async def main():
+        async with aiohttp.ClientSession() as http_session: # no job context here to provide one
+            tts = elevenlabs.TTS(voice_id=agent.TTS_VOICE_ID, model=agent.TTS_MODEL, http_session=http_session)
+            count = await get_phrase_audio_cache().warm(tts, agent.TTS_VOICE_ID, agent.TTS_MODEL, agent.FIXED_PHRASES)
+            await tts.aclose()
+        print(f"Synthesized {count} phrase(s) into {PHRASE_AUDIO_DIR}")
+
+    asyncio.run(main())
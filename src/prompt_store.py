@@ -0,0 +1,263 @@
+"""Versioned store of the interviewer prompt and the report schema, hot-reloaded by every worker process.
+
+    python src/prompt_store.py publish VERSION [--prompt system_prompt.txt] [--schema src/schema/schema.json] [--store PATH_OR_S3_URL]
+
+The store is a local directory or an S3 prefix (PROMPT_STORE=/srv/prompts or s3://bucket/prompts):
+
+    CURRENT                                 name of the live version
+    <version>/system_prompt_encrypted.txt   output of encrypt.py
+    <version>/schema.json
+
+Each process polls CURRENT on a background thread. A new version is fetched, decrypted and
+validated there and only then swapped in, so sessions never wait on the KDF and a broken
+upload never replaces a working release. A session pins the release it started with; its
+completion job looks that release up again by version, possibly in another process.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+from botocore.exceptions import ClientError
+from decrypt import decrypt_prompt_text, get_system_prompt
+from report_assets import ReportAssets, get_report_assets, parse_report_assets, set_report_assets
+from s3_handler import MISSING_OBJECT_ERRORS, get_s3_client
+
+logger = logging.getLogger("prompt_store")
+
+PROMPT_STORE = os.getenv("PROMPT_STORE", "")  # empty: the prompt and schema bundled in the image
+PROMPT_STORE_POLL_S = float(os.getenv("PROMPT_STORE_POLL_S", "30"))
+CURRENT_POINTER = "CURRENT"
+PROMPT_FILE = "system_prompt_encrypted.txt"
+SCHEMA_FILE = "schema.json"
+BUNDLED_VERSION = "bundled"
+MAX_CACHED_RELEASES = 8  # older releases pinned by queued completion jobs are fetched again on demand
+
+@dataclass(frozen=True)
+class PromptRelease:
+    version: str
+    system_prompt: Optional[str]
+    assets: ReportAssets
+
+class _LocalSource:
+    def __init__(self, root: str):
+        self.root = root
+
+    def read(self, name: str) -> Optional[bytes]:
+        try:
+            with open(os.path.join(self.root, name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, name: str, body: bytes):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(body)
+        os.replace(f"{path}.tmp", path)
+
+    def __str__(self):
+        return self.root
+
+class _S3Source:
+    def __init__(self, url: str, client=None):
+        self.bucket, _, prefix = url[len("s3://"):].partition("/")
+        self.prefix = f"{prefix.rstrip('/')}/" if prefix else ""
+        self.client = client if client is not None else get_s3_client()
+
+    def read(self, name: str) -> Optional[bytes]:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self.prefix + name)["Body"].read()
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in MISSING_OBJECT_ERRORS:
+                return None
+            raise
+
+    def write(self, name: str, body: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + name, Body=body)
+
+    def __str__(self):
+        return f"s3://{self.bucket}/{self.prefix}"
+
+def open_source(location: str, client=None):
+    return _S3Source(location, client) if location.startswith("s3://") else _LocalSource(location)
+
+def load_release(source, version: str) -> PromptRelease:
+    """Fetch, decrypt and validate one version. Blocking (KDF and I/O); raises ValueError if it is unusable"""
+    encrypted, schema = source.read(f"{version}/{PROMPT_FILE}"), source.read(f"{version}/{SCHEMA_FILE}")
+    if encrypted is None or schema is None:
+        raise ValueError(f"Prompt release {version} is incomplete in {source}")
+    system_prompt = decrypt_prompt_text(encrypted.decode("utf-8"))
+    if not system_prompt:
+        raise ValueError(f"Prompt release {version} could not be decrypted")
+    try:
+        assets = parse_report_assets(schema, path=f"{source}/{version}/{SCHEMA_FILE}")
+    except Exception as e:
+        raise ValueError(f"Prompt release {version} has an invalid schema: {e}") from e
+    if not assets.area_names:
+        raise ValueError(f"Prompt release {version} has a schema without areas")
+    return PromptRelease(version, system_prompt, assets)
+
+def bundled_release() -> PromptRelease:
+    """The prompt and schema shipped in the image, used when no store is configured or it cannot be read"""
+    try:
+        system_prompt = get_system_prompt()
+    except Exception as e:
+        logger.error(f"Failed to decrypt the bundled system prompt: {e}")
+        system_prompt = None
+    return PromptRelease(BUNDLED_VERSION, system_prompt, get_report_assets())
+
+class PromptStore:
+    """The active release of this process, the releases recently pinned by sessions, and the watcher that switches releases"""
+
+    def __init__(self, location: str = PROMPT_STORE, poll_s: float = PROMPT_STORE_POLL_S, client=None):
+        self.source = open_source(location, client) if location else None
+        self.poll_s = poll_s
+        self._active: Optional[PromptRelease] = None
+        self._releases: "OrderedDict[str, PromptRelease]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def current(self) -> Optional[PromptRelease]:
+        """The active release, without any I/O; None until the first load"""
+        return self._active
+
+    def active(self) -> PromptRelease:
+        """The active release, loading it on first use (normally in prewarm). Blocking"""
+        if self._active is None:
+            if self.source is None or not self.refresh():
+                release = bundled_release()
+                with self._lock:
+                    if self._active is None:
+                        self._remember(release, activate=True)
+        return self._active
+
+    def activate(self, release: PromptRelease):
+        """Make `release` the one new sessions start with. Sessions already running keep theirs"""
+        with self._lock:
+            self._remember(release, activate=True)
+        set_report_assets(release.assets)
+        logger.info(f"Prompt release {release.version} active (schema version {release.assets.version})")
+
+    def _remember(self, release: PromptRelease, activate: bool = False):
+        self._releases[release.version] = release
+        self._releases.move_to_end(release.version)
+        while len(self._releases) > MAX_CACHED_RELEASES:
+            self._releases.popitem(last=False)
+        if activate:
+            self._active = release
+
+    def refresh(self) -> bool:
+        """Switch to the version CURRENT names if it differs and validates. Blocking; returns True if a release was activated"""
+        if self.source is None:
+            return False
+        try:
+            pointer = self.source.read(CURRENT_POINTER)
+            version = pointer.decode("utf-8").strip() if pointer else ""
+            if not version or (self._active is not None and self._active.version == version):
+                return False
+            with self._lock:
+                release = self._releases.get(version)
+            release = release or load_release(self.source, version)
+        except Exception as e:
+            logger.error(f"Failed to load prompt release from {self.source}, keeping {self._active.version if self._active else 'none'}: {e}")
+            return False
+        self.activate(release)
+        return True
+
+    def release(self, version: Optional[str]) -> PromptRelease:
+        """The release a session pinned, falling back to the active one if it cannot be loaded any more. Blocking"""
+        active = self.active()
+        if not version or version == active.version:
+            return active
+        with self._lock:
+            cached = self._releases.get(version)
+        if cached is not None:
+            return cached
+        try:
+            if self.source is None:
+                raise ValueError("no prompt store is configured")
+            release = load_release(self.source, version)
+        except Exception as e:
+            logger.error(f"Prompt release {version} is unavailable, using {active.version}: {e}")
+            return active
+        with self._lock:
+            self._remember(release)
+        return release
+
+    async def pinned(self, version: Optional[str]) -> PromptRelease:
+        """`release` without blocking the event loop when the version has to be fetched"""
+        with self._lock:
+            cached = self._releases.get(version) if version else self._active
+        return cached or await asyncio.to_thread(self.release, version)
+
+    def start(self):
+        """Start polling CURRENT every `poll_s` seconds"""
+        if self.source is None or self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, daemon=True, name="prompt-store-watcher")
+        self._thread.start()
+
+    def _watch(self):
+        while not self._stopped.wait(self.poll_s):
+            self.refresh()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread = None
+
+def publish(location: str, version: str, prompt_file: str, schema_file: str):
+    """Encrypt and upload a release, check that it loads back, and only then point CURRENT at it"""
+    from encrypt import encrypt_system_prompt
+    source = open_source(location)
+    with tempfile.TemporaryDirectory() as directory:
+        encrypted = os.path.join(directory, PROMPT_FILE)
+        encrypt_system_prompt(prompt_file, encrypted)
+        with open(encrypted, "rb") as f:
+            source.write(f"{version}/{PROMPT_FILE}", f.read())
+    with open(schema_file, "rb") as f:
+        source.write(f"{version}/{SCHEMA_FILE}", f.read())
+    load_release(source, version)
+    source.write(CURRENT_POINTER, version.encode("utf-8"))
+    logger.info(f"Published prompt release {version} to {source}")
+
+_store: Optional[PromptStore] = None
+_store_lock = threading.Lock()
+
+def get_prompt_store() -> PromptStore:
+    """Process-wide store for PROMPT_STORE"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PromptStore()
+        return _store
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Publish versions of the interviewer prompt and report schema")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    publish_parser = subcommands.add_parser("publish", help="upload a new release and make it current")
+    publish_parser.add_argument("version")
+    publish_parser.add_argument("--prompt", default="system_prompt.txt")
+    publish_parser.add_argument("--schema", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema", "schema.json"))
+    publish_parser.add_argument("--store", default=PROMPT_STORE)
+    args = parser.parse_args(argv)
+    if not args.store:
+        parser.error("set PROMPT_STORE or pass --store")
+    logging.basicConfig(level=logging.INFO)
+    try:
+        publish(args.store, args.version, args.prompt, args.schema)
+    except Exception as e:
+        logger.error(f"Publishing failed: {e}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,272 @@
+import asyncio
+import dataclasses
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Tuple, TypeVar
+from livekit.agents import APIConnectionError, llm, stt
+from livekit.agents.types import DEFAULT_API_CONNECT_OPTIONS, NOT_GIVEN, APIConnectOptions, NotGivenOr
+from voice_metrics import get_voice_metrics
+
+logger = logging.getLogger("provider_router")
+
+T = TypeVar("T")
+
+HEDGING = os.getenv("PROVIDER_HEDGING", "1") == "1"
+LATENCY_WINDOW = 50  # recent first-response latencies per backend the p95 budget is taken from
+MIN_BUDGET_SAMPLES = 5  # below this the role's default budget is used
+EWMA_WEIGHT = 0.2
+FAILURE_COOLDOWN_S = 10.0  # doubled per consecutive failure, capped at MAX_FAILURE_COOLDOWN_S
+MAX_FAILURE_COOLDOWN_S = 120.0
+ATTEMPT_TIMEOUT_S = 15.0
+# (default, min, max) seconds to first response before a hedged request is sent
+BUDGETS = {
+    "llm": (1.5, 0.4, 4.0),
+    "stt": (2.0, 0.5, 5.0),
+    "report": (4.0, 1.0, 15.0),
+}
+
+@dataclass
+class BackendStats:
+    name: str
+    ewma_s: Optional[float] = None
+    samples: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+    consecutive_failures: int = 0
+    unavailable_until: float = 0.0
+
+    def p95(self) -> Optional[float]:
+        if len(self.samples) < MIN_BUDGET_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))]
+
+class ProviderRouter:
+    """Latency and health bookkeeping for the interchangeable backends of one role, plus the race between them.
+
+    Backends are tried in their configured (quality) order, skipping any in failure cooldown. A request
+    goes to the first; if it has not answered within the p95 of that backend's recent latencies, a
+    hedged request goes to the next one and whichever answers first wins, the other being cancelled.
+    An error fails over to the next backend at once.
+    """
+
+    def __init__(self, role: str, names: Sequence[str], hedging: bool = HEDGING):
+        if not names:
+            raise ValueError("A router needs at least one backend")
+        self.role = role
+        self.backends = [BackendStats(name) for name in names]
+        self.default_budget_s, self.min_budget_s, self.max_budget_s = BUDGETS.get(role, BUDGETS["llm"])
+        self.hedging = hedging
+        self._requests = get_voice_metrics().provider_requests
+
+    def order(self, now: Optional[float] = None) -> List[int]:
+        now = time.monotonic() if now is None else now
+        indexes = range(len(self.backends))
+        # backends in cooldown stay in the list, last, so a request still has somewhere to go
+        return sorted(indexes, key=lambda i: self.backends[i].unavailable_until > now)
+
+    def budget(self, index: int) -> float:
+        p95 = self.backends[index].p95()
+        return min(self.max_budget_s, max(self.min_budget_s, p95 if p95 is not None else self.default_budget_s))
+
+    def record_latency(self, index: int, seconds: float):
+        stats = self.backends[index]
+        stats.ewma_s = seconds if stats.ewma_s is None else stats.ewma_s + EWMA_WEIGHT * (seconds - stats.ewma_s)
+        stats.samples.append(seconds)
+
+    def record_success(self, index: int, seconds: float):
+        self.record_latency(index, seconds)
+        stats = self.backends[index]
+        if stats.consecutive_failures:
+            logger.info(f"{self.role} backend {stats.name} recovered")
+        stats.consecutive_failures, stats.unavailable_until = 0, 0.0
+
+    def record_failure(self, index: int, error: BaseException):
+        stats = self.backends[index]
+        stats.consecutive_failures += 1
+        cooldown = min(MAX_FAILURE_COOLDOWN_S, FAILURE_COOLDOWN_S * 2 ** (stats.consecutive_failures - 1))
+        stats.unavailable_until = time.monotonic() + cooldown
+        logger.warning(f"{self.role} backend {stats.name} failed ({stats.consecutive_failures} in a row), "
+                       f"deprioritized for {cooldown:.0f}s: {error!r}")
+
+    def _count(self, index: int, outcome: str):
+        self._requests.labels(role=self.role, backend=self.backends[index].name, outcome=outcome).inc()
+
+    async def race(self, attempt: Callable[[int], Awaitable[T]],
+                   discard: Optional[Callable[[T], Awaitable[None]]] = None) -> Tuple[int, T]:
+        """Run `attempt(index)` against the backends as described above and return the winner's index and result.
+        `discard` releases the result of an attempt that finished after the race was already won"""
+        order = self.order()
+        started: Dict[asyncio.Task, Tuple[int, float]] = {}
+        errors: List[str] = []
+        hedge_at = None
+
+        def launch():
+            index = order[len(started)]
+            task = asyncio.create_task(attempt(index), name=f"{self.role}-{self.backends[index].name}")
+            started[task] = (index, time.perf_counter())
+            return task
+
+        pending = {launch()}
+        if self.hedging and len(order) > 1:
+            hedge_at = time.perf_counter() + self.budget(order[0])
+        winner: Optional[Tuple[int, T]] = None
+        try:
+            while pending and winner is None:
+                timeout = None
+                if hedge_at is not None and len(started) < len(order):
+                    timeout = max(0.0, hedge_at - time.perf_counter())
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge_at = None
+                    logger.info(f"{self.role} backend {self.backends[order[0]].name} missed its {self.budget(order[0]):.2f}s budget, hedging")
+                    pending.add(launch())
+                    continue
+                for task in done:
+                    index, task_started = started[task]
+                    if task.exception() is not None:
+                        self.record_failure(index, task.exception())
+                        self._count(index, "failed")
+                        errors.append(f"{self.backends[index].name}: {task.exception()!r}")
+                    elif winner is None:
+                        self.record_success(index, time.perf_counter() - task_started)
+                        self._count(index, "won")
+                        winner = (index, task.result())
+                    else: # answered in the same tick as the winner
+                        self.record_success(index, time.perf_counter() - task_started)
+                        self._count(index, "lost")
+                        if discard:
+                            await discard(task.result())
+                if winner is None and not pending and len(started) < len(order):
+                    hedge_at = None # failing over: the next backend is now the only attempt
+                    pending.add(launch())
+            if winner is None:
+                raise APIConnectionError(f"All {self.role} backends failed: {errors}")
+            return winner
+        finally:
+            for task in pending:
+                task.cancel()
+                if winner is not None:
+                    index, task_started = started[task]
+                    # the loser took at least this long; recording it keeps a slow backend's budget honest
+                    self.record_latency(index, time.perf_counter() - task_started)
+                    self._count(index, "lost")
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                for task in pending:
+                    if discard and not task.cancelled() and task.exception() is None:
+                        await discard(task.result())
+
+_routers: Dict[str, ProviderRouter] = {}
+_routers_lock = threading.Lock()
+
+def get_router(role: str, names: Sequence[str]) -> ProviderRouter:
+    """Process-wide router per role and backend list, so latency history outlives one adapter instance"""
+    key = f"{role}:{','.join(names)}"
+    with _routers_lock:
+        if key not in _routers:
+            _routers[key] = ProviderRouter(role, names)
+        return _routers[key]
+
+def _backend_name(backend: Any) -> str:
+    return f"{getattr(backend, 'provider', 'local')}/{getattr(backend, 'model', type(backend).__name__)}"
+
+class HedgedLLM(llm.LLM):
+    """LLM adapter that races its backends on time to first chunk through a ProviderRouter"""
+
+    def __init__(self, backends: List[Any], role: str = "llm", router: Optional[ProviderRouter] = None,
+                 attempt_timeout: float = ATTEMPT_TIMEOUT_S):
+        super().__init__()
+        self.backends = backends
+        self.router = router or get_router(role, [_backend_name(backend) for backend in backends])
+        self.attempt_timeout = attempt_timeout
+        self._active = 0
+
+    @property
+    def model(self) -> str:
+        """The model of the backend that answered last, so metrics are labelled with what actually served"""
+        return getattr(self.backends[self._active], "model", "unknown")
+
+    @property
+    def provider(self) -> str:
+        return getattr(self.backends[self._active], "provider", "unknown")
+
+    def chat(self, *, chat_ctx: llm.ChatContext, tools: Optional[List[Any]] = None,
+             conn_options: APIConnectOptions = dataclasses.replace(DEFAULT_API_CONNECT_OPTIONS, max_retry=0),
+             parallel_tool_calls: NotGivenOr[bool] = NOT_GIVEN, tool_choice: NotGivenOr[Any] = NOT_GIVEN,
+             extra_kwargs: NotGivenOr[Dict[str, Any]] = NOT_GIVEN) -> "HedgedLLMStream":
+        return HedgedLLMStream(self, chat_ctx=chat_ctx, tools=tools or [], conn_options=conn_options,
+                               parallel_tool_calls=parallel_tool_calls, tool_choice=tool_choice, extra_kwargs=extra_kwargs)
+
+    def prewarm(self, *args, **kwargs):
+        prewarm = getattr(self.backends[self.router.order()[0]], "prewarm", None)
+        if prewarm:
+            prewarm(*args, **kwargs)
+
+class HedgedLLMStream(llm.LLMStream):
+    def __init__(self, hedged: HedgedLLM, *, chat_ctx: llm.ChatContext, tools: List[Any], conn_options: APIConnectOptions,
+                 parallel_tool_calls: NotGivenOr[bool], tool_choice: NotGivenOr[Any], extra_kwargs: NotGivenOr[Dict[str, Any]]):
+        super().__init__(hedged, chat_ctx=chat_ctx, tools=tools, conn_options=conn_options)
+        self._hedged = hedged
+        self._request = {"parallel_tool_calls": parallel_tool_calls, "tool_choice": tool_choice, "extra_kwargs": extra_kwargs}
+
+    async def _attempt(self, index: int):
+        """Open the stream on one backend and wait for its first chunk"""
+        stream = self._hedged.backends[index].chat(
+            chat_ctx=self._chat_ctx, tools=self._tools, **self._request,
+            conn_options=dataclasses.replace(self._conn_options, max_retry=0, timeout=self._hedged.attempt_timeout),
+        )
+        chunks = stream.__aiter__()
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = None
+        except BaseException:
+            await stream.aclose()
+            raise
+        return stream, chunks, first
+
+    @staticmethod
+    async def _discard(result):
+        await result[0].aclose()
+
+    async def _run(self):
+        index, (stream, chunks, first) = await self._hedged.router.race(self._attempt, self._discard)
+        self._hedged._active = index
+        try:
+            if first is None:
+                return
+            self._event_ch.send_nowait(first)
+            async for chunk in chunks:
+                self._event_ch.send_nowait(chunk)
+        finally:
+            await stream.aclose()
+
+class HedgedSTT(stt.STT):
+    """Batch STT adapter that races its backends' `recognize` through a ProviderRouter"""
+
+    def __init__(self, backends: List[Any], role: str = "stt", router: Optional[ProviderRouter] = None,
+                 attempt_timeout: float = ATTEMPT_TIMEOUT_S):
+        super().__init__(capabilities=stt.STTCapabilities(streaming=False, interim_results=False))
+        self.backends = backends
+        self.router = router or get_router(role, [_backend_name(backend) for backend in backends])
+        self.attempt_timeout = attempt_timeout
+        self._active = 0
+
+    @property
+    def model(self) -> str:
+        return getattr(self.backends[self._active], "model", "unknown")
+
+    @property
+    def provider(self) -> str:
+        return getattr(self.backends[self._active], "provider", "unknown")
+
+    async def _recognize_impl(self, buffer, *, language: NotGivenOr[str] = NOT_GIVEN,
+                              conn_options: APIConnectOptions) -> stt.SpeechEvent:
+        attempt_options = dataclasses.replace(conn_options, max_retry=0, timeout=self.attempt_timeout)
+        index, event = await self.router.race(
+            lambda i: self.backends[i].recognize(buffer, language=language, conn_options=attempt_options))
+        self._active = index
+        return event
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+from jsonschema import Draft7Validator
+
+logger = logging.getLogger("report_assets")
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema", "schema.json")
+
+SYSTEM_PROMPT = "Você é um consultor especialista em análise de startups e deve gerar um relatório estruturado baseado na entrevista transcrita."
+
+SCORING_GUIDE = """PARA CÁLCULO DE SCORE DA ÁREA:
+Baseado em evidências de maturidade e capacidades demonstradas:
+Faixa 1-2: Processos informais, aprendizado inicial, dependência total de founders
+Faixa 3-4: Sistemas básicos implementados, processos documentados, métricas iniciais
+Faixa 5-6: Automação, especialização, operações independentes dos founders
+Faixa 7-8: Operações avançadas, multi-canal/região, otimização contínua
+Faixa 9: Liderança de categoria, benchmark da indústria, inovação
+
+PARA CÁLCULO DE CONFIANÇA:
+Evidências específicas (números, métricas, ferramentas, processos): +40%
+Consistência narrativa (coerência lógica da resposta): +40%
+Exemplos concretos e detalhamento: +20%"""
+
+# Static instructions come first so every report prompt shares a long, cacheable prefix
+REPORT_PROMPT_TEMPLATE = """
+INSTRUÇÕES:
+1. Analise cuidadosamente toda a transcrição da entrevista
+2. Extraia informações sobre a startup
+3. Preencha todos os campos do schema
+4. Forneça insights sobre pontos fortes, lacunas críticas e próximos passos
+
+{scoring_guide}
+
+FORMATO DE RESPOSTA:
+Retorne APENAS um JSON válido seguindo exatamente o seguinte schema fornecido. Não inclua texto adicional antes ou depois do JSON.
+Schema:
+{schema}
+
+TRANSCRIÇÃO DA ENTREVISTA:
+"""
+
+STARTUP_INFO_PROMPT_TEMPLATE = """
+INSTRUÇÕES:
+Extraia apenas os dados gerais da startup mencionados no trecho abaixo. Omita campos não mencionados.
+
+FORMATO DE RESPOSTA:
+Retorne APENAS um JSON válido no formato {{"startup_info": {{...}}}}. Não inclua texto adicional antes ou depois do JSON.
+Schema de startup_info:
+{startup_info_schema}
+
+TRECHO DA ENTREVISTA:
+"""
+
+AREA_PROMPT_TEMPLATE = """
+INSTRUÇÕES:
+1. Analise apenas a área "{area_name}" com base no trecho abaixo
+2. Liste evidências, lacunas e pontos fortes citados pelo entrevistado
+3. Calcule score, faixa e confiança provisórios para a área
+4. Se o trecho mencionar dados gerais da startup, preencha startup_info; caso contrário, omita os campos
+
+{scoring_guide}
+
+FORMATO DE RESPOSTA:
+Retorne APENAS um JSON válido no formato {{"area": {{...}}, "startup_info": {{...}}}}, com "area_name" igual a "{area_name}". Não inclua texto adicional antes ou depois do JSON.
+Schema da área:
+{area_schema}
+
+TRECHO DA ENTREVISTA (área: {area_name}):
+"""
+
+# The overall classification is a judgement over the whole diagnosis, not an average of the area scores
+CLASSIFICATION_PROMPT_TEMPLATE = """
+INSTRUÇÕES:
+1. Com base nos dados gerais da startup e na avaliação de cada área abaixo, determine a classificação final da startup
+2. Defina grupo, faixa, score geral e momentum considerando o conjunto das áreas, suas confianças, pontos fortes e lacunas
+
+{scoring_guide}
+
+FORMATO DE RESPOSTA:
+Retorne APENAS um JSON válido no formato {{"final_classification": {{...}}}}. Não inclua texto adicional antes ou depois do JSON.
+Schema de final_classification:
+{classification_schema}
+
+AVALIAÇÃO DA STARTUP POR ÁREA:
+"""
+
+# Changes whenever any prompt text changes; with the schema version it identifies what a report was generated with
+PROMPT_VERSION = hashlib.sha256("\0".join((SYSTEM_PROMPT, SCORING_GUIDE, REPORT_PROMPT_TEMPLATE, STARTUP_INFO_PROMPT_TEMPLATE, AREA_PROMPT_TEMPLATE,
+                                          CLASSIFICATION_PROMPT_TEMPLATE)).encode("utf-8")).hexdigest()[:12]
+
+@dataclass(frozen=True)
+class ReportAssets:
+    """Parsed schema, its compiled validator and the pre-rendered static prompt prefixes"""
+    schema: Dict[str, Any]
+    validator: Optional[Draft7Validator]
+    version: str
+    path: str
+    mtime: float
+    report_prompt_prefix: str
+    startup_info_prompt_prefix: str
+    classification_prompt_prefix: str
+    area_prompt_prefixes: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def area_names(self):
+        return self.schema.get("properties", {}).get("areas", {}).get("items", {}).get("properties", {}).get("area_name", {}).get("enum", [])
+
+def build_report_assets(schema: Dict[str, Any], version: str, path: str = "", mtime: float = 0.0) -> ReportAssets:
+    """Compile a schema into a ReportAssets bundle"""
+    properties = schema.get("properties", {})
+    area_schema = json.dumps(properties.get("areas", {}).get("items", {}), indent=2)
+    assets = ReportAssets(
+        schema=schema,
+        validator=Draft7Validator(schema) if schema else None,
+        version=version,
+        path=path,
+        mtime=mtime,
+        report_prompt_prefix=REPORT_PROMPT_TEMPLATE.format(scoring_guide=SCORING_GUIDE, schema=json.dumps(schema, indent=2)),
+        startup_info_prompt_prefix=STARTUP_INFO_PROMPT_TEMPLATE.format(startup_info_schema=json.dumps(properties.get("startup_info", {}), indent=2)),
+        classification_prompt_prefix=CLASSIFICATION_PROMPT_TEMPLATE.format(scoring_guide=SCORING_GUIDE,
+                                                                           classification_schema=json.dumps(properties.get("final_classification", {}), indent=2)),
+    )
+    assets.area_prompt_prefixes.update({
+        name: AREA_PROMPT_TEMPLATE.format(area_name=name, scoring_guide=SCORING_GUIDE, area_schema=area_schema)
+        for name in assets.area_names
+    })
+    return assets
+
+def parse_report_assets(raw: bytes, path: str = "", mtime: float = 0.0) -> ReportAssets:
+    """Version and compile a serialized schema. Raises if it is not valid JSON Schema"""
+    schema = json.loads(raw)
+    Draft7Validator.check_schema(schema)
+    version = str(schema.get("version") or hashlib.sha256(raw).hexdigest()[:12])
+    return build_report_assets(schema, version=version, path=path, mtime=mtime)
+
+def load_report_assets(path: str = SCHEMA_PATH) -> ReportAssets:
+    """Read, version and compile the schema at path. A missing or invalid schema yields empty assets"""
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+        return parse_report_assets(raw, path=path, mtime=os.path.getmtime(path))
+    except Exception as e:
+        logger.error(f"Failed to load schema: {e}")
+        return build_report_assets({}, version="missing", path=path)
+
+_assets: Optional[ReportAssets] = None
+_assets_lock = threading.Lock()
+
+def get_report_assets() -> ReportAssets:
+    """Return the process-wide report assets, loading them on first use (normally in prewarm)"""
+    global _assets
+    assets = _assets
+    if assets is None:
+        with _assets_lock:
+            if _assets is None:
+                _assets = load_report_assets()
+                logger.info(f"Loaded report assets (schema version {_assets.version})")
+            assets = _assets
+    return assets
+
+def reload_report_assets(path: Optional[str] = None, force: bool = False) -> ReportAssets:
+    """Swap in a freshly compiled registry if the schema file (or its version) changed. Returns the active assets"""
+    global _assets
+    with _assets_lock:
+        current = _assets
+        path = path or (current.path if current else SCHEMA_PATH)
+        if not force and current and current.path == path:
+            try:
+                if os.path.getmtime(path) == current.mtime:
+                    return current
+            except OSError:
+                return current
+        candidate = load_report_assets(path)
+        if not candidate.schema and current is not None:
+            logger.warning(f"Keeping schema version {current.version}; {path} could not be loaded")
+            return current
+        if current is None or candidate.version != current.version:
+            logger.info(f"Report assets now at schema version {candidate.version}")
+        _assets = candidate
+        return _assets
+
+def set_report_assets(assets: Optional[ReportAssets]):
+    """Install an already-compiled bundle as the process-wide registry (None forces a load on next use)"""
+    global _assets
+    with _assets_lock:
+        _assets = assets
@@ -0,0 +1,268 @@
+"""Regenerate reports from the transcripts already in S3, e.g. after a schema or prompt change.
+Transcripts are the sealed transcript journals (journal/<interview_id>/manifest.json) and, for
+interviews whose journal could not be sealed or that predate it, the full texts under transcriptions/.
+
+    python src/report_batch.py [--prefix PREFIX ...] [--concurrency 4] [--requests-per-minute 120] [--limit N] [--checkpoint PATH]
+
+Progress is checkpointed to a local JSON file after every transcript, so an interrupted run
+resumes where it stopped. Reports are cached in S3 by (transcript hash, schema version, prompt
+version): a transcript whose cache entry exists is skipped, so re-running after a partial
+failure, or with nothing changed, makes no LLM calls.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+from report_assets import PROMPT_VERSION, get_report_assets
+from report_generator import ReportGenerator
+from s3_handler import S3Handler
+from transcript_compactor import COMPACTION_VERSION, compact_transcript
+from transcript_journal import JOURNAL_PREFIX, TranscriptJournal
+from transcription_manager import conversation_from_entries, conversation_from_transcription
+
+logger = logging.getLogger("report_batch")
+
+TRANSCRIPTS_PREFIX = "transcriptions/"
+CACHE_PREFIX = "report_cache/"
+BATCH_CONCURRENCY = 4
+BATCH_REQUESTS_PER_MINUTE = 120.0  # LLM calls, across all concurrent transcripts
+CHECKPOINT_PATH = os.path.join(tempfile.gettempdir(), "report_batch_checkpoint.json")
+
+def cache_key(transcript_hash: str, schema_version: str, prompt_version: str) -> str:
+    return f"{CACHE_PREFIX}{schema_version}/{prompt_version}/{transcript_hash}.json"
+
+def parse_transcript_key(s3_key: str) -> Optional[Dict[str, str]]:
+    """transcriptions/[dt=YYYY-MM-DD/]{interview_id}_{YYYYmmdd}_{HHMMSS}.txt -> interview_id and timestamp.
+    Keys written before the date partitioning have no dt= level"""
+    name = s3_key[len(TRANSCRIPTS_PREFIX):] if s3_key.startswith(TRANSCRIPTS_PREFIX) else ""
+    if name.startswith("dt="):
+        name = name.split("/", 1)[1] if "/" in name else ""
+    if not name.endswith(".txt"):
+        return None
+    parts = name[:-len(".txt")].rsplit("_", 2)
+    if len(parts) != 3 or not all(parts):
+        return None
+    return {"interview_id": parts[0], "timestamp": f"{parts[1]}_{parts[2]}"}
+
+def is_transcript_key(s3_key: str) -> bool:
+    """A full transcript text or a transcript journal's manifest (its chunks are read through it)"""
+    if s3_key.startswith(JOURNAL_PREFIX):
+        return s3_key.endswith("/manifest.json")
+    return parse_transcript_key(s3_key) is not None
+
+class RateLimiter:
+    """Token bucket: at most `per_minute` acquisitions per minute, bursting up to `burst`"""
+
+    def __init__(self, per_minute: float, burst: int = 1):
+        self.interval = 60.0 / per_minute
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) / self.interval)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * self.interval)
+
+class _RateLimitedChat:
+    def __init__(self, llm, limiter: RateLimiter, kwargs: Dict[str, Any]):
+        self._llm = llm
+        self._limiter = limiter
+        self._kwargs = kwargs
+        self._stream = None
+
+    async def __aenter__(self):
+        await self._limiter.acquire()
+        self._stream = self._llm.chat(**self._kwargs)
+        return await self._stream.__aenter__()
+
+    async def __aexit__(self, *exc):
+        return await self._stream.__aexit__(*exc)
+
+class RateLimitedLLM:
+    """Wraps an LLM so every `chat` waits for the shared rate limiter before the request is made"""
+
+    def __init__(self, llm, limiter: RateLimiter):
+        self.llm = llm
+        self.limiter = limiter
+
+    def chat(self, **kwargs):
+        return _RateLimitedChat(self.llm, self.limiter, kwargs)
+
+class BatchCheckpoint:
+    """Keys finished by earlier runs with the same schema and prompt versions, persisted atomically"""
+
+    def __init__(self, path: str, schema_version: str, prompt_version: str):
+        self.path = path
+        self.versions = {"schema_version": schema_version, "prompt_version": prompt_version}
+        self.done: Dict[str, str] = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("versions") == self.versions:
+                self.done = state.get("done", {})
+            else:
+                logger.info(f"Checkpoint {path} is for {state.get('versions')}, starting over")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint {path}: {e}")
+
+    def mark_done(self, transcript_key: str, result_key: str):
+        self.done[transcript_key] = result_key
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"versions": self.versions, "done": self.done}, f)
+        os.replace(temp_path, self.path)
+
+@dataclass
+class BatchResult:
+    generated: List[str] = field(default_factory=list)
+    cached: List[str] = field(default_factory=list)
+    resumed: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    duration_s: float = 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {"generated": len(self.generated), "cached": len(self.cached), "resumed": len(self.resumed),
+                "failed": len(self.failed), "duration_s": round(self.duration_s, 1)}
+
+class ReportBatch:
+    """Streams transcript keys from S3 into `concurrency` workers through a bounded queue, so
+    neither the listing nor the transcripts are ever held in memory all at once"""
+
+    def __init__(self, report_generator: ReportGenerator, s3_handler: S3Handler, checkpoint_path: str = CHECKPOINT_PATH,
+                 concurrency: int = BATCH_CONCURRENCY, requests_per_minute: float = BATCH_REQUESTS_PER_MINUTE):
+        report_generator.llm = RateLimitedLLM(report_generator.llm, RateLimiter(requests_per_minute, burst=concurrency))
+        self.report_generator = report_generator
+        self.s3_handler = s3_handler
+        self.concurrency = concurrency
+        self.schema_version = get_report_assets().version
+        self.prompt_version = f"{PROMPT_VERSION}.c{COMPACTION_VERSION}" # the compaction rules shape the prompt too
+        self.checkpoint = BatchCheckpoint(checkpoint_path, self.schema_version, self.prompt_version)
+
+    async def _read_transcript(self, transcript_key: str):
+        """The interview id and timestamp of a transcript and its conversation, or None if the key is not a transcript"""
+        if transcript_key.startswith(JOURNAL_PREFIX) and transcript_key.endswith("/manifest.json"):
+            journal = await TranscriptJournal.read(self.s3_handler, transcript_key)
+            if journal is None:
+                raise RuntimeError("transcript journal could not be downloaded")
+            manifest, entries = journal
+            timestamp = manifest.get("timestamp") or datetime.fromisoformat(manifest["sealed_at"]).strftime("%Y%m%d_%H%M%S")
+            return {"interview_id": manifest["interview_id"], "timestamp": timestamp}, conversation_from_entries(entries)
+        parsed = parse_transcript_key(transcript_key)
+        if parsed is None:
+            return None
+        body = await self.s3_handler.download_bytes(transcript_key)
+        if body is None:
+            raise RuntimeError("transcript could not be downloaded")
+        return parsed, conversation_from_transcription(body.decode("utf-8"))
+
+    async def _process(self, transcript_key: str, result: BatchResult):
+        transcript = await self._read_transcript(transcript_key)
+        if transcript is None:
+            logger.warning(f"Skipping {transcript_key}: not a transcript key")
+            return
+        parsed, conversation = transcript
+        key = cache_key(hashlib.sha256(conversation.encode("utf-8")).hexdigest(), self.schema_version, self.prompt_version)
+        if await self.s3_handler.exists(key):
+            result.cached.append(transcript_key)
+        else:
+            compacted = await asyncio.to_thread(compact_transcript, conversation)
+            report_data = await self.report_generator.generate_transcript_report(compacted.text, parsed["interview_id"])
+            if not report_data:
+                raise RuntimeError("report generation failed")
+            report_data["metadata"].update(schema_version=self.schema_version, prompt_version=self.prompt_version,
+                                           transcript_tokens=compacted.summary())
+            report_key = await self.s3_handler.upload_report(parsed["interview_id"], report_data, timestamp=parsed["timestamp"],
+                                                             schema_version=self.schema_version)
+            if not report_key:
+                raise RuntimeError("report upload failed")
+            await self._update_index(parsed, transcript_key, report_key)
+            # the cache entry is written last: it marks the report as complete
+            if not await self.s3_handler.upload_bytes(key, json.dumps(report_data, ensure_ascii=False).encode("utf-8"), compressed=True,
+                                                     ContentType="application/json; charset=utf-8"):
+                raise RuntimeError("cache upload failed")
+            result.generated.append(transcript_key)
+        self.checkpoint.mark_done(transcript_key, key)
+
+    async def _update_index(self, parsed: Dict[str, str], transcript_key: str, report_key: str):
+        """Point the interview's index at the rewritten report (its size and hash changed), keeping the other artifacts"""
+        index = await self.s3_handler.download_index(parsed["interview_id"])
+        artifacts = {name: entry["key"] for name, entry in (index or {}).get("artifacts", {}).items()}
+        artifacts.update(transcription=transcript_key, report=report_key)
+        if not await self.s3_handler.upload_index(parsed["interview_id"], parsed["timestamp"], artifacts):
+            raise RuntimeError("index upload failed")
+
+    async def _worker(self, queue: asyncio.Queue, result: BatchResult):
+        while True:
+            transcript_key = await queue.get()
+            try:
+                if transcript_key is None:
+                    return
+                await self._process(transcript_key, result)
+            except Exception as e:
+                logger.error(f"Failed to reprocess {transcript_key}: {e}")
+                result.failed[transcript_key] = str(e)
+            finally:
+                queue.task_done()
+
+    async def run(self, prefixes: Sequence[str] = (JOURNAL_PREFIX, TRANSCRIPTS_PREFIX), limit: Optional[int] = None) -> BatchResult:
+        started = time.perf_counter()
+        result = BatchResult()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [asyncio.create_task(self._worker(queue, result)) for _ in range(self.concurrency)]
+        logger.info(f"Reprocessing {', '.join(prefixes)} with schema {self.schema_version}, prompts {self.prompt_version}")
+        try:
+            queued = 0
+            for prefix in prefixes:
+                async for entry in self.s3_handler.list_objects(prefix):
+                    if limit is not None and queued >= limit:
+                        break
+                    if not is_transcript_key(entry["Key"]): # journal chunks
+                        continue
+                    if entry["Key"] in self.checkpoint.done:
+                        result.resumed.append(entry["Key"])
+                        continue
+                    await queue.put(entry["Key"])
+                    queued += 1
+        finally:
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        result.duration_s = time.perf_counter() - started
+        logger.info(f"Batch finished: {result.summary()}")
+        return result
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Regenerate reports from the transcripts stored in S3")
+    parser.add_argument("--prefix", action="append", dest="prefixes", help=f"repeatable; default {JOURNAL_PREFIX} and {TRANSCRIPTS_PREFIX}")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--requests-per-minute", type=float, default=BATCH_REQUESTS_PER_MINUTE)
+    parser.add_argument("--limit", type=int, default=None, help="process at most this many new transcripts")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    batch = ReportBatch(ReportGenerator(), S3Handler(), checkpoint_path=args.checkpoint,
+                        concurrency=args.concurrency, requests_per_minute=args.requests_per_minute)
+    result = asyncio.run(batch.run(prefixes=args.prefixes or (JOURNAL_PREFIX, TRANSCRIPTS_PREFIX), limit=args.limit))
+    print(json.dumps(result.summary()))
+    return 1 if result.failed else 0
+
+if __name__ == "__main__":
+    exit(main())
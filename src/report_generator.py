@@ -1,104 +1,230 @@
+import asyncio
 import json
 import logging
+import os
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Any, Callable, Dict, List, Optional
 import jsonschema
-from livekit.plugins import openai
+from livekit.plugins import google, openai
 from livekit.agents.llm import ChatContext
+from provider_router import HedgedLLM
+from json_stream import JSONStreamError, StreamingJSONParser
+from report_assets import SYSTEM_PROMPT, ReportAssets, get_report_assets
+from incremental_report import assemble_report, merge_insights, split_by_area
+from report_repair import REPAIR_MAX_ROUNDS, apply_repairs, build_repair_prompt, collect_repair_targets
 
 logger = logging.getLogger("report_generator")
 
+REPORT_MAX_ATTEMPTS = 2
+MAX_CONCURRENT_SHARDS = 4
+REPORT_MODEL = "gpt-4o"
+REPORT_FALLBACK_MODEL = os.getenv("REPORT_FALLBACK_MODEL", "gemini-2.0-flash")
+
+def build_report_llm(client=None):
+    """gpt-4o, hedged against and failing over to REPORT_FALLBACK_MODEL on Google when credentials for it are set"""
+    backends = [openai.LLM(model=REPORT_MODEL, client=client)]
+    if os.getenv("GOOGLE_API_KEY") or os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
+        backends.append(google.LLM(model=REPORT_FALLBACK_MODEL, temperature=0.2))
+    return HedgedLLM(backends, role="report")
+
 class ReportGenerator:
-    def __init__(self):
-        self.llm = openai.LLM(model="gpt-4o")
-        self.schema = self._load_schema()
-    
-    def _load_schema(self) -> Dict[str, Any]:
-        """Load the JSON schema for validation"""
-        try:
-            with open("src/schema/schema.json", "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"Failed to load schema: {e}")
-            return {}
+    def __init__(self, llm=None, assets: Optional[ReportAssets] = None):
+        self.llm = llm if llm is not None else build_report_llm()
+        self._assets = assets
+
+    @property
+    def assets(self) -> ReportAssets:
+        """The pinned assets if any, else the process-wide ones"""
+        return self._assets or get_report_assets()
+
+    def for_assets(self, assets: ReportAssets) -> "ReportGenerator":
+        """A generator sharing this one's LLM client but pinned to `assets`, e.g. the schema a session started with"""
+        return ReportGenerator(self.llm, assets)
+
+    @property
+    def schema(self) -> Dict[str, Any]:
+        return self.assets.schema
     
     def _get_report_prompt(self, transcription: str) -> str:
         """Generate the prompt for report generation"""
-        return f"""
-TRANSCRIÇÃO DA ENTREVISTA:
-{transcription}
-
-INSTRUÇÕES:
-1. Analise cuidadosamente toda a transcrição da entrevista
-2. Extraia informações sobre a startup
-3. Preencha todos os campos do schema
-4. Forneça insights sobre pontos fortes, lacunas críticas e próximos passos
-
-PARA CÁLCULO DE SCORE DA ÁREA:
-Baseado em evidências de maturidade e capacidades demonstradas:
-Faixa 1-2: Processos informais, aprendizado inicial, dependência total de founders
-Faixa 3-4: Sistemas básicos implementados, processos documentados, métricas iniciais
-Faixa 5-6: Automação, especialização, operações independentes dos founders
-Faixa 7-8: Operações avançadas, multi-canal/região, otimização contínua
-Faixa 9: Liderança de categoria, benchmark da indústria, inovação
-
-PARA CÁLCULO DE CONFIANÇA:
-Evidências específicas (números, métricas, ferramentas, processos): +40%
-Consistência narrativa (coerência lógica da resposta): +40%
-Exemplos concretos e detalhamento: +20%
-
-FORMATO DE RESPOSTA:
-Retorne APENAS um JSON válido seguindo exatamente o seguinte schema fornecido. Não inclua texto adicional antes ou depois do JSON.
-Schema:
-{json.dumps(self.schema, indent=2)}
-"""
+        return self.assets.report_prompt_prefix + transcription + "\n"
     
-    async def generate_report(self, transcription: str, interview_id: str) -> Optional[Dict[str, Any]]:
-        """ Generate a structured report from the interview transcription """
+    def _get_segment_prompt(self, segment: str, area_name: Optional[str]) -> str:
+        """Generate the prompt for extracting one area (or only startup info) from a transcript segment"""
+        if area_name is None:
+            return self.assets.startup_info_prompt_prefix + segment + "\n"
+        return self.assets.area_prompt_prefixes[area_name] + segment + "\n"
+
+    async def extract_segment(self, segment: str, area_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """ Extract a provisional area object (and any startup info) from one transcript segment """
         try:
-            prompt = self._get_report_prompt(transcription)
-            logger.info("Generating report from transcription...")
+            return await self._stream_json(SYSTEM_PROMPT, self._get_segment_prompt(segment, area_name))
+        except Exception as e:
+            logger.error(f"Failed to extract segment for area {area_name}: {e}")
+            return None
+
+    async def classify(self, startup_info: Dict[str, Any], areas: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """ final_classification (group, faixa, overall score, momentum) judged from the area results. None if the call fails """
+        assessment = {"startup_info": startup_info,
+                      "areas": [{key: value for key, value in area.items() if key != "evidences"} for area in areas]}
+        try:
+            result = await self._stream_json(SYSTEM_PROMPT, self.assets.classification_prompt_prefix + json.dumps(assessment, ensure_ascii=False) + "\n")
+        except Exception as e:
+            logger.error(f"Failed to classify startup: {e}")
+            return None
+        classification = result.get("final_classification") if isinstance(result, dict) else None
+        return classification if isinstance(classification, dict) else None
+
+    async def reduce_areas(self, interview_id: str, startup_info: Dict[str, Any], areas_by_name: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """ Assemble per-area results into a report and classify it. If classification fails the report lacks
+        final_classification, which repair_report then regenerates from the transcript """
+        report_data = assemble_report(interview_id, startup_info, areas_by_name)
+        classification = await self.classify(report_data["startup_info"], report_data["areas"])
+        if classification:
+            report_data["final_classification"] = classification
+        return report_data
+
+    async def _stream_json(self, system_prompt: str, prompt: str, array_key: Optional[str] = None,
+                           on_item: Optional[Callable[[Any], None]] = None) -> Dict[str, Any]:
+        """Stream a completion through StreamingJSONParser, retrying early when the structure is malformed"""
+        last_error: Optional[Exception] = None
+        for attempt in range(1, REPORT_MAX_ATTEMPTS + 1):
             chat_ctx = ChatContext()
-            chat_ctx.add_message(content="Você é um consultor especialista em análise de startups e deve gerar um relatório estruturado baseado na entrevista transcrita.", role="system")
+            chat_ctx.add_message(content=system_prompt, role="system")
             chat_ctx.add_message(content=prompt, role="user")
-            stream = self.llm.chat(chat_ctx=chat_ctx)
-            report_text = ""
-            async for chunk in stream:
-                if chunk.delta and chunk.delta.content:
-                    report_text += chunk.delta.content
+            parser = StreamingJSONParser(array_key=array_key)
+            try:
+                async with self.llm.chat(chat_ctx=chat_ctx) as stream:
+                    async for chunk in stream:
+                        if chunk.delta and chunk.delta.content:
+                            for item in parser.feed(chunk.delta.content):
+                                if on_item:
+                                    on_item(item)
+                return parser.close()
+            except JSONStreamError as e:
+                last_error = e
+                logger.warning(f"Malformed JSON from LLM (attempt {attempt}/{REPORT_MAX_ATTEMPTS}): {e}")
+        raise last_error
+
+    async def generate_report(self, transcription: str, interview_id: str,
+                              on_area: Optional[Callable[[Dict[str, Any]], None]] = None) -> Optional[Dict[str, Any]]:
+        """ Generate a structured report from the interview transcription. on_area is called as each area closes in the stream """
+        streamed_areas: Dict[str, Dict[str, Any]] = {}
+        def area_completed(area: Dict[str, Any]):
+            if not isinstance(area, dict):
+                logger.warning(f"Report area streamed is not an object, leaving it to validation: {area!r}")
+                return
+            logger.info(f"Report area streamed: {area.get('area_name')} (score {area.get('score')})")
+            if area.get("area_name"):
+                streamed_areas[area["area_name"]] = area
+            if on_area:
+                on_area(area)
+        try:
+            prompt = self._get_report_prompt(transcription)
+            logger.info("Generating report from transcription...")
             try:
-                if report_text.startswith("```json"): # Remove any markdown formatting if present
-                    report_text = report_text[7:]
-                if report_text.endswith("```"):
-                    report_text = report_text[:-3]
-                report_data = json.loads(report_text)
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse JSON response: {e}")
-                logger.error(f"Response text: {report_text[:500]}...")
+                report_data = await self._stream_json(SYSTEM_PROMPT, prompt, array_key="areas", on_item=area_completed)
+            except JSONStreamError as e:
+                if not streamed_areas:
+                    raise
+                logger.warning(f"Salvaging {len(streamed_areas)} streamed area(s) from malformed report JSON: {e}")
+                report_data = self._salvage_report(list(streamed_areas.values()))
             if "metadata" not in report_data:
                 report_data["metadata"] = {}
             report_data["metadata"]["interview_id"] = interview_id
             report_data["metadata"]["date"] = datetime.now().isoformat()
             report_data["metadata"]["interviewer"] = "Atena - Startup Diagnosis S2S Agent"
-            if self.schema:
-                try:
-                    jsonschema.validate(report_data, self.schema)
-                    logger.info("Report validation successful")
-                except jsonschema.ValidationError as e:
-                    logger.warning(f"Report validation failed: {e}")
+            if await self.repair_report(report_data, transcription):
+                logger.info("Report validation successful")
+            else:
+                logger.warning("Report is still invalid after repair")
             return report_data
         except Exception as e:
             logger.error(f"Failed to generate report: {e}")
             return None
     
+    async def generate_sharded_report(self, transcription: str, interview_id: str,
+                                      max_concurrency: int = MAX_CONCURRENT_SHARDS) -> Optional[Dict[str, Any]]:
+        """ Map-reduce report: one concurrent extraction per area over that area's transcript spans, then a reduce that classifies.
+        The result is not validated. Returns None when no area could be scored, so the caller can fall back to generate_report """
+        spans = split_by_area(transcription)
+        area_names = [name for name in self.assets.area_names if name in spans]
+        semaphore = asyncio.Semaphore(max_concurrency)
+        async def extract(span: str, area_name: Optional[str]):
+            async with semaphore:
+                return await self.extract_segment(span, area_name)
+        opening = spans.get(None)
+        logger.info(f"Generating sharded report over {len(area_names)} area(s): {area_names}")
+        results = await asyncio.gather(
+            extract(opening, None) if opening else asyncio.sleep(0),
+            *(extract(spans[name], name) for name in area_names),
+        )
+        opening_result, area_results = results[0], results[1:]
+        areas = {name: {**result["area"], "area_name": name}
+                 for name, result in zip(area_names, area_results) if result and isinstance(result.get("area"), dict)}
+        if not areas:
+            logger.warning("Sharded report produced no areas")
+            return None
+        startup_info: Dict[str, Any] = {}
+        for result in (opening_result, *area_results):
+            for key, value in ((result or {}).get("startup_info") or {}).items():
+                if value is not None:
+                    startup_info.setdefault(key, value) # the opening, where the startup introduces itself, wins
+        required = self.schema.get("properties", {}).get("startup_info", {}).get("required", [])
+        if any(field not in startup_info for field in required):
+            result = await self.extract_segment(transcription, None) # small output, so cheap even over the whole transcript
+            startup_info.update({k: v for k, v in ((result or {}).get("startup_info") or {}).items() if v is not None and k not in startup_info})
+        return await self.reduce_areas(interview_id, startup_info, areas)
+
+    async def generate_transcript_report(self, transcription: str, interview_id: str, sharded: bool = True) -> Optional[Dict[str, Any]]:
+        """ Report from a finished transcript: the sharded report if it can be repaired to a valid one, else a single full-report call """
+        if sharded:
+            logger.info("Generating sharded report...")
+            report_data = await self.generate_sharded_report(transcription, interview_id)
+            if report_data and await self.repair_report(report_data, transcription):
+                return report_data
+        logger.info("Generating structured report...")
+        return await self.generate_report(transcription, interview_id)
+
+    @staticmethod
+    def _salvage_report(areas: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Rebuild what can be derived locally from areas that streamed before the JSON broke; repair fills the rest,
+        final_classification included"""
+        scored = [area for area in areas if isinstance(area.get("score"), (int, float)) and isinstance(area.get("faixa"), int)]
+        report_data: Dict[str, Any] = {"areas": areas}
+        if scored:
+            report_data["insights"] = merge_insights(scored)
+        return report_data
+
+    async def repair_report(self, report_data: Dict[str, Any], transcription: Optional[str] = None,
+                            max_rounds: int = REPAIR_MAX_ROUNDS) -> bool:
+        """ Fix schema violations in place by regenerating only the failing sub-objects. Returns True once the report is valid """
+        validator = self.assets.validator
+        if validator is None:
+            logger.warning("No schema loaded for validation")
+            return False
+        for round_number in range(1, max_rounds + 1):
+            targets = collect_repair_targets(validator, report_data)
+            if not targets:
+                break
+            logger.info(f"Repairing report (round {round_number}/{max_rounds}): {[target.errors for target in targets]}")
+            try:
+                patches = await self._stream_json(SYSTEM_PROMPT, build_repair_prompt(targets, report_data, self.schema, transcription))
+            except Exception as e:
+                logger.error(f"Report repair failed: {e}")
+                break
+            apply_repairs(report_data, targets, patches)
+        return validator.is_valid(report_data)
+
     def validate_report(self, report_data: Dict[str, Any]) -> bool:
-        """ Validate report data against the schema (True if valid, False otherwise)v"""
-        if not self.schema:
+        """ Validate report data against the schema (True if valid, False otherwise)"""
+        validator = self.assets.validator
+        if validator is None:
             logger.warning("No schema loaded for validation")
             return False
         try:
-            jsonschema.validate(report_data, self.schema)
+            validator.validate(report_data)
             return True
         except jsonschema.ValidationError as e:
             logger.error(f"Validation error: {e}")
-            return False
\ No newline at end of file
+            return False
@@ -0,0 +1,127 @@
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from jsonschema import Draft7Validator
+
+logger = logging.getLogger("report_repair")
+
+REPAIR_MAX_ROUNDS = 2
+MISSING_DATA_VALIDATORS = {"required", "minItems"}  # errors the model can only fix by looking at the transcript again
+
+Path = Tuple[Any, ...]
+
+REPAIR_PROMPT_TEMPLATE = """
+INSTRUÇÕES:
+Alguns trechos de um relatório de diagnóstico de startup não passaram na validação do schema.
+Para cada trecho abaixo, identificado por seu caminho JSON Pointer, corrija apenas os erros listados, respeitando o schema do trecho. Mantenha os valores que já estão corretos.
+{transcript_note}
+FORMATO DE RESPOSTA:
+Retorne APENAS um JSON válido cujas chaves são os caminhos abaixo e cujos valores são os trechos corrigidos completos. Não inclua texto adicional antes ou depois do JSON.
+
+TRECHOS COM ERRO:
+{targets}
+"""
+
+TRANSCRIPT_NOTE = "Campos ausentes devem ser preenchidos com base na transcrição ao final.\n"
+
+def to_pointer(path: Path) -> str:
+    return "".join(f"/{str(part).replace('~', '~0').replace('/', '~1')}" for part in path)
+
+def get_at(document: Any, path: Path) -> Any:
+    for part in path:
+        document = document[part]
+    return document
+
+def set_at(document: Any, path: Path, value: Any):
+    parent = get_at(document, path[:-1])
+    if isinstance(parent, list) and path[-1] == len(parent):
+        parent.append(value)
+    else:
+        parent[path[-1]] = value
+
+def schema_at(schema: Dict[str, Any], path: Path) -> Dict[str, Any]:
+    """The schema fragment that validates the value at path (properties/items walk, no $ref support)"""
+    for part in path:
+        if isinstance(part, int):
+            schema = schema.get("items", {})
+        else:
+            schema = schema.get("properties", {}).get(part, {})
+    return schema
+
+@dataclass
+class RepairTarget:
+    """One failing sub-object of the report and the validator messages that apply to it"""
+    path: Path
+    errors: List[str] = field(default_factory=list)
+    needs_transcript: bool = False
+
+def collect_repair_targets(validator: Draft7Validator, report: Dict[str, Any]) -> List[RepairTarget]:
+    """Group every validation error under the smallest object that can be regenerated on its own.
+
+    A bad scalar (an out-of-range faixa) is repaired together with the object that holds it, so the
+    model sees its siblings; a missing required property is repaired at the object that lacks it,
+    except at the root, where each missing top-level section becomes its own target.
+    """
+    targets: Dict[Path, RepairTarget] = {}
+    def add(target_path: Path, message: str, needs_transcript: bool):
+        target = targets.setdefault(target_path, RepairTarget(path=target_path))
+        target.errors.append(message)
+        target.needs_transcript |= needs_transcript
+    for error in validator.iter_errors(report):
+        path = tuple(error.absolute_path)
+        message = f"{to_pointer(path) or '/'}: {error.message}"
+        needs_transcript = error.validator in MISSING_DATA_VALIDATORS
+        if not path and error.validator == "required":
+            for missing in error.validator_value:
+                if missing not in error.instance:
+                    add((missing,), message, needs_transcript)
+        elif not path: # the root itself is malformed; nothing smaller to repair
+            continue
+        elif error.validator in ("required", "additionalProperties") or len(path) == 1:
+            add(path, message, needs_transcript)
+        else:
+            add(path[:-1], message, needs_transcript)
+    for path in sorted(targets, key=len, reverse=True): # a target nested in another one is covered by it
+        outer = next((other for other in targets if len(other) < len(path) and path[:len(other)] == other), None)
+        if outer is not None:
+            targets[outer].errors.extend(targets[path].errors)
+            targets[outer].needs_transcript |= targets[path].needs_transcript
+            del targets[path]
+    return list(targets.values())
+
+def build_repair_prompt(targets: List[RepairTarget], report: Dict[str, Any], schema: Dict[str, Any], transcription: Optional[str]) -> str:
+    sections = []
+    for target in targets:
+        try:
+            current = get_at(report, target.path)
+        except (KeyError, IndexError, TypeError):
+            current = None
+        sections.append("\n".join([
+            f"Caminho: {to_pointer(target.path)}",
+            "Erros:",
+            *(f"- {message}" for message in target.errors),
+            f"Valor atual: {json.dumps(current, ensure_ascii=False)}",
+            f"Schema: {json.dumps(schema_at(schema, target.path), ensure_ascii=False)}",
+        ]))
+    needs_transcript = transcription is not None and any(target.needs_transcript for target in targets)
+    prompt = REPAIR_PROMPT_TEMPLATE.format(transcript_note=TRANSCRIPT_NOTE if needs_transcript else "", targets="\n\n".join(sections))
+    if needs_transcript:
+        prompt += "\nTRANSCRIÇÃO DA ENTREVISTA:\n" + transcription + "\n"
+    return prompt
+
+def apply_repairs(report: Dict[str, Any], targets: List[RepairTarget], patches: Dict[str, Any]) -> int:
+    """Patch the model's corrected fragments into report in place. Only requested paths are accepted"""
+    allowed = {to_pointer(target.path): target.path for target in targets}
+    applied = 0
+    for pointer, value in patches.items():
+        path = allowed.get(pointer)
+        if path is None:
+            logger.warning(f"Ignoring repair for unrequested path {pointer}")
+            continue
+        try:
+            set_at(report, path, value)
+            applied += 1
+        except (KeyError, IndexError, TypeError) as e:
+            logger.warning(f"Could not apply repair at {pointer}: {e}")
+    return applied
@@ -1,62 +1,377 @@
+import asyncio
 import boto3
+import gzip
+import hashlib
 import json
 import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, Any, Optional
-from botocore.exceptions import ClientError
+from typing import AsyncIterator, Dict, Any, List, Optional
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 import os
 from dotenv import load_dotenv
 
+try:
+    import zstandard
+except ImportError:  # optional: zstd is only used when installed and selected
+    zstandard = None
+
 load_dotenv(".env.local")
 logger = logging.getLogger("s3_handler")
 
-class S3Handler:
-    def __init__(self):
-        self.s3_client = boto3.client(
-            's3',
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-            region_name='us-east-2'
+S3_REGION = 'us-east-2'
+MAX_CONCURRENT_UPLOADS = int(os.getenv("S3_MAX_CONCURRENT_UPLOADS", "8"))
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024  # S3 requires every part except the last to be >= 5 MiB
+MAX_UPLOAD_ATTEMPTS = 4
+RETRY_BASE_DELAY = 0.25
+NON_RETRYABLE_ERRORS = {"AccessDenied", "NoSuchBucket", "InvalidAccessKeyId", "SignatureDoesNotMatch", "InvalidRequest", "EntityTooSmall", "NoSuchKey", "NotFound", "404"}
+MISSING_OBJECT_ERRORS = {"NoSuchKey", "NotFound", "404"}
+CONTENT_CODING = os.getenv("S3_CONTENT_CODING", "gzip")  # gzip, zstd (needs the zstandard package) or identity
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+INDEX_PREFIX = "index/"
+
+_client = None
+_client_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+def get_s3_client():
+    """Return the process-wide boto3 client, sized for MAX_CONCURRENT_UPLOADS pooled connections"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = boto3.client(
+                's3',
+                aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                region_name=S3_REGION,
+                config=Config(max_pool_connections=MAX_CONCURRENT_UPLOADS, retries={'max_attempts': 1}, tcp_keepalive=True)
+            )
+        return _client
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Upload thread pool; its size is the per-process bound on concurrent S3 requests"""
+    global _executor
+    with _client_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_UPLOADS, thread_name_prefix="s3-upload")
+        return _executor
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0) # mtime=0: identical bodies give identical objects
+    if coding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return body
+
+def decompress(body: bytes, coding: Optional[str]) -> bytes:
+    if coding == "gzip":
+        return gzip.decompress(body)
+    if coding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Object is zstd-encoded but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(body) # handles frames without a content size
+    return body
+
+def resolve_content_coding(coding: str) -> str:
+    if coding == "zstd" and zstandard is None:
+        logger.warning("S3_CONTENT_CODING=zstd but zstandard is not installed, using gzip")
+        return "gzip"
+    if coding not in ("gzip", "zstd", "identity"):
+        raise ValueError(f"Unsupported S3_CONTENT_CODING '{coding}'")
+    return coding
+
+def artifact_key(kind: str, interview_id: str, timestamp: str, extension: str) -> str:
+    """{kind}/dt=YYYY-MM-DD/{interview_id}_{YYYYmmdd_HHMMSS}.{extension}: one prefix per day, so a day can be listed
+    or lifecycled on its own and query engines can prune by the dt partition"""
+    day = datetime.strptime(timestamp[:8], "%Y%m%d").strftime("%Y-%m-%d")
+    return f"{kind}/dt={day}/{interview_id}_{timestamp}.{extension}"
+
+def index_key(interview_id: str) -> str:
+    return f"{INDEX_PREFIX}{interview_id}.json"
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") not in NON_RETRYABLE_ERRORS
+    return isinstance(error, BotoCoreError)
+
+@dataclass
+class UploadStats:
+    """Timing record for a single object upload"""
+    key: str
+    size_bytes: int
+    duration_s: float
+    attempts: int
+    parts: int
+    success: bool
+
+class StreamingUpload:
+    """A multipart upload fed one part at a time while the body is still being produced. Every part but the
+    last must be at least 5 MiB; a body that never filled a part is written with a single put_object"""
+
+    def __init__(self, handler: "S3Handler", s3_key: str, **object_args):
+        self.handler = handler
+        self.s3_key = s3_key
+        self.object_args = object_args
+        self.upload_id: Optional[str] = None
+        self.parts: List[Dict[str, Any]] = []
+        self.size_bytes = 0
+        self.attempts = 0
+        self._started = time.perf_counter()
+
+    async def write_part(self, body: bytes):
+        handler = self.handler
+        if self.upload_id is None:
+            created, attempts = await handler._call_with_retries(
+                handler.s3_client.create_multipart_upload, Bucket=handler.bucket_name, Key=self.s3_key, **self.object_args)
+            self.upload_id, self.attempts = created["UploadId"], max(self.attempts, attempts)
+        part_number = len(self.parts) + 1
+        result, attempts = await handler._call_with_retries(
+            handler.s3_client.upload_part, Bucket=handler.bucket_name, Key=self.s3_key, UploadId=self.upload_id,
+            PartNumber=part_number, Body=body
         )
-        self.bucket_name = os.getenv('S3_BUCKET_NAME')
+        self.parts.append({"PartNumber": part_number, "ETag": result["ETag"]})
+        self.size_bytes += len(body)
+        self.attempts = max(self.attempts, attempts)
+
+    async def complete(self, tail: bytes) -> Optional[str]:
+        """Upload the remaining bytes as the last part and finish the object. Returns its key, or None on failure"""
+        if self.upload_id is None:
+            return await self.handler.upload_bytes(self.s3_key, tail, **self.object_args)
+        handler, success = self.handler, False
+        try:
+            if tail:
+                await self.write_part(tail)
+            _, attempts = await handler._call_with_retries(
+                handler.s3_client.complete_multipart_upload, Bucket=handler.bucket_name, Key=self.s3_key,
+                UploadId=self.upload_id, MultipartUpload={"Parts": self.parts}
+            )
+            self.attempts = max(self.attempts, attempts)
+            success = True
+            return self.s3_key
+        except (ClientError, BotoCoreError) as e:
+            logger.error(f"Failed to complete streaming upload {self.s3_key}: {e}")
+            await self.abort()
+            return None
+        finally:
+            stats = UploadStats(key=self.s3_key, size_bytes=self.size_bytes, duration_s=time.perf_counter() - self._started,
+                                attempts=self.attempts, parts=len(self.parts), success=success)
+            handler.upload_stats.append(stats)
+            logger.info(f"S3 streaming upload {self.s3_key}: {stats.size_bytes} bytes over {stats.duration_s:.0f}s ({stats.parts} part(s), success={stats.success})")
+
+    async def abort(self):
+        if self.upload_id is None:
+            return
+        try:
+            await self.handler._call(self.handler.s3_client.abort_multipart_upload, Bucket=self.handler.bucket_name,
+                                     Key=self.s3_key, UploadId=self.upload_id)
+        except Exception as e:
+            logger.warning(f"Failed to abort multipart upload {self.upload_id} for {self.s3_key}: {e}")
+        self.upload_id = None
+
+class S3Handler:
+    def __init__(self, client=None, bucket_name: Optional[str] = None, content_coding: str = CONTENT_CODING):
+        self.s3_client = client if client is not None else get_s3_client()
+        self.bucket_name = bucket_name or os.getenv('S3_BUCKET_NAME')
         if not self.bucket_name:
             raise ValueError("S3_BUCKET_NAME not found in environment variables")
-    
-    async def upload_transcription(self, interview_id: str, transcription: str) -> Optional[str]:
-        """ Upload the full transcription to S3 """
+        self.content_coding = resolve_content_coding(content_coding)
+        self.upload_stats: List[UploadStats] = []
+
+    def warm_connection(self):
+        """Open a pooled connection to the bucket ahead of the first upload (blocking; for prewarm)"""
+        self.s3_client.head_bucket(Bucket=self.bucket_name)
+
+    async def _call(self, fn, **kwargs) -> Any:
+        """Run a blocking client call on the upload pool so the event loop never waits on S3"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), lambda: fn(**kwargs))
+
+    async def _call_with_retries(self, fn, **kwargs) -> Any:
+        """Run a client call with exponential backoff and jitter; returns (result, attempts)"""
+        for attempt in range(1, MAX_UPLOAD_ATTEMPTS + 1):
+            try:
+                return await self._call(fn, **kwargs), attempt
+            except (ClientError, BotoCoreError) as e:
+                if attempt == MAX_UPLOAD_ATTEMPTS or not _is_retryable(e):
+                    raise
+                delay = RETRY_BASE_DELAY * (2 ** (attempt - 1)) * (1 + random.random())
+                logger.warning(f"S3 {getattr(fn, '__name__', 'call')} failed (attempt {attempt}/{MAX_UPLOAD_ATTEMPTS}), retrying in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def _multipart_upload(self, s3_key: str, body: bytes, **object_args) -> int:
+        """Upload body in MULTIPART_CHUNK_SIZE parts concurrently; returns the highest attempt count used"""
+        created, attempts = await self._call_with_retries(self.s3_client.create_multipart_upload, Bucket=self.bucket_name, Key=s3_key, **object_args)
+        upload_id = created["UploadId"]
+        async def upload_part(part_number: int, offset: int):
+            result, part_attempts = await self._call_with_retries(
+                self.s3_client.upload_part, Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id,
+                PartNumber=part_number, Body=body[offset:offset + MULTIPART_CHUNK_SIZE]
+            )
+            return {"PartNumber": part_number, "ETag": result["ETag"]}, part_attempts
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            s3_key = f"transcriptions/{interview_id}_{timestamp}.txt"
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=s3_key,
-                Body=transcription.encode('utf-8'),
-                ContentType='text/plain; charset=utf-8',
-                ContentEncoding='utf-8',
-                Metadata={'interview_id': interview_id, 'upload_timestamp': timestamp, 'content_type': 'transcription'}
+            results = await asyncio.gather(*(upload_part(i + 1, offset) for i, offset in enumerate(range(0, len(body), MULTIPART_CHUNK_SIZE))))
+            parts = [part for part, _ in results]
+            _, complete_attempts = await self._call_with_retries(
+                self.s3_client.complete_multipart_upload, Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id, MultipartUpload={"Parts": parts}
             )
-            logger.info(f"Transcription uploaded successfully: {s3_key}")
+            return max([attempts, complete_attempts] + [a for _, a in results])
+        except Exception:
+            try:
+                await self._call(self.s3_client.abort_multipart_upload, Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id)
+            except Exception as e:
+                logger.warning(f"Failed to abort multipart upload {upload_id} for {s3_key}: {e}")
+            raise
+
+    async def upload_bytes(self, s3_key: str, body: bytes, compressed: bool = False, **object_args) -> Optional[str]:
+        """Upload an object without blocking the event loop, using multipart above MULTIPART_THRESHOLD.
+        With `compressed`, the body is encoded with the handler's content coding (off the loop) and the
+        plaintext's sha256 and size are stored in the object metadata"""
+        started = time.perf_counter()
+        if compressed and self.content_coding != "identity":
+            object_args["Metadata"] = {**object_args.get("Metadata", {}), "content_sha256": hashlib.sha256(body).hexdigest(),
+                                       "uncompressed_size": str(len(body))}
+            object_args["ContentEncoding"] = self.content_coding
+            body = await self._call(compress, body=body, coding=self.content_coding)
+        parts = -(-len(body) // MULTIPART_CHUNK_SIZE) if len(body) > MULTIPART_THRESHOLD else 1
+        attempts, success = 0, False
+        try:
+            if parts > 1:
+                attempts = await self._multipart_upload(s3_key, body, **object_args)
+            else:
+                _, attempts = await self._call_with_retries(self.s3_client.put_object, Bucket=self.bucket_name, Key=s3_key, Body=body, **object_args)
+            success = True
             return s3_key
-        except ClientError as e:
-            logger.error(f"Failed to upload transcription: {e}")
+        except (ClientError, BotoCoreError) as e:
+            logger.error(f"Failed to upload {s3_key}: {e}")
             return None
-    
-    async def upload_report(self, interview_id: str, report_data: Dict[str, Any]) -> Optional[str]:
-        """ Upload the structured report JSON to S3 """
+        finally:
+            stats = UploadStats(key=s3_key, size_bytes=len(body), duration_s=time.perf_counter() - started, attempts=attempts, parts=parts, success=success)
+            self.upload_stats.append(stats)
+            logger.info(f"S3 upload {s3_key}: {stats.size_bytes} bytes in {stats.duration_s * 1000:.0f}ms ({stats.parts} part(s), {stats.attempts} attempt(s), success={stats.success})")
+
+    async def list_objects(self, prefix: str, page_size: int = 1000) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the listing entry (Key, Size, ETag, ...) of every object under prefix, fetching one page at a time"""
+        request = {"Bucket": self.bucket_name, "Prefix": prefix, "MaxKeys": page_size}
+        while True:
+            page, _ = await self._call_with_retries(self.s3_client.list_objects_v2, **request)
+            for entry in page.get("Contents", []):
+                yield entry
+            if not page.get("IsTruncated"):
+                return
+            request["ContinuationToken"] = page["NextContinuationToken"]
+
+    async def download_bytes(self, s3_key: str) -> Optional[bytes]:
+        """Read a whole object, decoding its Content-Encoding. Returns None if it does not exist or cannot be read"""
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            s3_key = f"reports/{interview_id}_{timestamp}.json"
-            json_content = json.dumps(report_data, indent=2, ensure_ascii=False)
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=s3_key,
-                Body=json_content.encode('utf-8'),
-                ContentType='application/json; charset=utf-8',
-                ContentEncoding='utf-8',
-                Metadata={'interview_id': interview_id, 'upload_timestamp': timestamp, 'content_type': 'report', 'schema_version': '1.0'}
-            )
-            logger.info(f"Report uploaded successfully: {s3_key}")
-            return s3_key
+            response, _ = await self._call_with_retries(self.s3_client.get_object, Bucket=self.bucket_name, Key=s3_key)
+            body = await self._call(response["Body"].read)
+            return await self._call(decompress, body=body, coding=response.get("ContentEncoding"))
         except ClientError as e:
-            logger.error(f"Failed to upload report: {e}")
+            if e.response.get("Error", {}).get("Code") not in MISSING_OBJECT_ERRORS:
+                logger.error(f"Failed to download {s3_key}: {e}")
             return None
+        except BotoCoreError as e:
+            logger.error(f"Failed to download {s3_key}: {e}")
+            return None
+
+    async def exists(self, s3_key: str) -> bool:
+        try:
+            await self._call_with_retries(self.s3_client.head_object, Bucket=self.bucket_name, Key=s3_key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in MISSING_OBJECT_ERRORS:
+                return False
+            raise
+
+    async def upload_transcription(self, interview_id: str, transcription: str, timestamp: Optional[str] = None) -> Optional[str]:
+        """ Upload the full transcription to S3 """
+        timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S") # a fixed timestamp makes retries overwrite the same key
+        s3_key = artifact_key("transcriptions", interview_id, timestamp, "txt")
+        uploaded_key = await self.upload_bytes(
+            s3_key,
+            transcription.encode('utf-8'),
+            compressed=True,
+            ContentType='text/plain; charset=utf-8',
+            Metadata={'interview_id': interview_id, 'upload_timestamp': timestamp, 'content_type': 'transcription'}
+        )
+        if uploaded_key:
+            logger.info(f"Transcription uploaded successfully: {s3_key}")
+        return uploaded_key
+
+    async def upload_report(self, interview_id: str, report_data: Dict[str, Any], timestamp: Optional[str] = None,
+                            schema_version: Optional[str] = None) -> Optional[str]:
+        """ Upload the structured report JSON to S3, tagged with the version of the schema it was generated
+        with (by default the one recorded in its metadata) """
+        timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+        s3_key = artifact_key("reports", interview_id, timestamp, "json")
+        json_content = json.dumps(report_data, indent=2, ensure_ascii=False)
+        metadata = {'interview_id': interview_id, 'upload_timestamp': timestamp, 'content_type': 'report'}
+        schema_version = schema_version or (report_data.get('metadata') or {}).get('schema_version')
+        if schema_version:
+            metadata['schema_version'] = str(schema_version)
+        uploaded_key = await self.upload_bytes(
+            s3_key,
+            json_content.encode('utf-8'),
+            compressed=True,
+            ContentType='application/json; charset=utf-8',
+            Metadata=metadata
+        )
+        if uploaded_key:
+            logger.info(f"Report uploaded successfully: {s3_key}")
+        return uploaded_key
+
+    async def upload_latency_profile(self, interview_id: str, profile: Dict[str, Any], timestamp: Optional[str] = None) -> Optional[str]:
+        """ Upload the per-interview voice latency profile next to the report """
+        timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+        s3_key = artifact_key("latency", interview_id, timestamp, "json")
+        uploaded_key = await self.upload_bytes(
+            s3_key,
+            json.dumps(profile, ensure_ascii=False).encode('utf-8'),
+            compressed=True,
+            ContentType='application/json; charset=utf-8',
+            Metadata={'interview_id': interview_id, 'upload_timestamp': timestamp, 'content_type': 'latency_profile'}
+        )
+        if uploaded_key:
+            logger.info(f"Latency profile uploaded successfully: {s3_key}")
+        return uploaded_key
+
+    async def describe_object(self, s3_key: str) -> Dict[str, Any]:
+        """Index entry for an uploaded object: key, stored and plaintext sizes, encoding and plaintext sha256"""
+        head, _ = await self._call_with_retries(self.s3_client.head_object, Bucket=self.bucket_name, Key=s3_key)
+        metadata = head.get("Metadata", {})
+        return {
+            "key": s3_key,
+            "content_type": head.get("ContentType"),
+            "content_encoding": head.get("ContentEncoding", "identity"),
+            "stored_bytes": head.get("ContentLength"),
+            "size_bytes": int(metadata["uncompressed_size"]) if "uncompressed_size" in metadata else head.get("ContentLength"),
+            "sha256": metadata.get("content_sha256"),
+        }
+
+    async def upload_index(self, interview_id: str, timestamp: str, artifacts: Dict[str, str]) -> Optional[str]:
+        """Write index/{interview_id}.json, mapping each artifact name to its key, sizes and hash, so everything
+        stored for an interview can be found with one GET instead of listing the date partitions"""
+        names = list(artifacts)
+        entries = await asyncio.gather(*(self.describe_object(artifacts[name]) for name in names))
+        index = {"interview_id": interview_id, "timestamp": timestamp, "artifacts": dict(zip(names, entries))}
+        s3_key = index_key(interview_id)
+        uploaded_key = await self.upload_bytes(
+            s3_key,
+            json.dumps(index, indent=2, ensure_ascii=False).encode('utf-8'),
+            ContentType='application/json; charset=utf-8',
+            Metadata={'interview_id': interview_id, 'upload_timestamp': timestamp, 'content_type': 'index'}
+        )
+        if uploaded_key:
+            logger.info(f"Interview index uploaded successfully: {s3_key}")
+        return uploaded_key
+
+    async def download_index(self, interview_id: str) -> Optional[Dict[str, Any]]:
+        body = await self.download_bytes(index_key(interview_id))
+        return json.loads(body) if body is not None else None
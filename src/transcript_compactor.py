@@ -0,0 +1,175 @@
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from context_compactor import CHARS_PER_TOKEN, estimate_tokens
+from incremental_report import INTERVIEWER_PREFIX, detect_area
+
+try:
+    import tiktoken
+except ImportError:  # optional: without it token counts fall back to the characters-per-token estimate
+    tiktoken = None
+
+logger = logging.getLogger("transcript_compactor")
+
+REPORT_TRANSCRIPT_TOKEN_BUDGET = int(os.getenv("REPORT_TRANSCRIPT_TOKEN_BUDGET", "12000"))
+TOKENIZER_ENCODING = "o200k_base"  # the gpt-4o tokenizer
+COMPACTION_VERSION = "3"  # bump when the rules change: report_batch caches reports per version
+AGENT_STUB_MAX_CHARS = 240
+MIN_ANSWER_TOKENS = 32  # the budget never cuts an answer below this
+INTERVIEWEE_PREFIX = "Entrevistado: "
+INTERRUPTED_MARK = "[INTERROMPIDO]"
+TRUNCATION_MARK = " […]"
+
+_TURN = re.compile(r"\n\n(?=(?:Entrevistador|Entrevistado): )")
+_SENTENCE = re.compile(r"[^.!?…]*[.!?…]+|[^.!?…]+$")
+# hesitations, the ", né" tag and stutters of up to three words; "é" is a verb and is left alone
+_FILLER = re.compile(r"(?i)(?<!\w)(?:h+u+m+|h+m+|u+h+m*|a+h+n+|[ãa]h+|h[ãa]+)(?!\w)[,.]*")
+_TAG = re.compile(r"(?i),\s*né\b(\?)?")
+_REPEATED_WORDS = re.compile(r"(?i)\b((?:[^\W\d_]+\s+){0,2}[^\W\d_]+)(?:[\s,]+\1\b)+")
+_SPACES = re.compile(r"\s{2,}")
+_SPACE_BEFORE_PUNCTUATION = re.compile(r"\s+(?=[,.?!])")
+
+_encoding = None
+_encoding_failed = False
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and tiktoken is not None and not _encoding_failed:
+        try:
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e: # the BPE file is read from TIKTOKEN_CACHE_DIR, or downloaded when it is not there
+            logger.error(f"tiktoken encoding {TOKENIZER_ENCODING} is not in TIKTOKEN_CACHE_DIR "
+                         f"({os.getenv('TIKTOKEN_CACHE_DIR', 'unset')}) and could not be downloaded; token counts are "
+                         f"estimated and the transcript budget is approximate. Run `download-files` at build time: {e}")
+            _encoding_failed = True
+    return _encoding
+
+def download_encoding():
+    """Fetch the BPE file into TIKTOKEN_CACHE_DIR, for `download-files` at image build time. Raises if it cannot"""
+    if tiktoken is None:
+        raise RuntimeError("tiktoken is not installed")
+    tiktoken.get_encoding(TOKENIZER_ENCODING)
+
+def tokenizer_name() -> str:
+    return f"tiktoken/{TOKENIZER_ENCODING}" if _get_encoding() else "estimate"
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    return len(encoding.encode(text)) if encoding else estimate_tokens(text)
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` at a word boundary to at most `max_tokens`, marking the cut"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    head = encoding.decode(encoding.encode(text)[:max_tokens]) if encoding else text[:max_tokens * CHARS_PER_TOKEN]
+    return head.rsplit(" ", 1)[0] + TRUNCATION_MARK
+
+@dataclass
+class CompactedTranscript:
+    text: str
+    tokens_before: int
+    tokens_after: int
+    turns_before: int
+    turns_after: int
+    truncated_turns: int
+    tokenizer: str
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def summary(self) -> Dict[str, Any]:
+        return {"raw": self.tokens_before, "compacted": self.tokens_after, "saved": self.tokens_saved,
+                "truncated_turns": self.truncated_turns, "tokenizer": self.tokenizer, "version": COMPACTION_VERSION}
+
+def clean_answer(text: str) -> str:
+    """The interviewee's words without hesitations, tags and stutters"""
+    text = _TAG.sub(lambda m: "." if m.group(1) else "", _FILLER.sub("", text))
+    text = _REPEATED_WORDS.sub(r"\1", text)
+    return _SPACE_BEFORE_PUNCTUATION.sub("", _SPACES.sub(" ", text)).strip(" ,")
+
+def question_stub(text: str) -> str:
+    """The interviewer's last questions, enough to tell what was asked. Keeps the area split_by_area would see"""
+    sentences = [s.strip() for s in _SENTENCE.findall(text) if s.strip()]
+    questions = [s for s in sentences if s.endswith("?")]
+    stub = " ".join(questions[-2:]) if questions else (sentences[-1] if sentences else text)
+    if len(stub) > AGENT_STUB_MAX_CHARS:
+        stub = stub[:AGENT_STUB_MAX_CHARS].rsplit(" ", 1)[0] + "…"
+    area = detect_area(text)
+    if area and detect_area(stub) != area:
+        stub = f"({area}) {stub}"
+        if detect_area(stub) != area:
+            return text
+    return stub if len(stub) < len(text) else text
+
+def _parse(conversation: str) -> List[Tuple[str, str]]:
+    turns = []
+    for turn in _TURN.split(conversation.strip()):
+        for prefix in (INTERVIEWER_PREFIX, INTERVIEWEE_PREFIX):
+            if turn.startswith(prefix):
+                turns.append((prefix, turn[len(prefix):]))
+                break
+        else:
+            if not turns:
+                return []
+            turns[-1] = (turns[-1][0], f"{turns[-1][1]}\n\n{turn}") # a paragraph break inside a turn
+    return turns
+
+def _fit(turns: List[Tuple[str, str]], budget: int) -> Tuple[List[Tuple[str, str]], int]:
+    """Cap the longest answers at one shared length, the largest that fits the budget. Questions are never cut"""
+    costs = [count_tokens(prefix + text) + 1 for prefix, text in turns]
+    if sum(costs) <= budget:
+        return turns, 0
+    answers = [i for i, (prefix, _) in enumerate(turns) if prefix == INTERVIEWEE_PREFIX]
+    fixed = sum(cost for cost, (prefix, _) in zip(costs, turns) if prefix != INTERVIEWEE_PREFIX)
+    low, high = MIN_ANSWER_TOKENS, max((costs[i] for i in answers), default=MIN_ANSWER_TOKENS)
+    while low < high:
+        cap = (low + high + 1) // 2
+        if fixed + sum(min(costs[i], cap) for i in answers) <= budget:
+            low = cap
+        else:
+            high = cap - 1
+    fitted, truncated = list(turns), 0
+    for i in answers:
+        if costs[i] > low:
+            prefix, text = turns[i]
+            fitted[i] = (prefix, truncate_tokens(text, low - count_tokens(prefix) - 1))
+            truncated += 1
+    return fitted, truncated
+
+def compact_transcript(conversation: str, budget: int = REPORT_TRANSCRIPT_TOKEN_BUDGET) -> CompactedTranscript:
+    """Shrink a get_conversation_only() transcript for the report prompt: drop interruption marks and
+    filler, merge consecutive turns of one speaker, reduce the interviewer's turns to their questions,
+    then cap the longest answers until the whole fits `budget` tokens. CPU-bound; call via asyncio.to_thread"""
+    tokens_before = count_tokens(conversation)
+    turns = _parse(conversation)
+    if not turns:
+        return CompactedTranscript(conversation, tokens_before, tokens_before, 0, 0, 0, tokenizer_name())
+    merged: List[Tuple[str, List[str]]] = [] # each speaker's consecutive turns, as fragments
+    superseded = False # the last fragment was cut off, and its speaker may say it again
+    for prefix, text in turns:
+        interrupted = INTERRUPTED_MARK in text
+        text = text.replace(INTERRUPTED_MARK, "").strip()
+        if prefix == INTERVIEWEE_PREFIX:
+            text = clean_answer(text)
+        if not text:
+            continue
+        if merged and merged[-1][0] == prefix:
+            fragments = merged[-1][1]
+            if superseded:
+                fragments.pop() # only the cut-off fragment; what was said before it stays
+            fragments.append(text)
+        else:
+            merged.append((prefix, [text]))
+        superseded = interrupted
+    stubbed = [(prefix, question_stub(" ".join(fragments)) if prefix == INTERVIEWER_PREFIX else " ".join(fragments))
+               for prefix, fragments in merged]
+    fitted, truncated = _fit(stubbed, budget)
+    text = "\n\n".join(prefix + text for prefix, text in fitted)
+    tokens_after = count_tokens(text)
+    if tokens_after > budget:
+        logger.warning(f"Compacted transcript is still {tokens_after} tokens, over the {budget} budget")
+    return CompactedTranscript(text, tokens_before, tokens_after, len(turns), len(fitted), truncated, tokenizer_name())
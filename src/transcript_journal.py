@@ -0,0 +1,296 @@
+import asyncio
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from completion_outbox import DATA_DIR
+
+logger = logging.getLogger("transcript_journal")
+
+JOURNAL_DIR = os.getenv("TRANSCRIPT_JOURNAL_DIR", os.path.join(DATA_DIR, "transcript_journal"))
+JOURNAL_PREFIX = "journal/"
+FLUSH_BATCH_SIZE = 4
+FLUSH_INTERVAL_S = 2.0
+CHUNK_MAX_ENTRIES = 25
+RECOVERY_INTERVAL_S = float(os.getenv("TRANSCRIPT_JOURNAL_RECOVERY_S", "300"))
+
+SPOOL_SUFFIX = ".jsonl"
+
+def manifest_key(interview_id: str) -> str:
+    return f"{JOURNAL_PREFIX}{interview_id}/manifest.json"
+
+def chunk_key(interview_id: str, seq: int) -> str:
+    return f"{JOURNAL_PREFIX}{interview_id}/chunk-{seq:05d}.jsonl"
+
+@contextlib.contextmanager
+def _claimed_spool(path: str) -> Iterator[bool]:
+    """Hold the exclusive lock of a spool nobody else holds. Yields False while its writer (in any process
+    of any task sharing the volume: EFS honours flock) still holds it. Raises FileNotFoundError if it is gone"""
+    fd = os.open(path, os.O_RDWR)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        if os.fstat(fd).st_ino != os.stat(path).st_ino: # sealed and removed while we waited for the lock
+            raise FileNotFoundError(path)
+        yield True
+    finally:
+        os.close(fd) # releases the lock
+
+class TranscriptJournal:
+    """Write-ahead journal for transcript entries.
+
+    Entries are appended to a local JSONL spool in small batches (fsynced), and every
+    CHUNK_MAX_ENTRIES entries the closed chunk is uploaded to S3 in the background.
+    `seal` only has to ship the open tail chunk and a manifest listing all chunks; the sealed
+    manifest is the interview's transcript. The writer holds an exclusive lock on its spool, so
+    spools nobody holds belong to processes that died before sealing; `recover` seals those.
+    """
+
+    def __init__(self, interview_id: str, s3_handler=None, directory: str = JOURNAL_DIR,
+                 batch_size: int = FLUSH_BATCH_SIZE, chunk_entries: int = CHUNK_MAX_ENTRIES, flush_interval: float = FLUSH_INTERVAL_S):
+        self.interview_id = interview_id
+        self.s3_handler = s3_handler
+        self.path = os.path.join(directory, f"{interview_id}{SPOOL_SUFFIX}")
+        self.batch_size = batch_size
+        self.chunk_entries = chunk_entries
+        self.flush_interval = flush_interval
+        self.chunk_keys: List[str] = []
+        self.failed_chunks: List[int] = []
+        self._pending: List[str] = []
+        self._chunk: List[str] = []
+        self._chunk_seq = 0
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._ticker_task: Optional[asyncio.Task] = None
+        self._uploads: Set[asyncio.Task] = set()
+        self._sealed = False
+        self.write_failed = False
+        os.makedirs(directory, exist_ok=True)
+        self._lock_fd: Optional[int] = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(self):
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def start(self):
+        """Start the periodic flusher so quiet periods still reach disk within flush_interval"""
+        if self._ticker_task is None:
+            self._ticker_task = asyncio.create_task(self._tick())
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self._pending:
+                await self.flush()
+
+    @staticmethod
+    def serialize(timestamp: datetime, speaker: str, text: str, confidence: Optional[float] = None) -> str:
+        return json.dumps({"ts": timestamp.isoformat(), "speaker": speaker, "text": text, "confidence": confidence}, ensure_ascii=False)
+
+    def append(self, timestamp: datetime, speaker: str, text: str, confidence: Optional[float] = None):
+        """Queue an entry; a flush is scheduled once a batch is full"""
+        if self._sealed:
+            logger.warning(f"Ignoring entry appended to sealed journal {self.interview_id}")
+            return
+        self._pending.append(self.serialize(timestamp, speaker, text, confidence))
+        if len(self._pending) >= self.batch_size and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    def _write_lines(self, lines: List[str]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def flush(self):
+        """Write pending entries to the spool and hand closed chunks to the uploader"""
+        async with self._flush_lock:
+            while self._pending:
+                lines, self._pending = self._pending, []
+                try:
+                    await asyncio.to_thread(self._write_lines, lines)
+                except OSError as e:
+                    logger.error(f"Failed to write transcript journal {self.path}: {e}")
+                    self.write_failed = True
+                self._chunk.extend(lines)
+                while len(self._chunk) >= self.chunk_entries:
+                    closed, self._chunk = self._chunk[:self.chunk_entries], self._chunk[self.chunk_entries:]
+                    self._schedule_upload(closed)
+
+    def _schedule_upload(self, lines: List[str]):
+        self._chunk_seq += 1
+        if self.s3_handler is None:
+            return
+        task = asyncio.create_task(self._upload_chunk(self._chunk_seq, lines))
+        self._uploads.add(task)
+        task.add_done_callback(self._uploads.discard)
+
+    async def _upload_chunk(self, seq: int, lines: List[str]):
+        key = chunk_key(self.interview_id, seq)
+        if await _put_chunk(self.s3_handler, key, lines):
+            self.chunk_keys.append(key)
+        else:
+            self.failed_chunks.append(seq)
+
+    async def close(self):
+        """Write every entry to the spool and let go of it, for another process to seal with `seal_spool`.
+        Chunk uploads still in flight finish while this process lives; the sealer redoes any that did not"""
+        if self._ticker_task:
+            self._ticker_task.cancel()
+        await self.flush()
+        self._sealed = True
+        self._unlock()
+
+    async def seal(self, timestamp: Optional[str] = None) -> Optional[str]:
+        """Flush, upload the tail chunk, wait for in-flight chunks and write the manifest. Returns the manifest key.
+        `timestamp` (YYYYmmdd_HHMMSS) is the one the interview's other artifacts are stored under. The spool
+        is unlocked either way; if sealing failed it is left for `recover`"""
+        if self._ticker_task:
+            self._ticker_task.cancel()
+        await self.flush()
+        self._sealed = True
+        if self._chunk:
+            self._schedule_upload(self._chunk)
+            self._chunk = []
+        if self._uploads:
+            await asyncio.gather(*list(self._uploads), return_exceptions=True)
+        try:
+            if self.s3_handler is None:
+                return None
+            if self.failed_chunks:
+                logger.error(f"Journal {self.interview_id} has chunks that failed to upload: {self.failed_chunks}; local spool kept at {self.path}")
+                return None
+            uploaded_key, _ = await _write_manifest(self.s3_handler, self.interview_id, sorted(self.chunk_keys),
+                                                    timestamp or datetime.now().strftime("%Y%m%d_%H%M%S"))
+            if uploaded_key:
+                os.remove(self.path) # still locked, so no recoverer reads it half removed
+            return uploaded_key
+        finally:
+            self._unlock()
+
+    @staticmethod
+    def replay(path: str) -> List[Dict[str, Any]]:
+        """Read back a spool file, e.g. to recover the transcript of a crashed worker. Truncated last lines are skipped"""
+        entries = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping truncated journal line in {path}")
+        return entries
+
+    @classmethod
+    async def seal_spool(cls, s3_handler, path: str, timestamp: Optional[str] = None, recovered: bool = False,
+                         chunk_entries: int = CHUNK_MAX_ENTRIES) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Seal a spool its writer has let go of, from what reached the disk: (manifest key, manifest), or None
+        while the writer still holds it. Chunks are cut as the writer cut them, and ones it already uploaded are
+        not uploaded again. A spool that is gone because it was sealed already gives the existing manifest"""
+        interview_id = os.path.basename(path)[:-len(SPOOL_SUFFIX)]
+        try:
+            with _claimed_spool(path) as claimed:
+                if not claimed:
+                    return None
+                entries = cls.replay(path)
+                lines = [json.dumps(entry, ensure_ascii=False) for entry in entries]
+                chunks = [lines[start:start + chunk_entries] for start in range(0, len(lines), chunk_entries)]
+                keys = [chunk_key(interview_id, seq) for seq in range(1, len(chunks) + 1)]
+
+                async def upload(key: str, chunk: List[str]) -> bool:
+                    return await s3_handler.exists(key) or await _put_chunk(s3_handler, key, chunk)
+
+                if not all(await asyncio.gather(*(upload(key, chunk) for key, chunk in zip(keys, chunks)))):
+                    raise RuntimeError(f"Chunks of transcript journal {path} failed to upload")
+                if timestamp is None:
+                    timestamp = datetime.fromisoformat(entries[0]["ts"]) if entries else datetime.now()
+                    timestamp = timestamp.strftime("%Y%m%d_%H%M%S")
+                key, manifest = await _write_manifest(s3_handler, interview_id, keys, timestamp, recovered=recovered)
+                if not key:
+                    raise RuntimeError(f"Manifest of transcript journal {path} failed to upload")
+                os.remove(path)
+                logger.info(f"Sealed transcript journal of {interview_id} ({len(entries)} entries) to {key}")
+                return key, manifest
+        except FileNotFoundError:
+            body = await s3_handler.download_bytes(manifest_key(interview_id))
+            if body is None:
+                raise
+            return manifest_key(interview_id), json.loads(body)
+
+    @classmethod
+    async def recover(cls, s3_handler, directory: str = JOURNAL_DIR,
+                      chunk_entries: int = CHUNK_MAX_ENTRIES) -> List[Tuple[str, Dict[str, Any]]]:
+        """Seal the non-empty spools nobody holds: those of job processes that died before sealing, in this task
+        or in another one sharing the volume. Returns what `seal_spool` did for each; a failed one is retried
+        on the next pass"""
+        sealed = []
+        for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+            path = os.path.join(directory, name)
+            if not name.endswith(SPOOL_SUFFIX):
+                continue
+            try:
+                if os.path.getsize(path) == 0: # the process died before the first entry; nothing to keep
+                    with _claimed_spool(path) as claimed:
+                        if claimed:
+                            os.remove(path)
+                    continue
+                result = await cls.seal_spool(s3_handler, path, recovered=True, chunk_entries=chunk_entries)
+            except FileNotFoundError:
+                continue # sealed meanwhile
+            except Exception as e:
+                logger.error(f"Failed to recover transcript journal {path}: {e}")
+                continue
+            if result:
+                sealed.append(result)
+        return sealed
+
+    @staticmethod
+    async def read(s3_handler, key: str) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        """A sealed journal's manifest and its entries in order, or None if any part cannot be read"""
+        body = await s3_handler.download_bytes(key)
+        if body is None:
+            return None
+        manifest = json.loads(body)
+        chunks = await asyncio.gather(*(s3_handler.download_bytes(chunk) for chunk in manifest["chunks"]))
+        if any(chunk is None for chunk in chunks):
+            return None
+        return manifest, [json.loads(line) for chunk in chunks for line in chunk.decode("utf-8").splitlines() if line]
+
+async def _put_chunk(s3_handler, key: str, lines: List[str]) -> bool:
+    return bool(await s3_handler.upload_bytes(key, ("\n".join(lines) + "\n").encode("utf-8"), compressed=True,
+                                              ContentType="application/x-ndjson; charset=utf-8"))
+
+async def _write_manifest(s3_handler, interview_id: str, chunks: List[str], timestamp: str,
+                          recovered: bool = False) -> Tuple[Optional[str], Dict[str, Any]]:
+    manifest = {"interview_id": interview_id, "timestamp": timestamp, "chunks": chunks,
+                "sealed_at": datetime.now().isoformat(), "recovered": recovered}
+    key = await s3_handler.upload_bytes(manifest_key(interview_id), json.dumps(manifest, ensure_ascii=False).encode("utf-8"),
+                                        ContentType="application/json; charset=utf-8")
+    return key, manifest
+
+def start_recovery_thread(make_s3_handler: Callable[[], Any], directory: str = JOURNAL_DIR, interval: float = RECOVERY_INTERVAL_S,
+                          on_recovered: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> threading.Thread:
+    """Run `TranscriptJournal.recover` now and every `interval` seconds, on a daemon thread with its own event loop.
+    `on_recovered(manifest_key, manifest)` is called for every journal it seals"""
+    async def recover_periodically():
+        s3_handler = make_s3_handler()
+        while True:
+            try:
+                for key, manifest in await TranscriptJournal.recover(s3_handler, directory):
+                    if on_recovered is not None:
+                        on_recovered(key, manifest)
+            except Exception as e:
+                logger.error(f"Transcript journal recovery failed: {e}", exc_info=True)
+            await asyncio.sleep(interval)
+
+    thread = threading.Thread(target=lambda: asyncio.run(recover_periodically()), name="journal-recovery", daemon=True)
+    thread.start()
+    return thread
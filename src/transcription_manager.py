@@ -1,102 +1,188 @@
 import logging
-from typing import List, Optional
-from datetime import datetime
-from dataclasses import dataclass
+import math
+import re
+import time
+from array import array
+from typing import Any, Callable, Dict, List, Optional
+from datetime import datetime, timedelta
 import asyncio
+from transcript_journal import TranscriptJournal
 
 logger = logging.getLogger("transcription_manager")
 
-@dataclass
+SPEAKERS = ("agent", "user")  # index is the speaker code stored per entry
+ENTRY_HEADER = re.compile(r"^\[\d{2}:\d{2}:\d{2}\] (AGENT|USER)(?: \(confidence: [0-9.]+\))?:$", re.MULTILINE)
+
+def conversation_from_transcription(full_transcription: str) -> str:
+    """Rebuild the get_conversation_only() text from a stored get_full_transcription() rendering"""
+    parts = ENTRY_HEADER.split(full_transcription)
+    entries = list(zip(parts[1::2], parts[2::2]))
+    lines = []
+    for index, (label, segment) in enumerate(entries):
+        # each entry renders as "\n[ts] LABEL:\n{text}\n"; all but the last also hold the next header's leading newline
+        text = segment[1:-1] if index == len(entries) - 1 else segment[1:-2]
+        lines.append(f"{'Entrevistador' if label == 'AGENT' else 'Entrevistado'}: {text}")
+    return "\n\n".join(lines)
+
+def conversation_from_entries(entries: List[Dict[str, Any]]) -> str:
+    """Rebuild the get_conversation_only() text from transcript journal entries"""
+    return "\n\n".join(f"{'Entrevistador' if entry['speaker'] == 'agent' else 'Entrevistado'}: {entry['text']}" for entry in entries)
+
+
 class TranscriptionEntry:
     """Represents a single transcription entry"""
-    timestamp: datetime
-    speaker: str  # 'agent' or 'user'
-    text: str
-    confidence: Optional[float] = None
+    __slots__ = ("timestamp", "speaker", "text", "confidence")
+
+    def __init__(self, timestamp: datetime, speaker: str, text: str, confidence: Optional[float] = None):
+        self.timestamp = timestamp
+        self.speaker = speaker  # 'agent' or 'user'
+        self.text = text
+        self.confidence = confidence
+
+    def __repr__(self) -> str:
+        return f"TranscriptionEntry(timestamp={self.timestamp!r}, speaker={self.speaker!r}, text={self.text!r}, confidence={self.confidence!r})"
 
 class TranscriptionManager:
-    """Manages transcription collection during the interview"""
-    
-    def __init__(self, interview_id: str):
+    """Manages transcription collection during the interview.
+
+    Entries are stored column-wise (monotonic offsets, speaker codes, confidences in arrays,
+    texts in a list), and both text renderings are kept as append-only segment buffers, so
+    reading the transcript mid-interview costs O(1) when nothing changed since the last read.
+    """
+
+    def __init__(self, interview_id: str, journal: Optional[TranscriptJournal] = None):
         self.interview_id = interview_id
-        self.entries: List[TranscriptionEntry] = []
+        self.journal = journal
+        self._listeners: List[Callable[[str, str], None]] = []
         self.start_time = datetime.now()
+        self._start_monotonic = time.monotonic()
         self.is_recording = False
         self._lock = asyncio.Lock()
-    
+        self._reset_storage()
+
+    def _reset_storage(self):
+        self._offsets = array("d")  # seconds since start_time (monotonic clock)
+        self._speakers = bytearray()
+        self._confidences = array("d")  # NaN when unknown
+        self._texts: List[str] = []
+        self._full_pending: List[str] = []  # rendered segments not yet folded into _full_body
+        self._conversation_pending: List[str] = []
+        self._full_body = ""
+        self._full_cache: Optional[str] = None
+        self._conversation = ""
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    @property
+    def entries(self) -> List[TranscriptionEntry]:
+        """Materialize the stored entries (allocates; prefer the renderings for hot paths)"""
+        return [self._entry_at(i) for i in range(len(self._texts))]
+
+    def _entry_at(self, index: int) -> TranscriptionEntry:
+        confidence = self._confidences[index]
+        return TranscriptionEntry(
+            timestamp=self.start_time + timedelta(seconds=self._offsets[index]),
+            speaker=SPEAKERS[self._speakers[index]],
+            text=self._texts[index],
+            confidence=None if math.isnan(confidence) else confidence,
+        )
+
+    def add_listener(self, callback: Callable[[str, str], None]):
+        """Register a synchronous callback invoked with (speaker, text) for every recorded entry"""
+        self._listeners.append(callback)
+
+    def _notify(self, speaker: str, text: str):
+        for callback in self._listeners:
+            try:
+                callback(speaker, text)
+            except Exception as e:
+                logger.warning(f"Transcription listener failed: {e}")
+
     async def start_recording(self):
         """Start recording transcription"""
         async with self._lock:
             self.is_recording = True
             self.start_time = datetime.now()
+            self._start_monotonic = time.monotonic()
             logger.info(f"Started transcription recording for interview {self.interview_id}")
-    
+
     async def stop_recording(self):
         """Stop recording transcription"""
         async with self._lock:
             self.is_recording = False
             logger.info(f"Stopped transcription recording for interview {self.interview_id}")
-    
+
+    def _append(self, speaker: str, text: str, confidence: Optional[float]):
+        offset = time.monotonic() - self._start_monotonic
+        self._offsets.append(offset)
+        self._speakers.append(SPEAKERS.index(speaker))
+        self._confidences.append(math.nan if confidence is None else confidence)
+        self._texts.append(text)
+        timestamp = self.start_time + timedelta(seconds=offset)
+        speaker_label = "AGENT" if speaker == "agent" else "USER"
+        confidence_str = f" (confidence: {confidence:.2f})" if confidence else ""
+        self._full_pending.append(f"\n[{timestamp.strftime('%H:%M:%S')}] {speaker_label}{confidence_str}:\n{text}\n")
+        conversation_label = "Entrevistador" if speaker == "agent" else "Entrevistado"
+        self._conversation_pending.append(f"\n\n{conversation_label}: {text}" if len(self._texts) > 1 else f"{conversation_label}: {text}")
+        self._full_cache = None
+        if self.journal:
+            self.journal.append(timestamp, speaker, text, confidence)
+        self._notify(speaker, text)
+
     async def add_agent_message(self, text: str, confidence: Optional[float] = None):
         """Add an agent message to the transcription"""
         if self.is_recording:
             async with self._lock:
-                entry = TranscriptionEntry(timestamp=datetime.now(), speaker="agent", text=text, confidence=confidence)
-                self.entries.append(entry)
+                self._append("agent", text, confidence)
                 logger.debug(f"Added agent message: {text[:50]}...")
-    
+
     async def add_user_message(self, text: str, confidence: Optional[float] = None):
         """Add a user message to the transcription"""
         if self.is_recording:
             async with self._lock:
-                entry = TranscriptionEntry(timestamp=datetime.now(), speaker="user", text=text, confidence=confidence)
-                self.entries.append(entry)
+                self._append("user", text, confidence)
                 logger.debug(f"Added user message: {text[:50]}...")
-    
+
     async def get_full_transcription(self) -> str:
         """Get the complete transcription as formatted text"""
         async with self._lock:
-            if not self.entries:
+            if not self._texts:
                 return "No transcription available."
-            lines = []
-            lines.append(f"INTERVIEW TRANSCRIPTION")
-            lines.append(f"Interview ID: {self.interview_id}")
-            lines.append(f"Start Time: {self.start_time.strftime('%Y-%m-%d %H:%M:%S')}")
-            lines.append(f"Duration: {self._get_duration()}")
-            lines.append("=" * 50)
-            lines.append("")
-            for entry in self.entries:
-                timestamp_str = entry.timestamp.strftime('%H:%M:%S')
-                speaker_label = "AGENT" if entry.speaker == "agent" else "USER"
-                confidence_str = f" (confidence: {entry.confidence:.2f})" if entry.confidence else ""
-                lines.append(f"[{timestamp_str}] {speaker_label}{confidence_str}:")
-                lines.append(f"{entry.text}")
-                lines.append("")
-            return "\n".join(lines)
-    
+            if self._full_cache is None:
+                if self._full_pending:
+                    self._full_body += "".join(self._full_pending)
+                    self._full_pending.clear()
+                header = "\n".join([
+                    "INTERVIEW TRANSCRIPTION",
+                    f"Interview ID: {self.interview_id}",
+                    f"Start Time: {self.start_time.strftime('%Y-%m-%d %H:%M:%S')}",
+                    f"Duration: {self._get_duration()}",
+                    "=" * 50,
+                ])
+                self._full_cache = header + "\n" + self._full_body
+            return self._full_cache
+
     async def get_conversation_only(self) -> str:
         """Get just the conversation without metadata for analysis"""
         async with self._lock:
-            if not self.entries:
+            if not self._texts:
                 return "No conversation available."
-            lines = []
-            for entry in self.entries:
-                speaker_label = "Entrevistador" if entry.speaker == "agent" else "Entrevistado"
-                lines.append(f"{speaker_label}: {entry.text}")
-            return "\n\n".join(lines)
-    
+            if self._conversation_pending:
+                self._conversation += "".join(self._conversation_pending)
+                self._conversation_pending.clear()
+            return self._conversation
+
     def _get_duration(self) -> str:
         """Calculate and format the duration of the interview"""
-        if not self.entries:
+        if not self._texts:
             return "0:00:00"
-        end_time = self.entries[-1].timestamp if self.entries else datetime.now()
-        duration = end_time - self.start_time
-        hours, remainder = divmod(duration.total_seconds(), 3600)
+        hours, remainder = divmod(self._offsets[-1], 3600)
         minutes, seconds = divmod(remainder, 60)
         return f"{int(hours)}:{int(minutes):02d}:{int(seconds):02d}"
-    
+
     async def clear(self):
         """Clear all transcription data"""
         async with self._lock:
-            self.entries.clear()
-            logger.info(f"Cleared transcription data for interview {self.interview_id}")
\ No newline at end of file
+            self._reset_storage()
+            logger.info(f"Cleared transcription data for interview {self.interview_id}")
@@ -0,0 +1,144 @@
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+from prometheus_client import Counter, Gauge, Histogram
+from livekit.agents.metrics import EOUMetrics, LLMMetrics, STTMetrics, TTSMetrics
+
+logger = logging.getLogger("voice_metrics")
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "8082"))
+METRICS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "/tmp/startup-diagnosis-metrics")
+LATENCY_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 20.0)
+PROFILE_PERCENTILES = (50, 90, 95, 99)
+PENDING_TURNS_LIMIT = 64  # speech_ids waiting for their remaining stage metrics
+
+class VoiceMetrics:
+    """Prometheus collectors shared by every session in the process"""
+
+    def __init__(self):
+        self.stt_duration = Histogram("agent_stt_duration_seconds", "STT request duration", ["model"], buckets=LATENCY_BUCKETS)
+        self.llm_ttft = Histogram("agent_llm_ttft_seconds", "LLM time to first token", ["model"], buckets=LATENCY_BUCKETS)
+        self.tts_ttfb = Histogram("agent_tts_ttfb_seconds", "TTS time to first byte", ["model"], buckets=LATENCY_BUCKETS)
+        self.eou_delay = Histogram("agent_eou_delay_seconds", "End of user speech to end-of-turn decision", ["model"], buckets=LATENCY_BUCKETS)
+        self.turn_latency = Histogram("agent_turn_latency_seconds", "End of user speech to first agent audio (EOU + LLM TTFT + TTS TTFB)", ["model"], buckets=LATENCY_BUCKETS)
+        # livesum: job processes write their own values, the scrape adds up the live ones
+        self.active_sessions = Gauge("agent_active_sessions", "Interviews currently running", ["model"], multiprocess_mode="livesum")
+        # every drainer reads the same shared outbox, so the live maximum is the backlog
+        self.completion_backlog = Gauge("agent_completion_backlog", "Interviews waiting in or running from the completion outbox", ["model"], multiprocess_mode="livemax")
+        # read back by the worker's admission policy (worker_load), next to being exported
+        self.event_loop_lag = Gauge("agent_event_loop_lag_seconds", "Recent peak event-loop lag of a running interview", multiprocess_mode="livemax")
+        self.session_setup = Histogram("agent_session_setup_seconds", "Entrypoint start to session started, by whether the providers were prewarmed", ["start"], buckets=LATENCY_BUCKETS)
+        self.connection_warmup = Histogram("agent_connection_warmup_seconds", "Time to open a provider connection at session start", ["provider"], buckets=LATENCY_BUCKETS)
+        self.provider_requests = Counter("agent_provider_requests", "Provider attempts by outcome: won, lost (to a hedge) or failed", ["role", "backend", "outcome"])
+        self.report_transcript_tokens = Counter("agent_report_transcript_tokens", "Transcript tokens going into report generation, raw and after compaction", ["stage"])
+        self.prewarm_duration = Histogram("agent_prewarm_seconds", "Time to prewarm a job process", buckets=(0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0))
+
+_metrics: Optional[VoiceMetrics] = None
+_metrics_lock = threading.Lock()
+
+def get_voice_metrics() -> VoiceMetrics:
+    """Create the collectors on first use, i.e. inside the job process, after the worker has set PROMETHEUS_MULTIPROC_DIR"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = VoiceMetrics()
+        return _metrics
+
+def _model_of(stage_metrics: Any, default: str) -> str:
+    metadata = getattr(stage_metrics, "metadata", None)
+    return getattr(metadata, "model_name", None) or default
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(percentile / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """count/mean/max and PROFILE_PERCENTILES of a list of seconds, in milliseconds"""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    summary = {"count": len(ordered), "mean_ms": round(sum(ordered) / len(ordered) * 1000, 1)}
+    summary.update({f"p{p}_ms": round(_percentile(ordered, p) * 1000, 1) for p in PROFILE_PERCENTILES})
+    summary["max_ms"] = round(ordered[-1] * 1000, 1)
+    return summary
+
+def set_completion_backlog(count: int, model: str):
+    get_voice_metrics().completion_backlog.labels(model=model).set(count)
+
+class SessionLatencyRecorder:
+    """Feeds one session's `metrics_collected` events into the fleet histograms and keeps the raw
+    samples for the per-interview latency profile.
+
+    Turn latency is assembled per speech_id from the EOU delay, the LLM TTFT and the TTS TTFB of
+    the reply; replies without a user turn before them (greeting, closing line) have no EOU and
+    are not counted as turns.
+    """
+
+    def __init__(self, interview_id: str, llm_model: str, stt_model: str, tts_model: str, eou_model: str):
+        self.interview_id = interview_id
+        self.models = {"llm": llm_model, "stt": stt_model, "tts": tts_model, "eou": eou_model}
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self._pending: Dict[str, Dict[str, float]] = {}
+        self.startup: Dict[str, Any] = {}
+        self._started = time.monotonic()
+        self._metrics = get_voice_metrics()
+
+    def collect(self, stage_metrics: Any):
+        if isinstance(stage_metrics, STTMetrics):
+            if stage_metrics.duration > 0: # 0.0 for streaming STT
+                self._observe("stt_duration", self._metrics.stt_duration, _model_of(stage_metrics, self.models["stt"]), stage_metrics.duration)
+        elif isinstance(stage_metrics, LLMMetrics):
+            if stage_metrics.ttft >= 0 and not stage_metrics.cancelled:
+                self._observe("llm_ttft", self._metrics.llm_ttft, _model_of(stage_metrics, self.models["llm"]), stage_metrics.ttft)
+                self._add_to_turn(stage_metrics.speech_id, "llm_ttft", stage_metrics.ttft)
+        elif isinstance(stage_metrics, TTSMetrics):
+            if stage_metrics.ttfb >= 0 and not stage_metrics.cancelled:
+                self._observe("tts_ttfb", self._metrics.tts_ttfb, _model_of(stage_metrics, self.models["tts"]), stage_metrics.ttfb)
+                self._add_to_turn(stage_metrics.speech_id, "tts_ttfb", stage_metrics.ttfb)
+        elif isinstance(stage_metrics, EOUMetrics):
+            self._observe("eou_delay", self._metrics.eou_delay, _model_of(stage_metrics, self.models["eou"]), stage_metrics.end_of_utterance_delay)
+            self._add_to_turn(stage_metrics.speech_id, "eou_delay", stage_metrics.end_of_utterance_delay)
+
+    def _observe(self, stage: str, histogram: Histogram, model: str, value: float):
+        histogram.labels(model=model).observe(value)
+        self.samples[stage].append(value)
+
+    def _add_to_turn(self, speech_id: Optional[str], stage: str, value: float):
+        if not speech_id:
+            return
+        turn = self._pending.setdefault(speech_id, {})
+        turn.setdefault(stage, value) # the first LLM/TTS request of a reply is the one the user waits on
+        if len(turn) == 3:
+            del self._pending[speech_id]
+            self._observe("turn_latency", self._metrics.turn_latency, self.models["llm"], sum(turn.values()))
+        elif len(self._pending) > PENDING_TURNS_LIMIT:
+            self._pending.pop(next(iter(self._pending)))
+
+    def record_setup(self, start: str, seconds: float):
+        """`start` is "warm" when the providers came from prewarm, "cold" when the job had to build them"""
+        self._metrics.session_setup.labels(start=start).observe(seconds)
+        self.startup.update({"start": start, "setup_s": round(seconds, 3)})
+
+    def record_warmup(self, seconds_by_provider: Dict[str, float]):
+        for provider, seconds in seconds_by_provider.items():
+            self._metrics.connection_warmup.labels(provider=provider).observe(seconds)
+        self.startup["warmup_s"] = {provider: round(seconds, 3) for provider, seconds in seconds_by_provider.items()}
+
+    def session_started(self):
+        self._metrics.active_sessions.labels(model=self.models["llm"]).inc()
+
+    def session_ended(self):
+        self._metrics.active_sessions.labels(model=self.models["llm"]).dec()
+
+    def profile(self) -> Dict[str, Any]:
+        """Compact per-interview summary: percentiles per stage, no raw samples"""
+        return {
+            "interview_id": self.interview_id,
+            "models": self.models,
+            "session_duration_s": round(time.monotonic() - self._started, 1),
+            "startup": self.startup,
+            "stages": {stage: summarize(self.samples.get(stage, [])) for stage in ("stt_duration", "eou_delay", "llm_ttft", "tts_ttfb", "turn_latency")},
+        }
@@ -0,0 +1,264 @@
+import asyncio
+import glob
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+import psutil
+from prometheus_client import CollectorRegistry, multiprocess
+from livekit.agents.utils.hw import get_cpu_monitor
+try:
+    from livekit.agents.worker import ServerEnvOption
+except ImportError:  # livekit-agents 1.2 names it _WorkerEnvOption
+    from livekit.agents.worker import _WorkerEnvOption as ServerEnvOption
+from completion_outbox import CompletionOutbox
+from loop_watchdog import InterviewProfile, LoopWatchdog
+from voice_metrics import METRICS_DIR, get_voice_metrics
+
+logger = logging.getLogger("worker_load")
+
+LOAD_THRESHOLD = float(os.getenv("LOAD_THRESHOLD", "0.75"))
+EVENT_LOOP_LAG_LIMIT_S = float(os.getenv("EVENT_LOOP_LAG_LIMIT_S", "0.15"))  # job loop lag at which audio starts to stutter
+COMPLETION_BACKLOG_LIMIT = int(os.getenv("COMPLETION_BACKLOG_LIMIT", "8"))
+IDLE_PROCESSES_MIN = 1
+IDLE_PROCESSES_MAX = int(os.getenv("IDLE_PROCESSES_MAX", "4"))
+IDLE_PROCESSES_INITIAL = 2  # until the first prewarm and arrivals have been measured
+DEFAULT_SESSION_CPU = 0.5  # cores, until a session has been measured
+DEFAULT_SESSION_RSS_MB = 700.0
+COST_SMOOTHING = 0.1  # weight of a new sample in the per-session cost averages
+ARRIVAL_WINDOW_S = 600.0
+SHARED_STATE_REFRESH_S = 5.0  # how often the job processes' gauges and the outbox are read
+LAG_PROBE_INTERVAL_S = 0.25
+LAG_DECAY = 0.8  # the lag gauge decays by this factor per probe, so one stall stays visible for a few seconds
+
+LIVE_GAUGE_FILE = re.compile(r"gauge_live\w+_(\d+)\.db$")
+
+def memory_limit_bytes() -> int:
+    """Container memory limit (cgroup v2 or v1), or the host's memory when unlimited"""
+    total = psutil.virtual_memory().total
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit():
+            return min(int(value), total)
+    return total
+
+class AdmissionPolicy:
+    """Turns measured usage into the load livekit compares against LOAD_THRESHOLD.
+
+    Usage of the whole process tree (worker, idle processes, jobs, the shared inference process)
+    is split into an idle baseline, learned while no job runs, and a per-session cost learned
+    from (usage - baseline) / active jobs. The reported load is the usage *after* one more
+    session, so the worker only advertises itself while the next interview still fits. Job
+    event-loop lag and the completion backlog are scaled so that reaching their limits alone
+    makes the worker unavailable.
+    """
+
+    def __init__(self, cpu_count: float, memory_limit: int, threshold: float = LOAD_THRESHOLD,
+                 lag_limit_s: float = EVENT_LOOP_LAG_LIMIT_S, backlog_limit: int = COMPLETION_BACKLOG_LIMIT):
+        self.cpu_count = cpu_count
+        self.memory_limit = memory_limit
+        self.threshold = threshold
+        self.lag_limit_s = lag_limit_s
+        self.backlog_limit = backlog_limit
+        self.baseline_cpu: Optional[float] = None
+        self.baseline_rss: Optional[float] = None
+        self.session_cpu = DEFAULT_SESSION_CPU
+        self.session_rss = DEFAULT_SESSION_RSS_MB * 1024 * 1024
+        self._arrivals: Deque[float] = deque()
+
+    @staticmethod
+    def _smooth(previous: Optional[float], sample: float) -> float:
+        return sample if previous is None else previous + COST_SMOOTHING * (sample - previous)
+
+    def observe(self, active_jobs: int, cpu_cores: float, rss_bytes: float):
+        if active_jobs == 0:
+            self.baseline_cpu = self._smooth(self.baseline_cpu, cpu_cores)
+            self.baseline_rss = self._smooth(self.baseline_rss, rss_bytes)
+        elif self.baseline_cpu is not None:
+            self.session_cpu = self._smooth(self.session_cpu, max(cpu_cores - self.baseline_cpu, 0.0) / active_jobs)
+            self.session_rss = self._smooth(self.session_rss, max(rss_bytes - self.baseline_rss, 0.0) / active_jobs)
+
+    def load(self, cpu_cores: float, rss_bytes: float, lag_s: float = 0.0, backlog: int = 0) -> Dict[str, float]:
+        """Every pressure plus `load`, their maximum clamped to [0, 1]"""
+        pressures = {
+            "cpu": (cpu_cores + self.session_cpu) / self.cpu_count,
+            "memory": (rss_bytes + self.session_rss) / self.memory_limit,
+            "event_loop_lag": self.threshold * lag_s / self.lag_limit_s,
+            "completion_backlog": self.threshold * backlog / self.backlog_limit,
+        }
+        pressures["load"] = min(max(pressures.values()), 1.0)
+        return pressures
+
+    def record_arrival(self, now: float):
+        self._arrivals.append(now)
+
+    def idle_processes(self, prewarm_s: Optional[float], now: float) -> int:
+        """Enough warm processes to absorb the arrivals expected while a replacement prewarms"""
+        while self._arrivals and self._arrivals[0] < now - ARRIVAL_WINDOW_S:
+            self._arrivals.popleft()
+        if prewarm_s is None:
+            return IDLE_PROCESSES_INITIAL
+        arrivals_per_s = len(self._arrivals) / ARRIVAL_WINDOW_S
+        # twice the mean rate covers bursts; the extra one is the process the next interview takes
+        wanted = round(2 * arrivals_per_s * prewarm_s) + 1
+        return max(IDLE_PROCESSES_MIN, min(IDLE_PROCESSES_MAX, wanted))
+
+class ProcessTreeSampler:
+    """CPU (in cores) and RSS of this process and all its descendants"""
+
+    def __init__(self):
+        self._root = psutil.Process()
+        self._procs: Dict[int, psutil.Process] = {}
+
+    def sample(self) -> Tuple[float, int]:
+        cpu_percent, rss = 0.0, 0
+        live = {}
+        for proc in [self._root, *self._root.children(recursive=True)]:
+            proc = self._procs.get(proc.pid, proc) # cpu_percent() measures since the previous call on the same object
+            try:
+                cpu_percent += proc.cpu_percent(None)
+                rss += proc.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            live[proc.pid] = proc
+        self._procs = live
+        return cpu_percent / 100, rss
+
+def set_idle_processes(worker, idle: int) -> bool:
+    """Resize the idle pool of a running worker. update_options refuses once the worker has started,
+    but its load task re-reads the configured count on every tick (right after load_fnc) and hands
+    it, capped by the remaining load, to the process pool. Dev mode keeps no idle processes.
+    There is no public way to do this, so the private field is only written where it is known to
+    be (livekit-agents 1.2 to 1.8); elsewhere this returns False and the pool keeps its configured size"""
+    option = ServerEnvOption(dev_default=0, prod_default=idle)
+    if hasattr(worker, "_num_idle_processes"): # AgentServer
+        worker._num_idle_processes = option
+    elif hasattr(getattr(worker, "_opts", None), "num_idle_processes"): # Worker, livekit-agents 1.2
+        worker._opts.num_idle_processes = option
+    else:
+        return False
+    return True
+
+def read_job_process_gauges(path: str) -> Dict[str, float]:
+    """Max event-loop lag of the live job processes and mean prewarm time, from the multiprocess metric files.
+    Files of processes that died without cleaning up are reaped first, so their last lag is not read"""
+    for file in glob.glob(os.path.join(path, "gauge_live*.db")):
+        match = LIVE_GAUGE_FILE.search(os.path.basename(file))
+        if match and not psutil.pid_exists(int(match.group(1))):
+            multiprocess.mark_process_dead(int(match.group(1)), path)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=path)
+    values: Dict[str, float] = {}
+    for metric in registry.collect():
+        for sample in metric.samples:
+            if sample.name in ("agent_event_loop_lag_seconds", "agent_prewarm_seconds_sum", "agent_prewarm_seconds_count"):
+                values[sample.name] = max(values.get(sample.name, 0.0), sample.value)
+    result = {"event_loop_lag_s": values.get("agent_event_loop_lag_seconds", 0.0)}
+    if values.get("agent_prewarm_seconds_count"):
+        result["prewarm_s"] = values["agent_prewarm_seconds_sum"] / values["agent_prewarm_seconds_count"]
+    return result
+
+class WorkerLoadMonitor:
+    """`load_fnc` for WorkerOptions. Runs in the worker process (on livekit's executor, every 0.5 s):
+    samples the process tree, feeds the admission policy and resizes the idle process pool.
+    Being the first code that runs only in a started worker, it also calls `on_start` once, on its first tick"""
+
+    def __init__(self, policy: Optional[AdmissionPolicy] = None, outbox: Optional[CompletionOutbox] = None,
+                 on_start: Optional[Callable[[], None]] = None):
+        self.policy = policy or AdmissionPolicy(get_cpu_monitor().cpu_count(), memory_limit_bytes())
+        self.outbox = outbox
+        self.on_start = on_start
+        self.sampler = ProcessTreeSampler()
+        self.idle_processes = IDLE_PROCESSES_INITIAL
+        self._shared: Dict[str, Any] = {"event_loop_lag_s": 0.0, "backlog": 0}
+        self._shared_read_at = 0.0
+        self._seen_jobs: Deque[str] = deque(maxlen=256)
+        self._available: Optional[bool] = None
+        self._resizable = True
+        self._lock = threading.Lock()
+
+    def _refresh_shared(self, now: float):
+        if now - self._shared_read_at < SHARED_STATE_REFRESH_S:
+            return
+        self._shared_read_at = now
+        try:
+            self._shared.update(read_job_process_gauges(os.getenv("PROMETHEUS_MULTIPROC_DIR", METRICS_DIR)))
+        except Exception as e:
+            logger.debug(f"Failed to read job process gauges: {e}")
+        if self.outbox is not None:
+            try:
+                self._shared["backlog"] = self.outbox.backlog()
+            except Exception as e:
+                logger.debug(f"Failed to read completion backlog: {e}")
+
+    def __call__(self, worker) -> float:
+        with self._lock:
+            if self.on_start is not None:
+                on_start, self.on_start = self.on_start, None
+                on_start()
+            now = time.time()
+            active = worker.active_jobs
+            for info in active:
+                if info.job.id not in self._seen_jobs:
+                    self._seen_jobs.append(info.job.id)
+                    self.policy.record_arrival(now)
+            cpu_cores, rss = self.sampler.sample()
+            self.policy.observe(len(active), cpu_cores, rss)
+            self._refresh_shared(now)
+            pressures = self.policy.load(cpu_cores, rss, self._shared["event_loop_lag_s"], self._shared["backlog"])
+            available = pressures["load"] < self.policy.threshold
+            if available != self._available:
+                self._available = available
+                logger.info(f"Worker {'accepting' if available else 'refusing'} interviews: "
+                            f"{ {name: round(value, 2) for name, value in pressures.items()} }, {len(active)} active")
+            idle = self.policy.idle_processes(self._shared.get("prewarm_s"), now)
+            if idle != self.idle_processes and self._resizable:
+                logger.info(f"Keeping {idle} idle process(es) warm (prewarm {self._shared.get('prewarm_s', 0):.1f}s)")
+                self.idle_processes = idle
+                if not set_idle_processes(worker, idle):
+                    self._resizable = False
+                    logger.warning(f"Cannot resize the idle process pool of {type(worker).__name__}; keeping its configured size")
+            return pressures["load"]
+
+class EventLoopLagProbe:
+    """Measures how late a periodic wakeup of the job's event loop fires and publishes it as
+    agent_event_loop_lag_seconds, which the worker's admission policy reads. Given a profile, the
+    wakeups also feed a LoopWatchdog that records the stack of whatever blocks the loop"""
+
+    def __init__(self, interval: float = LAG_PROBE_INTERVAL_S, profile: Optional[InterviewProfile] = None):
+        self.interval = interval
+        self.lag_s = 0.0
+        self.watchdog = LoopWatchdog(profile, interval) if profile else None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        gauge = get_voice_metrics().event_loop_lag
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(time.perf_counter() - started - self.interval, 0.0)
+            self.lag_s = max(lag, self.lag_s * LAG_DECAY)
+            gauge.set(self.lag_s)
+            if self.watchdog:
+                self.watchdog.beat(lag)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="event-loop-lag-probe")
+            if self.watchdog:
+                self.watchdog.start()
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            if self.watchdog:
+                self.watchdog.stop()
+        get_voice_metrics().event_loop_lag.set(0)
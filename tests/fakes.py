@@ -0,0 +1,300 @@
+"""Local stand-ins for external services, shared by the offline tests."""
+import io
+import json
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from botocore.exceptions import ClientError
+from s3_handler import decompress
+
+class FakeS3Client:
+    """In-memory, thread-safe stand-in for the subset of the boto3 S3 client we use"""
+
+    def __init__(self, latency_s: float = 0.0, fail_times: int = 0, fail_code: str = "SlowDown"):
+        self.objects: Dict[str, Dict] = {}
+        self.calls: List[str] = []
+        self.latency_s = latency_s
+        self.fail_times = fail_times
+        self.fail_code = fail_code
+        self._uploads: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def _enter(self, op: str):
+        with self._lock:
+            self.calls.append(op)
+            should_fail = self.fail_times > 0
+            if should_fail:
+                self.fail_times -= 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if should_fail:
+            raise ClientError({"Error": {"Code": self.fail_code, "Message": "injected failure"}}, op)
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, **kwargs):
+        self._enter("put_object")
+        with self._lock:
+            self.objects[Key] = {"Body": bytes(Body), **kwargs}
+        return {"ETag": f'"{uuid.uuid4().hex}"'}
+
+    def get_object(self, Bucket: str, Key: str, **kwargs):
+        self._enter("get_object")
+        with self._lock:
+            if Key not in self.objects:
+                raise ClientError({"Error": {"Code": "NoSuchKey", "Message": Key}}, "get_object")
+            obj = dict(self.objects[Key])
+        obj["Body"] = io.BytesIO(obj["Body"]) # boto3 returns a StreamingBody
+        return obj
+
+    def head_object(self, Bucket: str, Key: str, **kwargs):
+        self._enter("head_object")
+        with self._lock:
+            if Key not in self.objects:
+                raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "head_object")
+            obj = self.objects[Key]
+            return {**{k: v for k, v in obj.items() if k != "Body"}, "ContentLength": len(obj["Body"])}
+
+    def head_bucket(self, Bucket: str):
+        self._enter("head_bucket")
+        return {}
+
+    def list_objects_v2(self, Bucket: str, Prefix: str = "", MaxKeys: int = 1000, ContinuationToken: Optional[str] = None):
+        self._enter("list_objects_v2")
+        with self._lock:
+            keys = sorted(key for key in self.objects if key.startswith(Prefix) and (ContinuationToken is None or key > ContinuationToken))
+            page = keys[:MaxKeys]
+            contents = [{"Key": key, "Size": len(self.objects[key]["Body"])} for key in page]
+        truncated = len(keys) > MaxKeys
+        return {"Contents": contents, "KeyCount": len(page), "IsTruncated": truncated, **({"NextContinuationToken": page[-1]} if truncated else {})}
+
+    def create_multipart_upload(self, Bucket: str, Key: str, **kwargs):
+        self._enter("create_multipart_upload")
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {"Key": Key, "parts": {}, "args": kwargs}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body: bytes):
+        self._enter("upload_part")
+        etag = f'"{uuid.uuid4().hex}"'
+        with self._lock:
+            self._uploads[UploadId]["parts"][PartNumber] = (etag, bytes(Body))
+        return {"ETag": etag}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: Dict):
+        self._enter("complete_multipart_upload")
+        with self._lock:
+            upload = self._uploads.pop(UploadId)
+            body = b"".join(upload["parts"][part["PartNumber"]][1] for part in MultipartUpload["Parts"])
+            self.objects[Key] = {"Body": body, **upload["args"]}
+        return {"Key": Key}
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str):
+        self._enter("abort_multipart_upload")
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+        return {}
+
+    def body(self, key: str) -> Optional[bytes]:
+        """The object as a reader sees it, with its Content-Encoding decoded"""
+        obj = self.objects.get(key)
+        return decompress(obj["Body"], obj.get("ContentEncoding")) if obj else None
+
+class _FakeChatStream:
+    def __init__(self, text: str, chunk_size: int, latency_s: float, first_token_s: float):
+        self._chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        self._latency_s = latency_s
+        self._first_token_s = first_token_s
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        import asyncio
+        from livekit.agents.llm import ChatChunk, ChoiceDelta
+        await asyncio.sleep(self._first_token_s)
+        for i, chunk in enumerate(self._chunks):
+            if self._latency_s:
+                await asyncio.sleep(self._latency_s)
+            yield ChatChunk(id=f"fake-{i}", delta=ChoiceDelta(role="assistant", content=chunk))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def aclose(self):
+        pass
+
+class FakeLLM:
+    """Streams scripted responses. `responder` maps the last user prompt to the response text"""
+
+    def __init__(self, responder, chunk_size: int = 16, latency_s: float = 0.0, first_token_s: float = 0.0):
+        self.responder = responder
+        self.chunk_size = chunk_size
+        self.latency_s = latency_s
+        self.first_token_s = first_token_s
+        self.prompts: List[str] = []
+
+    def chat(self, *, chat_ctx, **kwargs):
+        prompt = chat_ctx.items[-1].text_content
+        self.prompts.append(prompt)
+        return _FakeChatStream(self.responder(prompt), self.chunk_size, self.latency_s, self.first_token_s)
+
+AREA_RESULT = {"score": 5.0, "faixa": 4, "confidence": 0.7, "evidences": ["evidência"], "gaps": ["lacuna"], "strengths": ["força"]}
+STARTUP_INFO = {"name": "Startup", "revenue_last_12m": 100000, "customers": 10, "time_operating_months": 12}
+
+def report_responder(prompt: str) -> str:
+    """Canned report generator answers: per-area extractions, startup info, the classification or a whole report"""
+    if "TRECHO DA ENTREVISTA (área: " in prompt:
+        area_name = prompt.rsplit("TRECHO DA ENTREVISTA (área: ", 1)[1].split(")", 1)[0]
+        return json.dumps({"area": {"area_name": area_name, **AREA_RESULT}, "startup_info": STARTUP_INFO}, ensure_ascii=False)
+    if "TRECHO DA ENTREVISTA:" in prompt:
+        return json.dumps({"startup_info": STARTUP_INFO})
+    if "AVALIAÇÃO DA STARTUP POR ÁREA:" in prompt:
+        return json.dumps({"final_classification": {"group": "Prata", "faixa": 4, "overall_score": 5.0, "momentum": "Estável"}})
+    return json.dumps({
+        "startup_info": STARTUP_INFO,
+        "areas": [{"area_name": "Vendas", **AREA_RESULT}],
+        "final_classification": {"group": "Prata", "faixa": 4, "overall_score": 5.0},
+    })
+
+class FakeSTT:
+    """Batch STT that answers `text` after `delay_s`, or raises `error`"""
+
+    def __init__(self, text: str, delay_s: float = 0.0, error: Optional[Exception] = None, model: str = "fake-stt"):
+        self.text = text
+        self.delay_s = delay_s
+        self.error = error
+        self.model = model
+        self.calls = 0
+
+    async def recognize(self, buffer, **kwargs):
+        import asyncio
+        from livekit.agents import stt
+        self.calls += 1
+        await asyncio.sleep(self.delay_s)
+        if self.error:
+            raise self.error
+        return stt.SpeechEvent(type=stt.SpeechEventType.FINAL_TRANSCRIPT, alternatives=[stt.SpeechData(language="pt", text=self.text)])
+
+class FakeAgentSession:
+    """Stand-in for AgentSession that replays a scripted interview with simulated STT/LLM/TTS latency"""
+
+    def __init__(self, stt_latency_s: float = 0.0, llm_latency_s: float = 0.0, tts_latency_s: float = 0.0, **session_kwargs):
+        self.stt_latency_s = stt_latency_s
+        self.llm_latency_s = llm_latency_s
+        self.tts_latency_s = tts_latency_s
+        self.session_kwargs = session_kwargs
+        self.agent = None
+        self.closed = False
+        self.input = SimpleNamespace(audio=None) # no room audio: the recorder has no tracks to wrap
+        self.output = SimpleNamespace(audio=None)
+        self.said: List[str] = []
+        self.emitted: List[float] = []
+        self._handlers: Dict[str, List] = {}
+
+    def on(self, event_name: str, callback=None):
+        def register(fn):
+            self._handlers.setdefault(event_name, []).append(fn)
+            return fn
+        return register(callback) if callback else register
+
+    def emit(self, event_name: str, event):
+        for handler in self._handlers.get(event_name, []):
+            handler(event)
+
+    def _add_item(self, role: str, text: str, interrupted: bool = False):
+        from livekit.agents import ConversationItemAddedEvent
+        from livekit.agents.llm import ChatMessage
+        self.emitted.append(time.perf_counter())
+        self.emit("conversation_item_added", ConversationItemAddedEvent(item=ChatMessage(role=role, content=[text], interrupted=interrupted)))
+
+    async def start(self, agent=None, **kwargs):
+        self.agent = agent
+
+    async def say(self, text: str, **kwargs):
+        import asyncio
+        await asyncio.sleep(self.tts_latency_s)
+        self.said.append(text)
+        self._add_item("assistant", text)
+
+    async def aclose(self):
+        self.closed = True
+
+    async def replay(self, turns: List[Dict]):
+        """Play turns of {"role": "user"|"assistant", "text": ...} or {"tool": "end_interview"}"""
+        import asyncio
+        for turn in turns:
+            if turn.get("tool") == "end_interview":
+                await self.agent.end_interview(None)
+                continue
+            if turn["role"] == "user":
+                await asyncio.sleep(self.stt_latency_s)
+            else:
+                await asyncio.sleep(self.llm_latency_s + self.tts_latency_s)
+            self._add_item(turn["role"], turn["text"], turn.get("interrupted", False))
+
+class FakeJobContext:
+    """Minimal JobContext: a named room, prewarmed userdata and shutdown callback registry"""
+
+    def __init__(self, room_name: str = "bench-room", userdata: Optional[Dict] = None):
+        from types import SimpleNamespace
+        self.room = SimpleNamespace(name=room_name)
+        self.proc = SimpleNamespace(userdata=userdata if userdata is not None else {"vad": None})
+        self.log_context_fields: Dict = {}
+        self.shutdown_callbacks: List = []
+        self.connected = False
+
+    def add_shutdown_callback(self, callback):
+        self.shutdown_callbacks.append(callback)
+
+    async def connect(self):
+        self.connected = True
+
+    async def shutdown(self):
+        for callback in self.shutdown_callbacks:
+            await callback()
+
+class _FakeSynthesizeStream:
+    def __init__(self, frames, latency_s: float):
+        self._frames = frames
+        self._latency_s = latency_s
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        import asyncio
+        from types import SimpleNamespace
+        await asyncio.sleep(self._latency_s)
+        for frame in self._frames:
+            yield SimpleNamespace(frame=frame)
+
+class FakeTTS:
+    """Synthesizes 10 ms of silence-like 16-bit PCM per character, in 100 ms frames"""
+
+    def __init__(self, sample_rate: int = 24000, latency_s: float = 0.0):
+        self.sample_rate = sample_rate
+        self.num_channels = 1
+        self.latency_s = latency_s
+        self.requests: List[str] = []
+
+    def synthesize(self, text: str, **kwargs):
+        from livekit import rtc
+        self.requests.append(text)
+        samples = len(text) * self.sample_rate // 100
+        per_frame = self.sample_rate // 10
+        frames = []
+        for offset in range(0, samples, per_frame):
+            count = min(per_frame, samples - offset)
+            frames.append(rtc.AudioFrame(data=bytes([offset % 251, 0]) * count, sample_rate=self.sample_rate, num_channels=1, samples_per_channel=count))
+        return _FakeSynthesizeStream(frames, self.latency_s)
@@ -0,0 +1,70 @@
+import asyncio
+import io
+import av
+import numpy as np
+from types import SimpleNamespace
+from livekit import rtc
+from livekit.agents.voice import io as voice_io
+from audio_recorder import AudioRecorder
+from s3_handler import S3Handler
+from fakes import FakeS3Client
+
+def _frame(sample_rate: int = 24000, ms: int = 20, channels: int = 1) -> rtc.AudioFrame:
+    samples = sample_rate * ms // 1000
+    pcm = (np.random.default_rng(0).standard_normal(samples * channels) * 3000).astype(np.int16)
+    return rtc.AudioFrame(data=pcm.tobytes(), sample_rate=sample_rate, num_channels=channels, samples_per_channel=samples)
+
+def _duration_s(body: bytes) -> float:
+    with av.open(io.BytesIO(body)) as container:
+        frames = list(container.decode(audio=0))
+    return sum(frame.samples for frame in frames) / frames[0].sample_rate
+
+class _Microphone(voice_io.AudioInput):
+    def __init__(self, frames):
+        super().__init__(label="mic")
+        self.frames = iter(frames)
+
+    async def __anext__(self):
+        try:
+            return next(self.frames)
+        except StopIteration:
+            raise StopAsyncIteration
+
+async def test_tracks_stream_in_fixed_size_parts():
+    client = FakeS3Client()
+    recorder = AudioRecorder("INT-1", "20240315_093000", S3Handler(client=client, bucket_name="b"), codec="flac", part_size=16 * 1024)
+    recorder.start()
+    for _ in range(150): # 3 s of noise per track, which FLAC cannot compress much
+        recorder.capture("user", _frame())
+        recorder.capture("agent", _frame(sample_rate=48000, channels=2))
+    keys = await recorder.aclose()
+    assert keys == {"user_audio": "audio/dt=2024-03-15/INT-1_20240315_093000.user.flac",
+                    "agent_audio": "audio/dt=2024-03-15/INT-1_20240315_093000.agent.flac"}
+    assert client.calls.count("upload_part") >= 4 and client.calls.count("complete_multipart_upload") == 2
+    for key in keys.values():
+        assert client.objects[key]["ContentType"] == "audio/flac"
+        assert 2.9 < _duration_s(client.body(key)) < 3.5
+    assert recorder.dropped_frames == 0
+
+async def test_quiet_stretches_are_filled_with_silence():
+    client = FakeS3Client()
+    recorder = AudioRecorder("INT-2", "20240315_093000", S3Handler(client=client, bucket_name="b"))
+    recorder.start(tracks=("agent",))
+    recorder.capture("agent", _frame())
+    await asyncio.sleep(0.5) # the agent is not speaking
+    recorder.capture("agent", _frame())
+    keys = await recorder.aclose()
+    body = client.body(keys["agent_audio"])
+    assert client.objects[keys["agent_audio"]]["ContentType"] == "audio/ogg; codecs=opus"
+    assert client.calls.count("put_object") == 1 # shorter than one part: no multipart upload
+    assert _duration_s(body) >= 0.5
+
+async def test_attach_taps_the_session_input_and_bounds_the_queue():
+    client = FakeS3Client()
+    recorder = AudioRecorder("INT-3", "20240315_093000", S3Handler(client=client, bucket_name="b"), max_queued_frames=1)
+    session = SimpleNamespace(input=SimpleNamespace(audio=_Microphone([_frame() for _ in range(50)])), output=SimpleNamespace(audio=None))
+    recorder.attach(session)
+    received = [frame async for frame in session.input.audio]
+    assert len(received) == 50
+    keys = await recorder.aclose()
+    assert list(keys) == ["user_audio"] and recorder.dropped_frames > 0
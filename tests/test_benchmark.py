@@ -0,0 +1,218 @@
+"""Offline end-to-end benchmark: replays scripted interviews through `entrypoint` with local stand-ins.
+
+Run `python tests/test_benchmark.py` to print the numbers, or `--update-baseline` to rewrite
+tests/benchmark_baseline.json after an intentional performance change. Timings are compared in
+units of a reference workload measured in the same run, so the baseline holds on machines faster
+or slower than the one that recorded it.
+"""
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Any, Dict, List
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+import agent
+from report_generator import ReportGenerator
+from completion_outbox import CompletionOutbox, OutboxDrainer
+from prompt_store import PromptRelease, PromptStore
+from report_assets import get_report_assets
+from s3_handler import S3Handler
+from transcript_journal import TranscriptJournal
+from fakes import FakeAgentSession, FakeJobContext, FakeLLM, FakeS3Client, report_responder
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+INTERVIEWS_PATH = os.path.join(HERE, "benchmark_interviews.json")
+BASELINE_PATH = os.path.join(HERE, "benchmark_baseline.json")
+
+LATENCIES = {"stt_latency_s": 0.002, "llm_latency_s": 0.004, "tts_latency_s": 0.002}
+REPORT_LLM_FIRST_TOKEN_S = 0.03
+S3_LATENCY_S = 0.005
+MEMORY_SESSIONS = 4
+CALIBRATION_ROUNDS = 5
+CALIBRATION_PASSES = 200
+
+def load_interviews() -> Dict[str, List[Dict]]:
+    with open(INTERVIEWS_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+def make_report_generator():
+    return ReportGenerator(llm=FakeLLM(report_responder, chunk_size=64, first_token_s=REPORT_LLM_FIRST_TOKEN_S))
+
+def make_providers():
+    return {
+        "openai_client": SimpleNamespace(models=SimpleNamespace(list=lambda: asyncio.sleep(0))),
+        "llm": object(), "stt": object(), "tts": object(), "phrase_tts": object(), "noise_cancellation": object(),
+        "compaction_llm": SimpleNamespace(prewarm=lambda: None),
+        "report_generator": make_report_generator(),
+    }
+
+@contextlib.contextmanager
+def offline_agent(spool_dir: str):
+    """Patch every external dependency of agent.entrypoint with a local stand-in"""
+    offline = SimpleNamespace(sessions=[], s3_clients=[])
+    def make_session(**kwargs):
+        offline.sessions.append(FakeAgentSession(**LATENCIES, **kwargs))
+        return offline.sessions[-1]
+    def make_s3_handler():
+        offline.s3_clients.append(FakeS3Client(latency_s=S3_LATENCY_S))
+        return S3Handler(client=offline.s3_clients[-1], bucket_name="bench")
+    stub = lambda *args, **kwargs: object()
+    with contextlib.ExitStack() as stack:
+        outbox = CompletionOutbox(os.path.join(stack.enter_context(tempfile.TemporaryDirectory()), "outbox.sqlite3"))
+        drainer = OutboxDrainer(outbox, {agent.COMPLETION_JOB: agent.handle_completion_job}, concurrency=MEMORY_SESSIONS)
+        stack.enter_context(mock.patch.object(agent, "_completion_drainer", drainer))
+        stack.enter_context(mock.patch.object(agent, "AgentSession", make_session))
+        prompts = PromptStore(location="")
+        prompts.activate(PromptRelease("bench", "Você é a Atena, entrevistadora de startups.", get_report_assets()))
+        stack.enter_context(mock.patch.object(agent, "get_prompt_store", lambda: prompts))
+        stack.enter_context(mock.patch.object(agent, "build_providers", make_providers))
+        stack.enter_context(mock.patch.object(agent, "MultilingualModel", stub))
+        stack.enter_context(mock.patch.object(agent, "ReportGenerator", make_report_generator))
+        stack.enter_context(mock.patch.object(agent, "S3Handler", make_s3_handler))
+        spooled = type("SpooledJournal", (TranscriptJournal,), {"__init__": functools.partialmethod(TranscriptJournal.__init__, directory=spool_dir)})
+        stack.enter_context(mock.patch.object(agent, "TranscriptJournal", spooled))
+        yield offline
+
+async def drain_completions():
+    """Do the worker drainer's part: retry what the job process left in the outbox"""
+    await agent.get_completion_drainer().run_until_idle()
+
+async def run_session(turns: List[Dict], offline: SimpleNamespace) -> Dict[str, float]:
+    """Run one interview end to end and return its latency profile"""
+    ctx = FakeJobContext()
+    cpu_started = time.thread_time()
+    await agent.entrypoint(ctx)
+    session = offline.sessions[-1]
+    arrivals: List[float] = []
+    session.agent.transcription_manager.add_listener(lambda speaker, text: arrivals.append(time.perf_counter()))
+    await session.replay(turns)
+    completion_started = time.perf_counter()
+    await ctx.shutdown()
+    await drain_completions()
+    completion_ms = (time.perf_counter() - completion_started) * 1000
+    loop_cpu_ms = (time.thread_time() - cpu_started) * 1000
+    overheads = sorted((arrived - emitted) * 1000 for emitted, arrived in zip(session.emitted, arrivals))
+    return {
+        "turns": len(overheads),
+        "turn_overhead_mean_ms": statistics.mean(overheads),
+        "turn_overhead_p95_ms": overheads[int(0.95 * (len(overheads) - 1))],
+        "loop_cpu_ms_per_turn": loop_cpu_ms / len(overheads),
+        "completion_ms": completion_ms,
+    }
+
+async def measure_memory(turns: List[Dict], offline: SimpleNamespace, count: int = MEMORY_SESSIONS) -> float:
+    """Peak traced allocation per session while `count` sessions run concurrently, in KiB"""
+    tracemalloc.start()
+    try:
+        await asyncio.gather(*(run_session(turns, offline) for _ in range(count)))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / count / 1024
+
+def calibrate() -> float:
+    """Milliseconds of a fixed pure-Python workload (JSON round trips of the scripted interviews), best of
+    CALIBRATION_ROUNDS. Timings are compared in this unit, measured on the machine running the benchmark"""
+    text = json.dumps(load_interviews(), ensure_ascii=False)
+    best = float("inf")
+    for _ in range(CALIBRATION_ROUNDS):
+        started = time.perf_counter()
+        for _ in range(CALIBRATION_PASSES):
+            json.dumps(json.loads(text), ensure_ascii=False)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+async def run_benchmark(spool_dir: str) -> Dict[str, Any]:
+    results = {}
+    with offline_agent(spool_dir) as offline:
+        for name, turns in load_interviews().items():
+            await run_session(turns, offline)  # warm-up: imports, schema registry, thread pool
+            result = await run_session(turns, offline)
+            result["memory_kib_per_session"] = await measure_memory(turns, offline)
+            results[name] = {key: round(value, 3) for key, value in result.items()}
+    return {"calibration_ms": round(calibrate(), 3), "interviews": results}
+
+def check_against_baseline(results: Dict[str, Any], baseline: Dict) -> List[str]:
+    """Return a description of every metric that regressed beyond the baseline tolerance. Timings (the _ms
+    metrics) are first rescaled by the ratio of the baseline's calibration to this run's"""
+    scale = baseline["calibration_ms"] / results["calibration_ms"]
+    regressions = []
+    for name, metrics in baseline["interviews"].items():
+        for metric, expected in metrics.items():
+            factor, slack = baseline["tolerance"].get(metric, baseline["tolerance"]["default"])
+            actual = results["interviews"][name][metric]
+            if "_ms" in metric:
+                actual = round(actual * scale, 3)
+            if actual > expected * factor + slack:
+                regressions.append(f"{name}.{metric}: {actual} > {expected} * {factor} + {slack}")
+    return regressions
+
+async def test_offline_interview_benchmark_against_baseline(tmp_path):
+    results = await run_benchmark(str(tmp_path))
+    for name, turns in load_interviews().items():
+        recorded = turns[:next(i for i, turn in enumerate(turns) if turn.get("tool") == "end_interview")]
+        assert results["interviews"][name]["turns"] == len(recorded)
+    with open(BASELINE_PATH, encoding="utf-8") as f:
+        baseline = json.load(f)
+    assert check_against_baseline(results, baseline) == []
+
+async def test_entrypoint_uploads_transcript_and_report_offline(tmp_path):
+    turns = load_interviews()["marketplace_inicial"]
+    with offline_agent(str(tmp_path)) as offline:
+        ctx = FakeJobContext()
+        await agent.entrypoint(ctx)
+        session = offline.sessions[-1]
+        await session.replay(turns)
+        await ctx.shutdown()
+        assert agent.get_completion_drainer().outbox.counts() == {"pending": 1} # handed off, not completed in the job
+        assert not any(key.startswith("reports/") for client in offline.s3_clients for key in client.objects)
+        await drain_completions()
+        assert agent.get_completion_drainer().outbox.counts() == {"done": 1}
+    assert session.closed and len(session.said) == 1
+    assert os.listdir(tmp_path) == []
+    objects = {key: client for client in offline.s3_clients for key in client.objects}
+    keys = sorted(objects)
+    assert [key.split("/")[0] for key in keys] == ["index"] + ["journal"] * 2 + ["latency", "reports"]
+    [manifest_key] = [key for key in keys if key.endswith("/manifest.json")]
+    assert json.loads(objects[keys[0]].body(keys[0]))["artifacts"]["transcription"]["key"] == manifest_key # the journal is the transcript
+    _, entries = await TranscriptJournal.read(S3Handler(client=objects[manifest_key], bucket_name="bench"), manifest_key)
+    transcript = " ".join(entry["text"] for entry in entries)
+    assert "Somos dois sócios e uma estagiária." in transcript and "obrigada por compartilhar" not in transcript
+
+async def test_prewarmed_providers_are_used_and_startup_recorded(tmp_path):
+    turns = load_interviews()["marketplace_inicial"]
+    with offline_agent(str(tmp_path)) as offline:
+        ctx = FakeJobContext(userdata={"vad": None, "providers": make_providers()})
+        with mock.patch.object(agent, "build_providers", side_effect=AssertionError("providers rebuilt in the job")):
+            await agent.entrypoint(ctx)
+            await offline.sessions[-1].replay(turns)
+            await ctx.shutdown()
+        await drain_completions()
+    objects = {key: client for client in offline.s3_clients for key in client.objects}
+    [profile_key] = [key for key in objects if key.startswith("latency/")]
+    startup = json.loads(objects[profile_key].body(profile_key))["startup"]
+    assert startup["start"] == "warm" and startup["setup_s"] >= 0
+    assert set(startup["warmup_s"]) == {"openai"}
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as spool_dir:
+        benchmark = asyncio.run(run_benchmark(spool_dir))
+    print(json.dumps(benchmark, indent=2))
+    if "--update-baseline" in sys.argv:
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            baseline = json.load(f)
+        baseline["calibration_ms"] = benchmark["calibration_ms"]
+        baseline["interviews"] = {name: {k: v for k, v in metrics.items() if k != "turns"} for name, metrics in benchmark["interviews"].items()}
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {BASELINE_PATH}")
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+from unittest import mock
+import agent
+import completion_outbox
+from completion_outbox import CompletionOutbox, OutboxDrainer
+from incremental_report import IncrementalReportBuilder
+from report_generator import ReportGenerator
+from s3_handler import S3Handler
+from transcript_journal import TranscriptJournal
+from fakes import FakeLLM, FakeS3Client, report_responder
+
+def _outbox(tmp_path, **kwargs):
+    return CompletionOutbox(str(tmp_path / "outbox.sqlite3"), **kwargs)
+
+def test_enqueue_is_idempotent_and_claims_are_leased(tmp_path):
+    outbox = _outbox(tmp_path, lease_s=0.05)
+    assert outbox.enqueue("INT-1", "job", {"n": 1})
+    assert not outbox.enqueue("INT-1", "job", {"n": 2})
+    [job] = outbox.claim(5)
+    assert (job.payload, job.attempts) == ({"n": 1}, 1)
+    assert outbox.claim(5) == [] # leased to the first drainer
+    time.sleep(0.06)
+    [reclaimed] = outbox.claim(5) # that drainer died: the lease expired
+    assert reclaimed.attempts == 2
+
+async def test_retry_resumes_from_checkpoint(tmp_path):
+    outbox = _outbox(tmp_path)
+    outbox.enqueue("INT-2", "job", {})
+    runs = []
+    async def handler(job, checkpoint):
+        runs.append(dict(job.checkpoint))
+        if "step1" not in job.checkpoint:
+            await checkpoint({"step1": "ok"})
+        if job.attempts == 1:
+            raise RuntimeError("step2 failed")
+    with mock.patch.object(completion_outbox, "RETRY_BASE_DELAY_S", 0.0):
+        await OutboxDrainer(outbox, {"job": handler}).run_until_idle()
+    assert runs == [{}, {"step1": "ok"}]
+    assert outbox.status("INT-2") == "done"
+
+async def test_job_fails_permanently_after_max_attempts(tmp_path):
+    outbox = _outbox(tmp_path, max_attempts=2)
+    outbox.enqueue("INT-3", "job", {})
+    backlog = []
+    async def handler(job, checkpoint):
+        raise RuntimeError("always")
+    with mock.patch.object(completion_outbox, "RETRY_BASE_DELAY_S", 0.0):
+        await OutboxDrainer(outbox, {"job": handler}, on_backlog=backlog.append).run_until_idle()
+    assert outbox.status("INT-3") == "failed"
+    assert outbox.counts() == {"failed": 1} and backlog[-1] == 0
+
+def test_delayed_job_waits_for_its_hand_off(tmp_path):
+    outbox = _outbox(tmp_path)
+    outbox.enqueue("INT-7", "job", {"n": 1}, delay_s=60)
+    assert outbox.claim(5) == [] # held back while the job process finishes its part
+    assert outbox.hand_off("INT-7", {"audio": {"user_audio": "a.ogg"}})
+    [job] = outbox.claim(5)
+    assert job.payload == {"n": 1, "audio": {"user_audio": "a.ogg"}}
+    assert not outbox.hand_off("INT-7", {"audio": {}}) # too late: already claimed
+
+async def test_running_jobs_keep_their_lease_and_are_handed_back_on_stop(tmp_path):
+    outbox = _outbox(tmp_path, lease_s=0.2)
+    outbox.enqueue("INT-5", "job", {})
+    release = asyncio.Event()
+    async def handler(job, checkpoint):
+        await asyncio.sleep(0.3) # outlives the first lease
+        assert outbox.claim(5) == [] # still leased: renewed while running
+        drainer.stop()
+        await release.wait()
+    drainer = OutboxDrainer(outbox, {"job": handler})
+    assert await drainer.poll() == 1
+    await asyncio.sleep(0.35)
+    [taken_over] = outbox.claim(5) # handed back without waiting for the lease, and the attempt not counted
+    assert taken_over.attempts == 1
+    release.set()
+    await drainer.run_until_idle()
+
+async def test_completion_job_resumes_from_incremental_snapshot(tmp_path):
+    llm = FakeLLM(report_responder)
+    builder = IncrementalReportBuilder(ReportGenerator(llm=llm), "INT-4")
+    builder.observe("agent", "Me conte sobre o processo de vendas.")
+    builder.observe("user", "Vendemos pelo WhatsApp e temos um funil no CRM.")
+    snapshot = builder.snapshot()
+    builder.cancel()
+    assert [area for area, _ in snapshot["pending"]] == ["Vendas"]
+    client = FakeS3Client()
+    payload = {"interview_id": "INT-4", "timestamp": "20240101_000000", "full_transcription": "Entrevistado: Vendemos pelo WhatsApp.",
+               "conversation_only": "Entrevistado: Vendemos pelo WhatsApp.", "incremental": snapshot, "latency_profile": {"stages": {}}}
+    outbox = _outbox(tmp_path)
+    outbox.enqueue("INT-4", agent.COMPLETION_JOB, payload)
+    with mock.patch.object(agent, "ReportGenerator", lambda: ReportGenerator(llm=llm)), \
+         mock.patch.object(agent, "S3Handler", lambda: S3Handler(client=client, bucket_name="test-bucket")):
+        await OutboxDrainer(outbox, {agent.COMPLETION_JOB: agent.handle_completion_job}).run_until_idle()
+    assert outbox.status("INT-4") == "done"
+    assert not any("TRANSCRIÇÃO DA ENTREVISTA:" in prompt for prompt in llm.prompts) # finished from the snapshot, no full-report call
+    assert json.loads(client.body("reports/dt=2024-01-01/INT-4_20240101_000000.json"))["areas"][0]["area_name"] == "Vendas"
+    assert sorted(client.objects) == ["index/INT-4.json", "latency/dt=2024-01-01/INT-4_20240101_000000.json",
+                                      "reports/dt=2024-01-01/INT-4_20240101_000000.json", "transcriptions/dt=2024-01-01/INT-4_20240101_000000.txt"]
+
+async def test_recovered_journal_gets_its_completion(tmp_path):
+    client = FakeS3Client()
+    handler = S3Handler(client=client, bucket_name="test-bucket")
+    line = TranscriptJournal.serialize(datetime(2024, 1, 1, 9, 0), "user", "Vendemos pelo WhatsApp.")
+    (tmp_path / "INT-6.jsonl").write_text(line + "\n", encoding="utf-8") # its job process died mid-interview
+    drainer = OutboxDrainer(_outbox(tmp_path), {agent.COMPLETION_JOB: agent.handle_completion_job})
+    llm = FakeLLM(report_responder)
+    with mock.patch.object(agent, "_completion_drainer", drainer), \
+         mock.patch.object(agent, "ReportGenerator", lambda: ReportGenerator(llm=llm)), \
+         mock.patch.object(agent, "S3Handler", lambda: handler):
+        for key, manifest in await TranscriptJournal.recover(handler, str(tmp_path)):
+            agent.enqueue_recovered_completion(key, manifest)
+        await drainer.run_until_idle()
+    assert drainer.outbox.status("INT-6") == "done"
+    assert any("Entrevistado: Vendemos pelo WhatsApp." in prompt for prompt in llm.prompts)
+    index = json.loads(client.body("index/INT-6.json"))
+    assert set(index["artifacts"]) == {"transcription", "report"} and index["artifacts"]["transcription"]["key"] == "journal/INT-6/manifest.json"
@@ -0,0 +1,45 @@
+import asyncio
+import time
+import pytest
+from completion_pipeline import CompletionPipeline, Stage
+
+def _sleeper(seconds, value=None):
+    async def run(inputs):
+        await asyncio.sleep(seconds)
+        return value if value is not None else inputs
+    return run
+
+async def test_independent_stages_run_concurrently():
+    pipeline = CompletionPipeline([
+        Stage("render", _sleeper(0, "texto")),
+        Stage("upload_transcription", _sleeper(0.2), depends_on=("render",)),
+        Stage("generate_report", _sleeper(0.2, {"areas": []}), depends_on=("render",)),
+        Stage("upload_report", _sleeper(0), depends_on=("generate_report",)),
+    ])
+    started = time.perf_counter()
+    result = await pipeline.run()
+    assert time.perf_counter() - started < 0.35
+    assert all(stage.ok for stage in result.stages.values())
+    assert result.value("upload_report") == {"generate_report": {"areas": []}}
+    assert result.stages["generate_report"].duration_s >= 0.2
+
+async def test_timeouts_and_failures_skip_dependents_only():
+    async def boom(_):
+        raise RuntimeError("upload failed")
+    pipeline = CompletionPipeline([
+        Stage("generate_report", _sleeper(1), timeout=0.05),
+        Stage("upload_report", _sleeper(0), depends_on=("generate_report",)),
+        Stage("upload_transcription", boom),
+        Stage("render", _sleeper(0, "ok")),
+    ])
+    result = await pipeline.run()
+    assert result.stages["generate_report"].status == "timeout"
+    assert result.stages["upload_report"].status == "skipped"
+    assert result.stages["upload_transcription"].error == "upload failed"
+    assert result.value("render") == "ok"
+
+def test_rejects_cycles_and_unknown_dependencies():
+    with pytest.raises(ValueError):
+        CompletionPipeline([Stage("a", _sleeper(0), depends_on=("b",)), Stage("b", _sleeper(0), depends_on=("a",))])
+    with pytest.raises(ValueError):
+        CompletionPipeline([Stage("a", _sleeper(0), depends_on=("missing",))])
@@ -0,0 +1,46 @@
+import asyncio
+from livekit.agents.llm import ChatContext
+from context_compactor import ContextCompactor, FACTS_HEADER, estimate_tokens
+from fakes import FakeLLM
+
+def _interview(turns: int) -> ChatContext:
+    chat_ctx = ChatContext()
+    chat_ctx.add_message(role="system", content="Você é a Atena.")
+    for i in range(turns):
+        if i % 2 == 0:
+            chat_ctx.add_message(role="assistant", content=f"Pergunta {i}: como funcionam as vendas hoje?")
+        else:
+            chat_ctx.add_message(role="user", content=f"Resposta {i}: fechamos {i} contratos por mês.")
+    return chat_ctx
+
+async def test_old_turns_replaced_by_area_facts_in_background():
+    summarizer = FakeLLM(lambda prompt: "- fecha contratos todo mês", first_token_s=0.01)
+    compactor = ContextCompactor(llm=summarizer, keep_turns=4, token_budget=10_000)
+    chat_ctx = _interview(12)
+    first = compactor.compact(chat_ctx)
+    assert [item.text_content for item in first.items] == [item.text_content for item in chat_ctx.items] # summary still pending
+    await asyncio.sleep(0.05)
+    compacted = compactor.compact(chat_ctx)
+    texts = [item.text_content for item in compacted.items]
+    assert texts[0] == "Você é a Atena."
+    assert texts[1].startswith(FACTS_HEADER) and "[Vendas]\n- fecha contratos todo mês" in texts[1]
+    assert texts[2:] == [item.text_content for item in chat_ctx.items[-4:]]
+    assert len(chat_ctx.items) == 13 # the session's history is untouched
+    assert len(summarizer.prompts) == 1 and "Resposta 7" in summarizer.prompts[0] and "Resposta 9" not in summarizer.prompts[0]
+
+async def test_token_budget_drops_oldest_verbatim_turns_while_summary_pending():
+    compactor = ContextCompactor(llm=None, keep_turns=6, token_budget=60)
+    compacted = compactor.compact(_interview(20))
+    assert sum(estimate_tokens(item.text_content) for item in compacted.items) <= 60
+    assert compacted.items[0].role == "system"
+    assert compacted.items[-1].text_content.startswith("Resposta 19")
+
+async def test_failed_summary_keeps_turns_for_retry():
+    def broken(prompt):
+        raise RuntimeError("llm down")
+    compactor = ContextCompactor(llm=FakeLLM(broken), keep_turns=2, token_budget=10_000, batch_turns=1)
+    chat_ctx = _interview(6)
+    compactor.compact(chat_ctx)
+    await asyncio.sleep(0.01)
+    assert compactor.facts == {} and compactor.summaries == 0
+    assert len(compactor.compact(chat_ctx).items) == 7
@@ -0,0 +1,41 @@
+import asyncio
+import random
+from conversation_queue import ConversationItemQueue
+
+async def test_items_are_handled_in_order_by_one_task_and_drained():
+    handled = []
+    async def handler(item):
+        await asyncio.sleep(random.random() / 1000)
+        handled.append(item)
+    queue = ConversationItemQueue(handler, maxsize=4)
+    queue.start()
+    tasks_before = len(asyncio.all_tasks())
+    for i in range(20):
+        queue.submit(i)
+    assert len(asyncio.all_tasks()) == tasks_before
+    assert queue.max_overflow == 16
+    assert await queue.drain()
+    assert handled == list(range(20))
+    queue.submit(99)
+    assert 99 not in handled
+
+async def test_put_applies_backpressure_and_errors_do_not_stop_consumer():
+    release = asyncio.Event()
+    handled = []
+    async def handler(item):
+        await release.wait()
+        if item == 0:
+            raise RuntimeError("boom")
+        handled.append(item)
+    queue = ConversationItemQueue(handler, maxsize=1)
+    queue.start()
+    await queue.put(0)
+    await asyncio.sleep(0)
+    await queue.put(1)
+    blocked = asyncio.create_task(queue.put(2))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+    release.set()
+    await blocked
+    assert await queue.drain()
+    assert handled == [1, 2]
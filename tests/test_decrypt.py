@@ -1,4 +1,9 @@
-from decrypt import decrypt_system_prompt
+import base64
+import hashlib
+import os
+import decrypt
+from decrypt import decrypt_system_prompt, get_system_prompt, clear_system_prompt_cache
+from encrypt import encrypt_system_prompt
 
 def test_decrypt_and_print():
     """Test function to decrypt and print the system prompt."""
@@ -13,5 +18,34 @@ def test_decrypt_and_print():
     except Exception as e:
         print(f"Error: {e}")
 
+def test_encrypt_writes_kdf_header_and_roundtrips(tmp_path, monkeypatch):
+    """Encrypted files carry a versioned KDF header and decrypt without probing."""
+    monkeypatch.setenv("ENCRYPTION_KEY", "test-key")
+    plain, encrypted = tmp_path / "prompt.txt", tmp_path / "prompt_encrypted.txt"
+    plain.write_text("Você é a Atena.", encoding="utf-8")
+    encrypt_system_prompt(str(plain), str(encrypted))
+    assert encrypted.read_text(encoding="utf-8").startswith("S2SPROMPT/1 kdf=pbkdf2-sha256 iter=10000\n")
+    calls = []
+    original = decrypt._decrypt_with_kdf
+    monkeypatch.setattr(decrypt, "_decrypt_with_kdf", lambda *args: calls.append(args[2]) or original(*args))
+    assert decrypt_system_prompt(str(encrypted)) == "Você é a Atena."
+    assert calls == ["pbkdf2-sha256"]
+
+def test_legacy_headerless_prompt_is_cached(tmp_path, monkeypatch):
+    """Headerless PBKDF2 files still decrypt, and the cache avoids decrypting twice."""
+    monkeypatch.setenv("ENCRYPTION_KEY", "test-key")
+    salt = os.urandom(8)
+    key_iv = hashlib.pbkdf2_hmac("sha256", b"test-key", salt, 10000, 48)
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    encryptor = Cipher(algorithms.AES(key_iv[:32]), modes.CBC(key_iv[32:])).encryptor()
+    body = "legado".encode("utf-8") + bytes([10] * 10)
+    encrypted = tmp_path / "legacy.txt"
+    encrypted.write_text(base64.b64encode(b"Salted__" + salt + encryptor.update(body) + encryptor.finalize()).decode())
+    clear_system_prompt_cache()
+    assert get_system_prompt(str(encrypted)) == "legado"
+    encrypted.write_text("corrupted")
+    assert get_system_prompt(str(encrypted)) == "legado"
+    clear_system_prompt_cache()
+
 if __name__ == "__main__":
     test_decrypt_and_print()
\ No newline at end of file
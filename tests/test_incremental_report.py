@@ -0,0 +1,108 @@
+import asyncio
+import json
+import os
+import re
+import time
+from incremental_report import IncrementalReportBuilder, detect_area, split_by_area
+from report_assets import SCHEMA_PATH
+from report_generator import ReportGenerator
+from transcription_manager import TranscriptionManager
+from fakes import FakeLLM
+
+STARTUP_INFO = {"name": "TechNova", "revenue_last_12m": 250000, "customers": 320, "time_operating_months": 24}
+
+CLASSIFICATION = {"group": "Prata", "faixa": 4, "overall_score": 5.2, "momentum": "Estável"}
+
+def _responder(prompt: str) -> str:
+    if "AVALIAÇÃO DA STARTUP POR ÁREA:" in prompt:
+        return json.dumps({"final_classification": CLASSIFICATION})
+    match = re.search(r"área: (\w+)\)", prompt)
+    if not match:
+        return json.dumps({"startup_info": STARTUP_INFO})
+    area = match.group(1)
+    score = {"Vendas": 6.5, "Marketing": 4.0}[area]
+    return "```json" + json.dumps({"area": {"area_name": area, "score": score, "faixa": int(score) - 1, "confidence": 0.8, "gaps": [f"lacuna {area}"], "strengths": [f"força {area}"]}, "startup_info": {}}) + "```"
+
+def test_detect_area_is_accent_insensitive():
+    assert detect_area("Agora vamos falar sobre OPERAÇÕES e logística") == "Operações"
+    assert detect_area("Como está a equipe hoje?") == "Time"
+    assert detect_area("Obrigado pela resposta!") is None
+
+def test_legal_as_an_interjection_is_not_the_legal_area():
+    assert detect_area("Legal! E como funciona o processo de vendas?") == "Vendas"
+    assert detect_area("Legal. Quanto vocês faturam por mês?") is None
+    assert detect_area("Que legal! E qual é o seu público-alvo?") is None
+    assert detect_area("Vamos para a parte legal: vocês têm contratos com os clientes?") == "Legal"
+
+async def test_final_classification_of_the_example_report_is_judged_from_every_area():
+    with open(os.path.join(os.path.dirname(SCHEMA_PATH), "example.json"), encoding="utf-8") as f:
+        example = json.load(f)
+    # the example's classification is not an average: the mean area score is 5.8 and the mean faixa 4
+    llm = FakeLLM(lambda prompt: json.dumps({"final_classification": example["final_classification"]}))
+    generator = ReportGenerator(llm=llm)
+    report = await generator.reduce_areas("INT-2025-0806-001", example["startup_info"], {area["area_name"]: area for area in example["areas"]})
+    assert report["final_classification"] == {"group": "Ouro", "faixa": 5, "overall_score": 6.3, "momentum": "Positivo"}
+    assert [area["area_name"] for area in report["areas"]] == [area["area_name"] for area in example["areas"]]
+    [prompt] = llm.prompts
+    assessment = json.loads(prompt.rsplit("AVALIAÇÃO DA STARTUP POR ÁREA:\n", 1)[1])
+    assert assessment["startup_info"] == example["startup_info"]
+    assert [(area["score"], area["faixa"]) for area in assessment["areas"]] == [(area["score"], area["faixa"]) for area in example["areas"]]
+    assert generator.validate_report(report)
+
+async def test_a_failed_classification_is_left_to_repair():
+    generator = ReportGenerator(llm=FakeLLM(lambda prompt: "not json"))
+    report = await generator.reduce_areas("INT-2", STARTUP_INFO, {"Vendas": {"area_name": "Vendas", "score": 6.5, "faixa": 5, "confidence": 0.8}})
+    assert "final_classification" not in report
+
+async def test_areas_are_extracted_while_interview_runs():
+    llm = FakeLLM(_responder)
+    generator = ReportGenerator(llm=llm)
+    builder = IncrementalReportBuilder(generator, "INT-1")
+    manager = TranscriptionManager("INT-1")
+    manager.add_listener(builder.observe)
+    await manager.start_recording()
+    await manager.add_agent_message("Olá! Qual o nome da sua startup?")
+    await manager.add_user_message("TechNova, faturamos 250 mil com 320 clientes.")
+    await manager.add_agent_message("Me conte sobre o processo de vendas.")
+    await manager.add_user_message("Usamos um CRM.")
+    await manager.add_agent_message("E o marketing, quais canais?")
+    await asyncio.sleep(0.01)
+    assert len(llm.prompts) == 2
+    assert "Usamos um CRM." in llm.prompts[1] and "TechNova" not in llm.prompts[1]
+    await manager.add_user_message("Google Ads.")
+    report = await builder.finalize()
+    assert [area["area_name"] for area in report["areas"]] == ["Vendas", "Marketing"]
+    assert report["startup_info"] == STARTUP_INFO
+    assert report["final_classification"] == CLASSIFICATION
+    assert generator.validate_report(report)
+
+CONVERSATION = "\n\n".join([
+    "Entrevistador: Olá! Qual o nome da sua startup?",
+    "Entrevistado: TechNova, faturamos 250 mil com 320 clientes.",
+    "Entrevistador: Me conte sobre o processo de vendas.",
+    "Entrevistado: Usamos um CRM.\n\nE temos dois vendedores.",
+    "Entrevistador: E o marketing, quais canais?",
+    "Entrevistado: Instagram.",
+    "Entrevistador: Voltando às vendas: qual o ticket médio?",
+    "Entrevistado: 800 reais.",
+])
+
+def test_split_by_area_groups_revisited_areas():
+    spans = split_by_area(CONVERSATION)
+    assert list(spans) == [None, "Vendas", "Marketing"]
+    assert spans["Vendas"].count("Entrevistador:") == 2 and "E temos dois vendedores." in spans["Vendas"]
+    assert "Instagram" not in spans["Vendas"] and "TechNova" not in spans["Vendas"]
+
+async def test_sharded_report_runs_areas_concurrently_over_their_spans():
+    llm = FakeLLM(_responder, first_token_s=0.1)
+    generator = ReportGenerator(llm=llm)
+    started = time.perf_counter()
+    report = await generator.generate_sharded_report(CONVERSATION, "INT-3")
+    assert time.perf_counter() - started < 0.25 # three calls of 0.1s each, not 0.3s in sequence
+    assert len(llm.prompts) == 4 # the classification follows the three extractions
+    marketing_prompt = next(p for p in llm.prompts if "área: Marketing)" in p)
+    assert "Instagram" in marketing_prompt and "800 reais" not in marketing_prompt
+    assert [area["area_name"] for area in report["areas"]] == ["Vendas", "Marketing"]
+    assert report["startup_info"] == STARTUP_INFO
+    assert report["final_classification"] == CLASSIFICATION
+    assert generator.validate_report(report)
@@ -0,0 +1,61 @@
+import json
+import pytest
+from json_stream import JSONStreamError, StreamingJSONParser
+from report_generator import ReportGenerator
+from fakes import FakeLLM
+
+REPORT = {
+    "startup_info": {"name": "Tech \"Nova\" {beta}", "revenue_last_12m": 1, "customers": 2, "time_operating_months": 3},
+    "areas": [
+        {"area_name": "Vendas", "score": 6.5, "faixa": 5, "confidence": 0.8, "gaps": ["sem SDR [ainda]"]},
+        {"area_name": "Marketing", "score": 5.0, "faixa": 4, "confidence": 0.7, "extra": {"canais": ["Ads"]}},
+    ],
+    "final_classification": {"group": "Ouro", "faixa": 5, "overall_score": 5.8},
+}
+
+def test_emits_area_items_as_they_close():
+    text = "```json\n" + json.dumps(REPORT, ensure_ascii=False) + "\n```"
+    parser = StreamingJSONParser()
+    emitted_at = []
+    for i in range(0, len(text), 7):
+        for item in parser.feed(text[i:i + 7]):
+            emitted_at.append((i, item["area_name"]))
+    assert [name for _, name in emitted_at] == ["Vendas", "Marketing"]
+    assert emitted_at[0][0] < text.index('"Marketing"')
+    assert parser.close() == REPORT
+
+@pytest.mark.parametrize("text", ["Aqui está o relatório: {", '{"areas": [}', '{"a": 1}} extra', '{"areas": [{"x": 1,}]'])
+def test_fails_fast_on_malformed_structure(text):
+    with pytest.raises(JSONStreamError):
+        StreamingJSONParser().feed(text)
+
+def test_close_rejects_truncated_stream():
+    parser = StreamingJSONParser()
+    parser.feed('{"areas": [')
+    with pytest.raises(JSONStreamError):
+        parser.close()
+
+async def test_generate_report_retries_after_malformed_stream():
+    responses = iter(["Claro! Segue o JSON", json.dumps(REPORT)])
+    llm = FakeLLM(lambda prompt: next(responses))
+    streamed = []
+    report = await ReportGenerator(llm=llm).generate_report("Entrevistado: oi", "INT-1", on_area=streamed.append)
+    assert len(llm.prompts) == 2
+    assert [area["area_name"] for area in streamed] == ["Vendas", "Marketing"]
+    assert report["metadata"]["interview_id"] == "INT-1"
+
+async def test_non_object_area_is_left_to_validation():
+    generator = ReportGenerator(llm=FakeLLM(lambda prompt: json.dumps(REPORT)))
+    async def stream_with_stray_area(system, prompt, array_key, on_item):
+        for area in ["Vendas", *REPORT["areas"]]:
+            on_item(area)
+        return json.loads(json.dumps(REPORT))
+    generator._stream_json = stream_with_stray_area
+    streamed = []
+    report = await generator.generate_report("Entrevistado: oi", "INT-1", on_area=streamed.append)
+    assert [area["area_name"] for area in streamed] == ["Vendas", "Marketing"]
+    assert report["metadata"]["interview_id"] == "INT-1"
+
+async def test_generate_report_returns_none_when_all_attempts_fail():
+    llm = FakeLLM(lambda prompt: '{"areas": [')
+    assert await ReportGenerator(llm=llm).generate_report("Entrevistado: oi", "INT-1") is None
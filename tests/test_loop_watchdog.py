@@ -0,0 +1,50 @@
+import asyncio
+import json
+import time
+import loop_watchdog
+from loop_watchdog import InterviewProfile
+from worker_load import EventLoopLagProbe
+
+def blocking_report_step():
+    time.sleep(0.2) # a synchronous call on the event loop
+
+async def test_watchdog_records_the_stack_of_a_blocking_callback(tmp_path):
+    profile = InterviewProfile("INT-1")
+    probe = EventLoopLagProbe(interval=0.01, profile=profile)
+    probe.start()
+    await asyncio.sleep(0.05)
+    blocking_report_step()
+    await asyncio.sleep(0.05)
+    probe.stop()
+    assert profile.stall_count == 1
+    stall = profile.stalls[0]
+    assert stall["duration_ms"] >= 150
+    assert stall["stack"][-1].startswith("test_loop_watchdog.py:") and stall["stack"][-1].endswith(":blocking_report_step")
+    path = profile.write(str(tmp_path))
+    with open(path) as f:
+        written = json.load(f)
+    assert written["stall_count"] == 1 and written["max_lag_ms"] >= 150
+    assert path.endswith("INT-1.session.json")
+
+async def test_sections_are_timed_and_sampled_when_enabled(monkeypatch):
+    monkeypatch.setattr(loop_watchdog, "PROFILE_SAMPLING", True)
+    profile = InterviewProfile("INT-2", kind="completion")
+
+    async def generate_report():
+        blocking_report_step()
+        return "report"
+
+    assert await profile.wrap("generate_report", generate_report)() == "report"
+    await profile.wrap("generate_report", generate_report)()
+    section = profile.to_dict()["sections"]["generate_report"]
+    assert section["calls"] == 2 and section["wall_s"] >= 0.4
+    assert section["samples"] > 10
+    assert "blocking_report_step" in section["top_stacks"][0]["stack"]
+
+async def test_sections_are_only_timed_by_default():
+    profile = InterviewProfile("INT-3")
+    opened = profile.begin("entrypoint")
+    await asyncio.sleep(0.01)
+    profile.end(opened)
+    assert profile.to_dict()["sections"] == {"entrypoint": {"calls": 1, "wall_s": profile.sections["entrypoint"]["wall_s"], "samples": 0}}
+    assert profile.sections["entrypoint"]["wall_s"] >= 0.01
@@ -0,0 +1,37 @@
+import os
+from phrase_audio import PhraseAudioCache
+from fakes import FakeAgentSession, FakeTTS
+
+class RecordingSession(FakeAgentSession):
+    def __init__(self):
+        super().__init__()
+        self.audio_frames = []
+
+    async def say(self, text, audio=None, **kwargs):
+        if audio is not None:
+            self.audio_frames.append([frame async for frame in audio])
+        await super().say(text, **kwargs)
+
+async def test_warm_stores_phrases_shared_across_processes(tmp_path):
+    tts = FakeTTS()
+    cache = PhraseAudioCache(directory=str(tmp_path))
+    assert await cache.warm(tts, "voice", "model", ["Olá!", "Tchau."]) == 2
+    assert await cache.warm(tts, "voice", "model", ["Olá!", "Tchau."]) == 0
+    assert tts.requests == ["Olá!", "Tchau."]
+    assert len(os.listdir(tmp_path)) == 2
+    other_process = PhraseAudioCache(directory=str(tmp_path))
+    assert other_process.load("voice", "model", ["Olá!", "Tchau.", "Desconhecida"]) == 2
+    assert other_process.get("voice", "model", "Olá!") == cache.get("voice", "model", "Olá!")
+    assert other_process.get("other-voice", "model", "Olá!") is None
+
+async def test_say_replays_cached_audio_and_falls_back_to_live_tts(tmp_path):
+    cache = PhraseAudioCache(directory=str(tmp_path))
+    audio = await cache.synthesize(FakeTTS(sample_rate=16000), "voice", "model", "Com isso vou encerrar.")
+    session = RecordingSession()
+    await cache.say(session, "Com isso vou encerrar.", "voice", "model")
+    await cache.say(session, "Outra frase.", "voice", "model")
+    assert session.said == ["Com isso vou encerrar.", "Outra frase."]
+    assert len(session.audio_frames) == 1
+    frames = session.audio_frames[0]
+    assert all(frame.samples_per_channel == 320 for frame in frames[:-1]) # 20 ms at 16 kHz
+    assert b"".join(bytes(frame.data) for frame in frames) == audio.pcm
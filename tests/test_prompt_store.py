@@ -0,0 +1,63 @@
+import json
+from unittest import mock
+import agent
+import prompt_store
+from prompt_store import PromptStore, publish
+from report_assets import SCHEMA_PATH, get_report_assets, set_report_assets
+from report_generator import ReportGenerator
+from s3_handler import S3Handler
+from fakes import FakeLLM, FakeS3Client, report_responder
+
+def _release_files(tmp_path, text: str, schema_version: str):
+    with open(SCHEMA_PATH, encoding="utf-8") as f:
+        schema = json.load(f)
+    prompt, schema_file = tmp_path / f"prompt-{schema_version}.txt", tmp_path / f"schema-{schema_version}.json"
+    prompt.write_text(text, encoding="utf-8")
+    schema_file.write_text(json.dumps({**schema, "version": schema_version}), encoding="utf-8")
+    return str(prompt), str(schema_file)
+
+def test_new_releases_switch_atomically_and_broken_ones_are_rejected(tmp_path, monkeypatch):
+    monkeypatch.setenv("ENCRYPTION_KEY", "test-key")
+    store_dir = str(tmp_path / "store")
+    publish(store_dir, "v1", *_release_files(tmp_path, "Você é a Atena.", "1"))
+    store = PromptStore(location=store_dir)
+    try:
+        first = store.active()
+        assert (first.version, first.system_prompt, first.assets.version) == ("v1", "Você é a Atena.", "1")
+        publish(store_dir, "v2", *_release_files(tmp_path, "Você é a Atena, versão 2.", "2"))
+        assert first.system_prompt == "Você é a Atena." # a running session keeps what it pinned
+        assert store.refresh() and store.current.version == "v2"
+        assert get_report_assets().version == "2"
+        assert not store.refresh() # unchanged
+        (tmp_path / "store" / "v3").mkdir()
+        (tmp_path / "store" / "v3" / "schema.json").write_text("{not json")
+        (tmp_path / "store" / "v3" / "system_prompt_encrypted.txt").write_bytes((tmp_path / "store" / "v2" / "system_prompt_encrypted.txt").read_bytes())
+        (tmp_path / "store" / "CURRENT").write_text("v3")
+        assert not store.refresh() and store.current.version == "v2"
+        assert store.release("v1") is first
+        assert store.release("gone").version == "v2"
+    finally:
+        set_report_assets(None)
+
+async def test_completion_uses_the_release_the_session_pinned(tmp_path, monkeypatch):
+    monkeypatch.setenv("ENCRYPTION_KEY", "test-key")
+    store_dir = str(tmp_path / "store")
+    publish(store_dir, "v1", *_release_files(tmp_path, "Você é a Atena.", "1"))
+    publish(store_dir, "v2", *_release_files(tmp_path, "Você é a Atena, versão 2.", "2"))
+    store = PromptStore(location=store_dir)
+    monkeypatch.setattr(prompt_store, "MAX_CACHED_RELEASES", 1) # v1 has to be fetched again by version
+    client = FakeS3Client()
+    payload = {"interview_id": "INT-5", "timestamp": "20240101_000000", "full_transcription": "Entrevistado: Vendemos pelo WhatsApp.",
+               "conversation_only": "Entrevistado: Vendemos pelo WhatsApp.", "latency_profile": {"stages": {}}, "prompt_release": "v1"}
+    async def no_checkpoint(_):
+        pass
+    try:
+        assert store.active().version == "v2"
+        with mock.patch.object(agent, "get_prompt_store", lambda: store):
+            await agent.run_interview_completion(payload, {}, no_checkpoint, report_generator=ReportGenerator(llm=FakeLLM(report_responder)),
+                                                 s3_handler=S3Handler(client=client, bucket_name="test-bucket"))
+    finally:
+        set_report_assets(None)
+    metadata = json.loads(client.body("reports/dt=2024-01-01/INT-5_20240101_000000.json"))["metadata"]
+    assert (metadata["prompt_release"], metadata["schema_version"]) == ("v1", "1")
+    assert client.objects["reports/dt=2024-01-01/INT-5_20240101_000000.json"]["Metadata"]["schema_version"] == "1" # not the active release's
@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+from livekit import rtc
+from livekit.agents import APIConnectionError
+from livekit.agents.llm import ChatContext
+from provider_router import HedgedLLM, HedgedSTT, ProviderRouter
+from fakes import FakeLLM, FakeSTT
+
+def _router(*names: str, budget_s: float = 0.05) -> ProviderRouter:
+    router = ProviderRouter("test", names)
+    router.default_budget_s = router.min_budget_s = budget_s
+    return router
+
+def _delayed(delays, cancelled=None, failing=()):
+    async def attempt(index):
+        try:
+            await asyncio.sleep(delays[index])
+        except asyncio.CancelledError:
+            if cancelled is not None:
+                cancelled.append(index)
+            raise
+        if index in failing:
+            raise RuntimeError(f"backend {index} down")
+        return f"answer {index}"
+    return attempt
+
+async def test_hedge_fires_after_the_budget_and_the_loser_is_cancelled():
+    router = _router("slow", "fast")
+    cancelled = []
+    index, answer = await router.race(_delayed([1.0, 0.01], cancelled))
+    assert (index, answer) == (1, "answer 1") and cancelled == [0]
+    assert router.backends[0].samples[0] >= 0.05 # the loser's lower bound is kept
+
+async def test_no_hedge_when_the_primary_answers_within_budget():
+    router = _router("a", "b", budget_s=0.2)
+    started = []
+    async def attempt(index):
+        started.append(index)
+        await asyncio.sleep(0.01)
+        return index
+    assert await router.race(attempt) == (0, 0) and started == [0]
+
+async def test_errors_fail_over_at_once_and_deprioritize_the_backend():
+    router = _router("flaky", "backup", budget_s=5.0)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    assert await router.race(_delayed([0.0, 0.01], failing={0})) == (1, "answer 1")
+    assert loop.time() - started < 1.0 # did not wait for the 5 s budget
+    assert router.order() == [1, 0]
+    with pytest.raises(APIConnectionError):
+        await router.race(_delayed([0.0, 0.0], failing={0, 1}))
+
+def test_budget_follows_the_recent_p95():
+    router = ProviderRouter("llm", ["a", "b"])
+    assert router.budget(0) == router.default_budget_s
+    for seconds in [0.5] * 9 + [3.0]:
+        router.record_latency(0, seconds)
+    assert router.budget(0) == 3.0
+    router.record_latency(0, 60.0)
+    assert router.budget(0) == router.max_budget_s
+    assert 0.5 < router.backends[0].ewma_s < 60.0
+
+async def test_hedged_llm_streams_the_faster_backend():
+    slow = FakeLLM(lambda prompt: "lento", first_token_s=1.0)
+    fast = FakeLLM(lambda prompt: "rápido e completo", chunk_size=4)
+    hedged = HedgedLLM([slow, fast], router=_router("slow", "fast"))
+    chat_ctx = ChatContext()
+    chat_ctx.add_message(role="user", content="Olá")
+    text = ""
+    async with hedged.chat(chat_ctx=chat_ctx) as stream:
+        async for chunk in stream:
+            text += chunk.delta.content
+    assert text == "rápido e completo" and slow.prompts == fast.prompts == ["Olá"]
+
+async def test_hedged_stt_fails_over_on_error():
+    primary = FakeSTT("primeiro", error=RuntimeError("503"))
+    backup = FakeSTT("segundo", delay_s=0.01)
+    hedged = HedgedSTT([primary, backup], router=_router("primary", "backup"))
+    frame = rtc.AudioFrame(data=bytes(320), sample_rate=16000, num_channels=1, samples_per_channel=160)
+    event = await hedged.recognize(frame)
+    assert event.alternatives[0].text == "segundo" and primary.calls == backup.calls == 1
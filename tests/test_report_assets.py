@@ -0,0 +1,29 @@
+import json
+import os
+import report_assets
+from report_assets import get_report_assets, reload_report_assets, set_report_assets, load_report_assets
+
+def test_registry_is_loaded_once_independent_of_cwd(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    set_report_assets(None)
+    assets = get_report_assets()
+    assert assets is get_report_assets()
+    assert "Vendas" in assets.area_prompt_prefixes
+    assert assets.report_prompt_prefix.endswith("TRANSCRIÇÃO DA ENTREVISTA:\n")
+    assert not assets.validator.is_valid({"areas": []})
+
+def test_reload_swaps_only_when_schema_changes(tmp_path):
+    path = tmp_path / "schema.json"
+    schema = json.loads(open(report_assets.SCHEMA_PATH, encoding="utf-8").read())
+    path.write_text(json.dumps(schema), encoding="utf-8")
+    set_report_assets(load_report_assets(str(path)))
+    original = get_report_assets()
+    assert reload_report_assets() is original
+    schema["version"] = "2.0"
+    path.write_text(json.dumps(schema), encoding="utf-8")
+    os.utime(path, (original.mtime + 5, original.mtime + 5))
+    assert reload_report_assets().version == "2.0"
+    path.write_text("{not json", encoding="utf-8")
+    os.utime(path, (original.mtime + 10, original.mtime + 10))
+    assert reload_report_assets().version == "2.0"
+    set_report_assets(None)
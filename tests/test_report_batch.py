@@ -0,0 +1,93 @@
+import asyncio
+import json
+import time
+from report_batch import RateLimiter, ReportBatch, parse_transcript_key
+from report_generator import ReportGenerator
+from s3_handler import S3Handler
+from transcript_journal import TranscriptJournal
+from transcription_manager import TranscriptionManager
+from fakes import FakeLLM, FakeS3Client, report_responder
+
+async def _store_transcript(handler: S3Handler, interview_id: str, answer: str):
+    manager = TranscriptionManager(interview_id)
+    await manager.start_recording()
+    await manager.add_agent_message("Me conte sobre o processo de vendas.")
+    await manager.add_user_message(answer)
+    await handler.upload_transcription(interview_id, await manager.get_full_transcription(), timestamp="20240101_120000")
+
+async def _bucket(count: int):
+    handler = S3Handler(client=FakeS3Client(), bucket_name="test-bucket")
+    for i in range(count):
+        await _store_transcript(handler, f"INT-{i}", f"Vendemos pelo canal {i}.")
+    return handler
+
+def test_transcript_keys_are_parsed():
+    assert parse_transcript_key("transcriptions/INT-20240101-120000-ab12cd34_20240101_120500.txt") == {
+        "interview_id": "INT-20240101-120000-ab12cd34", "timestamp": "20240101_120500"}
+    assert parse_transcript_key("transcriptions/dt=2024-01-01/INT-7_20240101_120500.txt") == {"interview_id": "INT-7", "timestamp": "20240101_120500"}
+    assert parse_transcript_key("transcriptions/notes.txt") is None
+
+async def test_batch_regenerates_reports_then_serves_them_from_the_cache(tmp_path):
+    handler = await _bucket(3)
+    llm = FakeLLM(report_responder)
+    result = await ReportBatch(ReportGenerator(llm=llm), handler, checkpoint_path=str(tmp_path / "a.json"), requests_per_minute=6000).run()
+    assert sorted(result.generated) == [f"transcriptions/dt=2024-01-01/INT-{i}_20240101_120000.txt" for i in range(3)]
+    report = json.loads(handler.s3_client.body("reports/dt=2024-01-01/INT-1_20240101_120000.json"))
+    assert report["metadata"]["interview_id"] == "INT-1" and "prompt_version" in report["metadata"]
+    assert report["metadata"]["transcript_tokens"]["compacted"] <= report["metadata"]["transcript_tokens"]["raw"]
+    assert any("Vendemos pelo canal 1." in prompt for prompt in llm.prompts)
+    index = await handler.download_index("INT-1")
+    assert index["artifacts"]["report"] == await handler.describe_object("reports/dt=2024-01-01/INT-1_20240101_120000.json")
+    calls = len(llm.prompts)
+    # a fresh checkpoint, same transcripts, schema and prompts: every report comes from the cache
+    again = await ReportBatch(ReportGenerator(llm=llm), handler, checkpoint_path=str(tmp_path / "b.json")).run()
+    assert len(again.cached) == 3 and not again.generated and len(llm.prompts) == calls
+
+async def test_rewritten_report_replaces_the_stale_index_entry(tmp_path):
+    handler = await _bucket(1)
+    transcript_key = "transcriptions/dt=2024-01-01/INT-0_20240101_120000.txt"
+    old_report = await handler.upload_report("INT-0", {"areas": []}, timestamp="20240101_120000")
+    latency = await handler.upload_latency_profile("INT-0", {"stages": {}}, timestamp="20240101_120000")
+    await handler.upload_index("INT-0", "20240101_120000", {"transcription": transcript_key, "report": old_report, "latency_profile": latency})
+    stale = (await handler.download_index("INT-0"))["artifacts"]["report"]
+    await ReportBatch(ReportGenerator(llm=FakeLLM(report_responder)), handler, checkpoint_path=str(tmp_path / "c.json"), requests_per_minute=6000).run()
+    artifacts = (await handler.download_index("INT-0"))["artifacts"]
+    assert set(artifacts) == {"transcription", "report", "latency_profile"} and artifacts["latency_profile"]["key"] == latency
+    assert artifacts["report"]["key"] == old_report and artifacts["report"]["sha256"] != stale["sha256"]
+    assert artifacts["report"] == await handler.describe_object(old_report)
+
+async def test_sealed_journals_are_transcripts_too(tmp_path):
+    handler = await _bucket(1)
+    journal = TranscriptJournal("INT-9", s3_handler=handler, directory=str(tmp_path / "spool"), chunk_entries=1)
+    manager = TranscriptionManager("INT-9", journal=journal)
+    await manager.start_recording()
+    await manager.add_agent_message("Me conte sobre o processo de vendas.")
+    await manager.add_user_message("Vendemos pelo canal 9.")
+    manifest_key = await journal.seal("20240102_080000")
+    llm = FakeLLM(report_responder)
+    result = await ReportBatch(ReportGenerator(llm=llm), handler, checkpoint_path=str(tmp_path / "j.json"), requests_per_minute=6000).run()
+    assert sorted(result.generated) == [manifest_key, "transcriptions/dt=2024-01-01/INT-0_20240101_120000.txt"] # chunks are skipped
+    assert any("Entrevistado: Vendemos pelo canal 9." in prompt for prompt in llm.prompts)
+    assert (await handler.download_index("INT-9"))["artifacts"]["transcription"]["key"] == manifest_key
+    assert json.loads(handler.s3_client.body("reports/dt=2024-01-02/INT-9_20240102_080000.json"))["metadata"]["interview_id"] == "INT-9"
+
+async def test_interrupted_batch_resumes_from_checkpoint(tmp_path):
+    handler = await _bucket(3)
+    def flaky(prompt):
+        if "canal 2" in prompt:
+            raise RuntimeError("provider down")
+        return report_responder(prompt)
+    checkpoint = str(tmp_path / "checkpoint.json")
+    first = await ReportBatch(ReportGenerator(llm=FakeLLM(flaky)), handler, checkpoint_path=checkpoint, requests_per_minute=6000).run()
+    assert list(first.failed) == ["transcriptions/dt=2024-01-01/INT-2_20240101_120000.txt"] and len(first.generated) == 2
+    llm = FakeLLM(report_responder)
+    second = await ReportBatch(ReportGenerator(llm=llm), handler, checkpoint_path=checkpoint, requests_per_minute=6000).run()
+    assert len(second.resumed) == 2 and second.generated == ["transcriptions/dt=2024-01-01/INT-2_20240101_120000.txt"]
+    assert not any("canal 0" in prompt or "canal 1" in prompt for prompt in llm.prompts)
+    assert any("canal 2" in prompt for prompt in llm.prompts)
+
+async def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(per_minute=1200)  # one every 50 ms
+    started = time.monotonic()
+    await asyncio.gather(*(limiter.acquire() for _ in range(4)))
+    assert time.monotonic() - started >= 0.14
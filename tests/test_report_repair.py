@@ -0,0 +1,61 @@
+import json
+from report_assets import get_report_assets
+from report_generator import ReportGenerator
+from report_repair import collect_repair_targets
+from fakes import FakeLLM
+
+STARTUP_INFO = {"name": "TechNova", "revenue_last_12m": 250000, "customers": 320, "time_operating_months": 24}
+VENDAS = {"area_name": "Vendas", "score": 6.5, "faixa": 5, "confidence": 0.8, "evidences": ["CRM com funil documentado"]}
+MARKETING = {"area_name": "Marketing", "score": 4.0, "faixa": 3, "confidence": 0.6}
+
+def _broken_report():
+    return {
+        "metadata": {"interview_id": "INT-1", "date": "2024-01-01T00:00:00"},
+        "startup_info": {k: v for k, v in STARTUP_INFO.items() if k != "customers"},
+        "areas": [VENDAS, {**MARKETING, "faixa": 12}],
+    }
+
+def _repair_responder(prompt: str) -> str:
+    patches = {}
+    if "Caminho: /areas/1\n" in prompt:
+        patches["/areas/1"] = MARKETING
+    if "Caminho: /startup_info\n" in prompt:
+        patches["/startup_info"] = STARTUP_INFO
+    if "Caminho: /final_classification\n" in prompt:
+        patches["/final_classification"] = {"group": "Prata", "faixa": 4, "overall_score": 5.2}
+    return json.dumps(patches)
+
+def test_errors_grouped_by_failing_sub_object():
+    targets = {target.path: target for target in collect_repair_targets(get_report_assets().validator, _broken_report())}
+    assert set(targets) == {("areas", 1), ("startup_info",), ("final_classification",)}
+    assert "12 is greater than the maximum of 9" in targets[("areas", 1)].errors[0]
+    assert targets[("startup_info",)].needs_transcript and not targets[("areas", 1)].needs_transcript
+
+async def test_repair_sends_only_failing_fragments_and_patches_them():
+    llm = FakeLLM(_repair_responder)
+    generator = ReportGenerator(llm=llm)
+    report = _broken_report()
+    assert await generator.repair_report(report, "Entrevistado: temos 320 clientes.")
+    assert report["areas"] == [VENDAS, MARKETING] and report["startup_info"] == STARTUP_INFO
+    assert len(llm.prompts) == 1
+    assert "CRM com funil documentado" not in llm.prompts[0] # valid areas are not resent
+    assert "temos 320 clientes" in llm.prompts[0]
+
+async def test_repair_ignores_unrequested_paths():
+    generator = ReportGenerator(llm=FakeLLM(lambda prompt: json.dumps({"/areas/0": {"area_name": "Legal"}})))
+    report = _broken_report()
+    assert not await generator.repair_report(report, max_rounds=1)
+    assert report["areas"][0] == VENDAS
+
+async def test_malformed_report_json_is_salvaged_from_streamed_areas():
+    full = json.dumps({"startup_info": STARTUP_INFO, "areas": [VENDAS, MARKETING], "final_classification": {}})
+    truncated = full[:full.index('"final_classification"')] + '"final_classification": {]'
+    def responder(prompt):
+        return _repair_responder(prompt) if "TRECHOS COM ERRO" in prompt else truncated.replace(json.dumps(STARTUP_INFO), "{}")
+    llm = FakeLLM(responder)
+    report = await ReportGenerator(llm=llm).generate_report("Entrevistado: TechNova.", "INT-2")
+    assert [area["area_name"] for area in report["areas"]] == ["Vendas", "Marketing"]
+    assert report["startup_info"] == STARTUP_INFO
+    assert report["final_classification"] == {"group": "Prata", "faixa": 4, "overall_score": 5.2}
+    assert get_report_assets().validator.is_valid(report)
+    assert sum("TRECHOS COM ERRO" in prompt for prompt in llm.prompts) == 1
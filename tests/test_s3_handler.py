@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import json
+import pytest
+import s3_handler
+from s3_handler import S3Handler, StreamingUpload
+from fakes import FakeS3Client
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(s3_handler, "RETRY_BASE_DELAY", 0.001)
+
+async def test_uploads_do_not_block_event_loop():
+    """A slow put_object runs on the upload pool while the loop keeps ticking."""
+    client = FakeS3Client(latency_s=0.2)
+    handler = S3Handler(client=client, bucket_name="test-bucket")
+    ticks = 0
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+    task = asyncio.create_task(ticker())
+    key = await handler.upload_report("INT-1", {"areas": []})
+    task.cancel()
+    assert ticks >= 10
+    assert json.loads(client.body(key)) == {"areas": []}
+    assert handler.upload_stats[0].success and handler.upload_stats[0].duration_s >= 0.2
+
+async def test_retries_transient_errors_then_gives_up_on_fatal():
+    client = FakeS3Client(fail_times=2)
+    handler = S3Handler(client=client, bucket_name="test-bucket")
+    assert await handler.upload_transcription("INT-1", "olá") is not None
+    assert handler.upload_stats[-1].attempts == 3
+    client.fail_times, client.fail_code = 1, "AccessDenied"
+    assert await handler.upload_transcription("INT-1", "olá") is None
+    assert handler.upload_stats[-1].success is False
+
+async def test_large_bodies_use_multipart(monkeypatch):
+    monkeypatch.setattr(s3_handler, "MULTIPART_THRESHOLD", 10)
+    monkeypatch.setattr(s3_handler, "MULTIPART_CHUNK_SIZE", 4)
+    client = FakeS3Client()
+    handler = S3Handler(client=client, bucket_name="test-bucket")
+    key = await handler.upload_bytes("big.bin", b"abcdefghijklmn")
+    assert client.body(key) == b"abcdefghijklmn"
+    assert client.calls.count("upload_part") == 4
+    assert handler.upload_stats[0].parts == 4
+
+async def test_listing_pages_and_downloads():
+    client = FakeS3Client()
+    handler = S3Handler(client=client, bucket_name="test-bucket")
+    for i in range(5):
+        await handler.upload_bytes(f"transcriptions/INT-{i}_20240101_000000.txt", f"t{i}".encode())
+    await handler.upload_bytes("reports/INT-0_20240101_000000.json", b"{}")
+    keys = [entry["Key"] async for entry in handler.list_objects("transcriptions/", page_size=2)]
+    assert keys == [f"transcriptions/INT-{i}_20240101_000000.txt" for i in range(5)]
+    assert client.calls.count("list_objects_v2") == 3
+    assert await handler.download_bytes(keys[1]) == b"t1"
+    assert await handler.download_bytes("transcriptions/missing.txt") is None
+    assert await handler.exists(keys[0]) and not await handler.exists("transcriptions/missing.txt")
+    assert client.calls.count("head_object") == 2 # a missing object is not retried
+
+async def test_artifacts_are_gzipped_under_date_partitions():
+    client = FakeS3Client()
+    handler = S3Handler(client=client, bucket_name="test-bucket")
+    text = "Entrevistado: vendemos pelo WhatsApp. " * 200
+    key = await handler.upload_transcription("INT-1", text, timestamp="20240315_093000")
+    assert key == "transcriptions/dt=2024-03-15/INT-1_20240315_093000.txt"
+    stored = client.objects[key]
+    assert stored["ContentEncoding"] == "gzip" and stored["ContentType"] == "text/plain; charset=utf-8"
+    assert len(stored["Body"]) < len(text) // 10
+    assert await handler.download_bytes(key) == text.encode()
+
+async def test_identity_coding_uploads_plain_bodies():
+    client = FakeS3Client()
+    handler = S3Handler(client=client, bucket_name="test-bucket", content_coding="identity")
+    key = await handler.upload_report("INT-1", {"areas": []}, timestamp="20240315_093000")
+    assert "ContentEncoding" not in client.objects[key]
+    assert json.loads(client.objects[key]["Body"]) == {"areas": []}
+
+def test_unknown_content_coding_is_rejected():
+    with pytest.raises(ValueError):
+        S3Handler(client=FakeS3Client(), bucket_name="test-bucket", content_coding="br")
+
+async def test_index_maps_artifacts_to_keys_sizes_and_hashes():
+    client = FakeS3Client()
+    handler = S3Handler(client=client, bucket_name="test-bucket")
+    transcription = "Entrevistador: olá\n" * 50
+    artifacts = {
+        "transcription": await handler.upload_transcription("INT-9", transcription, timestamp="20240315_093000"),
+        "report": await handler.upload_report("INT-9", {"areas": []}, timestamp="20240315_093000"),
+    }
+    assert await handler.upload_index("INT-9", "20240315_093000", artifacts) == "index/INT-9.json"
+    index = await handler.download_index("INT-9")
+    entry = index["artifacts"]["transcription"]
+    assert entry["key"] == artifacts["transcription"] and entry["content_encoding"] == "gzip"
+    assert entry["size_bytes"] == len(transcription.encode()) and entry["stored_bytes"] == len(client.objects[entry["key"]]["Body"])
+    assert entry["sha256"] == hashlib.sha256(transcription.encode()).hexdigest()
+    assert await handler.download_index("INT-0") is None
+
+async def test_streaming_upload_sends_parts_as_they_are_produced():
+    client = FakeS3Client()
+    handler = S3Handler(client=client, bucket_name="test-bucket")
+    upload = StreamingUpload(handler, "audio/a.ogg", ContentType="audio/ogg")
+    await upload.write_part(b"abcd")
+    await upload.write_part(b"efgh")
+    assert client.calls.count("upload_part") == 2 and "audio/a.ogg" not in client.objects
+    assert await upload.complete(b"ij") == "audio/a.ogg"
+    assert client.body("audio/a.ogg") == b"abcdefghij" and client.objects["audio/a.ogg"]["ContentType"] == "audio/ogg"
+    small = StreamingUpload(handler, "audio/b.ogg")
+    assert await small.complete(b"xy") == "audio/b.ogg" and client.calls.count("put_object") == 1
@@ -0,0 +1,50 @@
+from incremental_report import split_by_area
+from transcript_compactor import compact_transcript, count_tokens
+
+CONVERSATION = """Entrevistador: Olá! Eu sou a Atena e vou conduzir o diagnóstico. Para começar, qual é o nome da sua startup e o que ela faz?
+
+Entrevistado: Hum, a gente se chama TechNova, né? A gente a gente faz software de gestão.
+
+Entrevistado: Pra pequenas empresas.
+
+Entrevistador: Muito obrigado. Agora vamos falar da parte comercial, que é muito importante. Como funciona o processo de vendas [INTERROMPIDO]
+
+Entrevistador: Agora vamos falar de vendas. Quem vende hoje e por quais canais?
+
+Entrevistado: Ahn, vendemos pelo WhatsApp e temos um funil no CRM, hmm, com ticket médio de 300 reais."""
+
+def test_fragments_are_merged_and_questions_kept_as_stubs():
+    compacted = compact_transcript(CONVERSATION)
+    assert compacted.text.split("\n\n") == [
+        "Entrevistador: Para começar, qual é o nome da sua startup e o que ela faz?",
+        "Entrevistado: a gente se chama TechNova. A gente faz software de gestão. Pra pequenas empresas.",
+        "Entrevistador: (Vendas) Quem vende hoje e por quais canais?",
+        "Entrevistado: vendemos pelo WhatsApp e temos um funil no CRM, com ticket médio de 300 reais.",
+    ]
+    assert (compacted.turns_before, compacted.turns_after, compacted.truncated_turns) == (6, 4, 0)
+    assert compacted.tokens_saved > 0 and compacted.tokens_after == count_tokens(compacted.text)
+    # the sharded report still sees the same areas
+    assert split_by_area(compacted.text).keys() == split_by_area(CONVERSATION).keys() == {None, "Vendas"}
+
+def test_an_interrupted_fragment_does_not_take_earlier_turns_with_it():
+    conversation = "\n\n".join([
+        "Entrevistador: Como é o time?",
+        "Entrevistado: Somos três sócios fundadores.",
+        "Entrevistado: O CTO veio do Google e [INTERROMPIDO]",
+        "Entrevistado: e temos dois devs.",
+    ])
+    assert compact_transcript(conversation).text.split("\n\n")[1] == "Entrevistado: Somos três sócios fundadores. e temos dois devs."
+
+def test_longest_answers_are_capped_to_fit_the_budget():
+    conversation = "\n\n".join(f"Entrevistador: Como é o time {i}?\n\nEntrevistado: " + " ".join(f"fato{j}" for j in range(40 + 60 * i))
+                               for i in range(5))
+    compacted = compact_transcript(conversation, budget=600)
+    answers = compacted.text.split("\n\n")[1::2]
+    assert compacted.tokens_after <= 600 < compacted.tokens_before
+    assert answers[0].endswith("fato39") # short answers are left whole
+    assert all(answer.endswith(" […]") for answer in answers[2:]) and compacted.truncated_turns >= 3
+    assert all(question.endswith("?") for question in compacted.text.split("\n\n")[::2])
+
+def test_text_that_is_not_a_conversation_is_left_alone():
+    compacted = compact_transcript("No conversation available.")
+    assert compacted.text == "No conversation available." and compacted.tokens_saved == 0
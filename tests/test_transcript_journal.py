@@ -0,0 +1,54 @@
+import asyncio
+import json
+import os
+from datetime import datetime
+from s3_handler import S3Handler
+from transcript_journal import TranscriptJournal
+from transcription_manager import TranscriptionManager
+from fakes import FakeS3Client
+
+async def test_entries_are_spooled_and_chunks_streamed(tmp_path):
+    client = FakeS3Client()
+    journal = TranscriptJournal("INT-1", s3_handler=S3Handler(client=client, bucket_name="b"), directory=str(tmp_path), batch_size=2, chunk_entries=3)
+    manager = TranscriptionManager("INT-1", journal=journal)
+    await manager.start_recording()
+    for i in range(4):
+        await manager.add_user_message(f"resposta {i}")
+        await manager.add_agent_message(f"pergunta {i}")
+    await asyncio.sleep(0.05)
+    spooled = TranscriptJournal.replay(journal.path)
+    assert [e["text"] for e in spooled] == ["resposta 0", "pergunta 0", "resposta 1", "pergunta 1", "resposta 2", "pergunta 2", "resposta 3", "pergunta 3"]
+    assert sorted(journal.chunk_keys) == ["journal/INT-1/chunk-00001.jsonl", "journal/INT-1/chunk-00002.jsonl"]
+    manifest_key = await journal.seal()
+    manifest = json.loads(client.body(manifest_key))
+    assert len(manifest["chunks"]) == 3
+    lines = b"".join(client.body(key) for key in manifest["chunks"]).decode().splitlines()
+    assert [json.loads(line)["speaker"] for line in lines] == ["user", "agent"] * 4
+    assert manifest["timestamp"] and not manifest["recovered"]
+    assert not os.path.exists(journal.path)
+
+def test_replay_skips_truncated_tail(tmp_path):
+    path = tmp_path / "INT-2.jsonl"
+    path.write_text('{"speaker": "user", "text": "oi"}\n{"speaker": "age', encoding="utf-8")
+    assert TranscriptJournal.replay(str(path)) == [{"speaker": "user", "text": "oi"}]
+
+async def test_spools_nobody_holds_are_sealed_by_recovery(tmp_path):
+    lines = [TranscriptJournal.serialize(datetime(2024, 3, 15, 9, 30, i), "user" if i % 2 else "agent", f"fala {i}") for i in range(5)]
+    (tmp_path / "INT-3.jsonl").write_text("\n".join(lines) + "\n", encoding="utf-8") # its writer died
+    (tmp_path / "INT-5.jsonl").write_text("", encoding="utf-8") # died before the first entry
+    client = FakeS3Client()
+    handler = S3Handler(client=client, bucket_name="b")
+    live = TranscriptJournal("INT-4", s3_handler=handler, directory=str(tmp_path)) # e.g. on another task sharing the volume
+    live.append(datetime(2024, 3, 15, 10, 0), "user", "ainda falando")
+    await live.flush()
+    await handler.upload_bytes("journal/INT-3/chunk-00001.jsonl", ("\n".join(lines[:2]) + "\n").encode(), compressed=True)
+    [(key, manifest)] = await TranscriptJournal.recover(handler, str(tmp_path), chunk_entries=2)
+    assert key == "journal/INT-3/manifest.json" and manifest["recovered"] and manifest["timestamp"] == "20240315_093000"
+    assert client.calls.count("put_object") == 4 # the chunk its writer uploaded is not uploaded again
+    _, entries = await TranscriptJournal.read(handler, key)
+    assert len(manifest["chunks"]) == 3 and [entry["text"] for entry in entries] == [f"fala {i}" for i in range(5)]
+    assert os.listdir(tmp_path) == ["INT-4.jsonl"]
+    assert await TranscriptJournal.recover(handler, str(tmp_path)) == []
+    assert await live.seal() == "journal/INT-4/manifest.json" and os.listdir(tmp_path) == []
+    # a spool sealed meanwhile resolves to its manifest
+    assert (await TranscriptJournal.seal_spool(handler, str(tmp_path / "INT-3.jsonl")))[0] == key
@@ -0,0 +1,26 @@
+from transcription_manager import TranscriptionManager, conversation_from_transcription
+
+async def test_renderings_are_incremental_and_cached():
+    manager = TranscriptionManager("INT-1")
+    assert await manager.get_conversation_only() == "No conversation available."
+    await manager.start_recording()
+    await manager.add_agent_message("Qual o nome da startup?")
+    await manager.add_user_message("TechNova", confidence=0.9)
+    first = await manager.get_full_transcription()
+    assert await manager.get_full_transcription() is first
+    assert first.endswith("USER (confidence: 0.90):\nTechNova\n")
+    await manager.add_agent_message("Obrigado!")
+    assert await manager.get_conversation_only() == "Entrevistador: Qual o nome da startup?\n\nEntrevistado: TechNova\n\nEntrevistador: Obrigado!"
+    assert (await manager.get_full_transcription()).startswith(first.split("Duration:")[0])
+    assert [(e.speaker, e.confidence) for e in manager.entries] == [("agent", None), ("user", 0.9), ("agent", None)]
+    await manager.clear()
+    assert len(manager) == 0 and await manager.get_full_transcription() == "No transcription available."
+
+async def test_conversation_is_recovered_from_the_stored_transcription():
+    manager = TranscriptionManager("INT-2")
+    await manager.start_recording()
+    await manager.add_agent_message("Olá!\nQual o nome da startup?")
+    await manager.add_user_message("TechNova", confidence=0.9)
+    await manager.add_agent_message("Obrigado!")
+    full = await manager.get_full_transcription()
+    assert conversation_from_transcription(full) == await manager.get_conversation_only()
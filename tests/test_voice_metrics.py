@@ -0,0 +1,54 @@
+import json
+from livekit.agents.metrics import EOUMetrics, LLMMetrics, STTMetrics, TTSMetrics
+from prometheus_client import REGISTRY
+from s3_handler import S3Handler
+from voice_metrics import SessionLatencyRecorder, set_completion_backlog, summarize
+from fakes import FakeS3Client
+
+def _llm(speech_id, ttft):
+    return LLMMetrics(label="google.LLM", request_id="r", timestamp=0, duration=1.0, ttft=ttft, cancelled=False, completion_tokens=1,
+                      prompt_tokens=1, prompt_cached_tokens=0, total_tokens=2, tokens_per_second=1.0, speech_id=speech_id)
+
+def _tts(speech_id, ttfb):
+    return TTSMetrics(label="elevenlabs.TTS", request_id="r", timestamp=0, ttfb=ttfb, duration=1.0, audio_duration=1.0,
+                      cancelled=False, characters_count=10, streamed=True, speech_id=speech_id)
+
+def _eou(speech_id, delay):
+    return EOUMetrics(timestamp=0, end_of_utterance_delay=delay, transcription_delay=0.1, on_user_turn_completed_delay=0.0, speech_id=speech_id)
+
+def _sample(name, model):
+    return REGISTRY.get_sample_value(name, {"model": model}) or 0
+
+def test_turn_latency_joins_stages_by_speech_id():
+    recorder = SessionLatencyRecorder("INT-1", llm_model="llm-test", stt_model="stt-test", tts_model="tts-test", eou_model="eou-test")
+    turns_before = _sample("agent_turn_latency_seconds_count", "llm-test")
+    recorder.collect(STTMetrics(label="openai.STT", request_id="r", timestamp=0, duration=0.4, audio_duration=2.0, streamed=False))
+    recorder.collect(_llm("greeting", 0.3))
+    recorder.collect(_tts("greeting", 0.2)) # no EOU: not a user turn
+    recorder.collect(_eou("s1", 0.5))
+    recorder.collect(_llm("s1", 0.3))
+    recorder.collect(_tts("s1", 0.2))
+    recorder.collect(_tts("s1", 0.9)) # later sentence of the same reply
+    assert recorder.samples["turn_latency"] == [1.0]
+    assert _sample("agent_turn_latency_seconds_count", "llm-test") == turns_before + 1
+    assert _sample("agent_stt_duration_seconds_sum", "stt-test") >= 0.4
+    profile = recorder.profile()
+    assert profile["stages"]["turn_latency"]["p95_ms"] == 1000.0
+    assert profile["stages"]["tts_ttfb"]["count"] == 3
+
+def test_session_and_backlog_gauges():
+    recorder = SessionLatencyRecorder("INT-2", llm_model="gauge-test", stt_model="s", tts_model="t", eou_model="e")
+    recorder.session_started()
+    assert _sample("agent_active_sessions", "gauge-test") == 1
+    recorder.session_ended()
+    assert _sample("agent_active_sessions", "gauge-test") == 0
+    set_completion_backlog(3, "gauge-test")
+    assert _sample("agent_completion_backlog", "gauge-test") == 3
+
+async def test_latency_profile_uploaded_as_json():
+    client = FakeS3Client()
+    handler = S3Handler(client=client, bucket_name="test-bucket")
+    profile = {"interview_id": "INT-3", "stages": {"llm_ttft": summarize([0.1, 0.2, 0.3])}}
+    key = await handler.upload_latency_profile("INT-3", profile)
+    assert key.startswith("latency/dt=") and "/INT-3_" in key
+    assert json.loads(client.body(key))["stages"]["llm_ttft"] == {"count": 3, "mean_ms": 200.0, "p50_ms": 200.0, "p90_ms": 300.0, "p95_ms": 300.0, "p99_ms": 300.0, "max_ms": 300.0}
@@ -0,0 +1,85 @@
+import asyncio
+import time
+import pytest
+from types import SimpleNamespace
+from prometheus_client import REGISTRY
+from livekit.agents import WorkerOptions
+try:
+    from livekit.agents.worker import AgentServer
+except ImportError: # livekit-agents < 1.8 has only Worker
+    AgentServer = None
+from worker_load import IDLE_PROCESSES_INITIAL, IDLE_PROCESSES_MAX, AdmissionPolicy, EventLoopLagProbe, ServerEnvOption, WorkerLoadMonitor
+
+GB = 1024 ** 3
+
+def test_session_cost_is_learned_above_the_idle_baseline():
+    policy = AdmissionPolicy(cpu_count=4, memory_limit=8 * GB)
+    for _ in range(50):
+        policy.observe(0, cpu_cores=0.2, rss_bytes=1 * GB)
+    for _ in range(100):
+        policy.observe(2, cpu_cores=1.8, rss_bytes=2 * GB)
+    assert abs(policy.session_cpu - 0.8) < 0.01
+    assert abs(policy.session_rss - 0.5 * GB) < 0.01 * GB
+
+def test_load_refuses_when_one_more_session_would_not_fit():
+    policy = AdmissionPolicy(cpu_count=4, memory_limit=8 * GB, threshold=0.75)
+    policy.session_cpu, policy.session_rss = 0.8, 0.5 * GB
+    assert policy.load(cpu_cores=2.0, rss_bytes=2 * GB)["load"] < 0.75 # 2.8 of 4 cores after the next session
+    refused = policy.load(cpu_cores=2.4, rss_bytes=2 * GB)
+    assert refused["load"] >= 0.75 and refused["load"] == refused["cpu"]
+    assert policy.load(cpu_cores=6.0, rss_bytes=9 * GB)["load"] == 1.0
+
+def test_event_loop_lag_and_backlog_alone_can_refuse():
+    policy = AdmissionPolicy(cpu_count=4, memory_limit=8 * GB, threshold=0.75, lag_limit_s=0.2, backlog_limit=10)
+    assert policy.load(0.0, 0, lag_s=0.2)["load"] == pytest.approx(0.75)
+    assert policy.load(0.0, 0, backlog=5)["completion_backlog"] == 0.375
+
+def test_idle_processes_follow_arrival_rate_and_prewarm_time():
+    policy = AdmissionPolicy(cpu_count=4, memory_limit=8 * GB)
+    now = 10_000.0
+    assert policy.idle_processes(None, now) == IDLE_PROCESSES_INITIAL
+    assert policy.idle_processes(5.0, now) == 1 # no arrivals: just the process the next interview takes
+    for i in range(60): # one interview every 10 s
+        policy.record_arrival(now - i * 10)
+    assert policy.idle_processes(5.0, now) == 2
+    assert policy.idle_processes(60.0, now) == IDLE_PROCESSES_MAX
+
+def _running_server(active_jobs):
+    """A real AgentServer in the state run() leaves it in, with jobs but no processes"""
+    server = AgentServer.from_server_options(WorkerOptions(entrypoint_fnc=None, num_idle_processes=ServerEnvOption(dev_default=0, prod_default=IDLE_PROCESSES_INITIAL)))
+    server._closed = False
+    server._proc_pool = SimpleNamespace(processes=[SimpleNamespace(running_job=job) for job in active_jobs])
+    return server
+
+@pytest.mark.skipif(AgentServer is None, reason="needs livekit-agents with AgentServer")
+def test_monitor_counts_each_job_once_and_resizes_the_pool_of_a_running_server():
+    monitor = WorkerLoadMonitor(policy=AdmissionPolicy(cpu_count=64, memory_limit=1024 * GB))
+    monitor._shared_read_at = time.time() # skip reading the multiprocess directory
+    monitor._shared["prewarm_s"] = 30.0
+    server = _running_server([SimpleNamespace(job=SimpleNamespace(id="job-1"))])
+    load = monitor(server)
+    monitor(server)
+    assert 0 < load < 0.75
+    assert len(monitor.policy._arrivals) == 1
+    # what the server's load task hands the process pool on its next tick
+    assert ServerEnvOption.getvalue(server._num_idle_processes, devmode=False) == 1
+    assert ServerEnvOption.getvalue(server._num_idle_processes, devmode=True) == 0
+
+def test_monitor_stops_resizing_a_worker_it_does_not_know():
+    monitor = WorkerLoadMonitor(policy=AdmissionPolicy(cpu_count=64, memory_limit=1024 * GB))
+    monitor._shared_read_at = time.time()
+    monitor._shared["prewarm_s"] = 30.0
+    worker = SimpleNamespace(active_jobs=[])
+    assert 0 < monitor(worker) < 0.75
+    assert not monitor._resizable and vars(worker) == {"active_jobs": []}
+
+async def test_lag_probe_reports_a_blocked_loop():
+    probe = EventLoopLagProbe(interval=0.01)
+    probe.start()
+    await asyncio.sleep(0.02)
+    time.sleep(0.1) # a blocking call on the event loop
+    await asyncio.sleep(0.02)
+    assert probe.lag_s >= 0.05
+    assert REGISTRY.get_sample_value("agent_event_loop_lag_seconds") >= 0.05
+    probe.stop()
+    assert REGISTRY.get_sample_value("agent_event_loop_lag_seconds") == 0